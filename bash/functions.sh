@@ -87,36 +87,6 @@ arg_parser()
     checkNodeConnection ${shelfmanager}
 }
 
-getGitHashFW()
-{
-    local gh_inv
-    local gh
-
-    # Long githash (inverted)
-    #gh_inv=$(ipmitool -I lan -H $shelfmanager -t $ipmb -b 0 -A NONE raw 0x34 0x04 0xd0 0x14  2> /dev/null)
-    # Short githash (inverted)
-    gh_inv=$(ipmitool -I lan -H $shelfmanager -t $ipmb -b 0 -A NONE raw 0x34 0x04 0xe0 0x04  2> /dev/null)
-
-    if [ "$?" -ne 0 ]; then
-        kill -s TERM ${top_pid}
-    fi
-
-    # Invert the string
-    for c in ${gh_inv} ; do gh=${c}${gh} ; done
-
-    # Return the short hash (7 bytes)
-    echo ${gh} | cut -c 1-7
-}
-
-getGitHashMcs()
-{
-    local filename=$(basename $mcs_file_name)
-    local gh=$(echo $filename | sed  -r 's/.+-+(.+).mcs.*/\1/')
-
-    # Return the short hash (7 bytes)
-    echo ${gh} | cut -c 1-7
-}
-
 getCrateId()
 {
     local crate_id_str
@@ -163,43 +133,21 @@ getFpgaIpAddr()
     printf "\n"
 }
 
-# Check if firmware in FPGA matches MCS file
-# Returns 0 if they match, or 1 otherwise.
+# Check if firmware in FPGA matches MCS file, and load the MCS file
+# if not. The FPGA githash is read directly from the FPGA, via CPSW in
+# the CPU node, or via IPMI if it can not be reached. The githashes are
+# cached (see scripts/check-fw.py).
+# Exit with '1' if the MCS file can not be loaded.
 checkFW()
 {
     # Check if the firmware checking is disabled
     if [ -z ${no_check_fw+x} ]; then
+        PYTHONPATH=${top_dir}/python/:${PYTHONPATH} \
+            python3 ${top_dir}/scripts/check-fw.py --cpu ${cpu_name} ${shelfmanager}:${slot}
 
-        printf "Looking for mcs file...                           "
-        mcs_file=$(find ${fw_top_dir} -maxdepth 1 -name *mcs*)
-        if [ ! -f "${mcs_file}" ]; then
-            printf_failed "MCS file not found!."
-            printf "\n"
+        if [ "$?" -ne 0 ]; then
             exit 1
         fi
-
-        mcs_file_name=$(basename ${mcs_file})
-        printf_ok "Mcs file found: ${mcs_file_name}"
-        printf "\n"
-
-        printf "Reading FW Git Hash via IPMI...                   "
-        fw_gh=$(getGitHashFW)
-        printf_ok "Firmware githash: '${fw_gh}'."
-        printf "\n"
-
-        printf "Reading MCS file Git Hash...                      "
-        mcs_gh=$(getGitHashMcs)
-        printf_ok "MCS file githash: '${mcs_gh}'. "
-
-        if [ "${fw_gh}" == "${mcs_gh}" ]; then
-            printf_ok "They match!."
-            printf "\n"
-        else
-            printf_failed "They don't match."
-            printf "\n"
-            echo "Loading image..."
-            ${ProgramFPGA} -s ${shelfmanager} -n ${slot} -c ${cpu_name} -m ${mcs_file}
-        fi
     else
         echo "Check firmware disabled."
     fi
@@ -8,7 +8,12 @@
 
 // Firmware information strings
 String FwName("RTM Tester");
-String FwVer("v1.0.0");
+String FwVer("v1.5.0");
+
+// Print debug information on the serial port for every command.
+// At 9600 bauds, the debug messages take several milliseconds per command,
+// much longer than the command itself, so they are disabled by default.
+bool debug = false;
 
 // IO pins definition
 int numOutputs = 32;
@@ -20,6 +25,90 @@ int outPins[] = { 17, 18, 19, 20, 21, 22, 23, 24, \
 int numInputs = 8;
 int inPins[] = { 3, 5, 6, 8, 9, 14, 15, 16 };
 
+// Last value written to the outputs
+uint32_t outputsValue = 0;
+
+#if defined(__AVR_ATmega2560__)
+// Direct port access.
+// On the Arduino Mega 2560, the outputs are written, and the inputs read,
+// through the port registers of their pins instead of digitalWrite() and
+// digitalRead(), which take several microseconds per pin. The output
+// channels are mapped to these port bits (see outPins):
+//   channel  0     : pin  17     PH0
+//   channels 1-4   : pins 18-21  PD3-PD0
+//   channels 5-12  : pins 22-29  PA0-PA7
+//   channels 13-20 : pins 30-37  PC7-PC0
+//   channel  21    : pin  38     PD7
+//   channels 22-24 : pins 39-41  PG2-PG0
+//   channels 25-31 : pins 42-48  PL7-PL1
+// and the input channels to these (see inPins):
+//   channel 0 : pin 3  PE5    channel 4 : pin 9  PH6
+//   channel 1 : pin 5  PE3    channel 5 : pin 14 PJ1
+//   channel 2 : pin 6  PH3    channel 6 : pin 15 PJ0
+//   channel 3 : pin 8  PH5    channel 7 : pin 16 PH1
+// The other bits of ports D, G, H and L belong to other pins (for example,
+// the input channels on port H, or the SD card chip select of the Ethernet
+// shield on PG5), so they are kept as they are.
+const uint8_t outMaskD = 0x8F;
+const uint8_t outMaskG = 0x07;
+const uint8_t outMaskH = 0x01;
+const uint8_t outMaskL = 0xFE;
+
+// Reverse the bit order of a byte
+uint8_t reverseBits(uint8_t b)
+{
+    b = ((b & 0xF0) >> 4) | ((b & 0x0F) << 4);
+    b = ((b & 0xCC) >> 2) | ((b & 0x33) << 2);
+    b = ((b & 0xAA) >> 1) | ((b & 0x55) << 1);
+    return b;
+}
+
+// Write all the output channels.
+// The port values are computed first, and then written back to back, with
+// the interrupts disabled, so all the channels change within a few CPU cycles
+// (the skew is measured by the 'u' command).
+void writeOutputPorts(uint32_t v)
+{
+    uint8_t a = (uint8_t)(v >> 5);
+    uint8_t c = reverseBits((uint8_t)(v >> 13));
+    uint8_t d = (reverseBits((uint8_t)(v >> 1) & 0x0F) >> 4) | ((uint8_t)(v >> 14) & 0x80);
+    uint8_t g = reverseBits((uint8_t)(v >> 22) & 0x07) >> 5;
+    uint8_t h = (uint8_t)v & 0x01;
+    uint8_t l = reverseBits((uint8_t)(v >> 25) & 0x7F);
+
+    uint8_t sreg = SREG;
+    cli();
+    PORTA = a;
+    PORTC = c;
+    PORTD = (PORTD & ~outMaskD) | d;
+    PORTG = (PORTG & ~outMaskG) | g;
+    PORTH = (PORTH & ~outMaskH) | h;
+    PORTL = (PORTL & ~outMaskL) | l;
+    SREG = sreg;
+}
+
+// Read all the input channels, as a byte.
+// The ports are sampled back to back, with the interrupts disabled.
+uint8_t readInputPorts()
+{
+    uint8_t sreg = SREG;
+    cli();
+    uint8_t e = PINE;
+    uint8_t h = PINH;
+    uint8_t j = PINJ;
+    SREG = sreg;
+
+    return ((e >> 5) & 0x01)        |
+           (((e >> 3) & 0x01) << 1) |
+           (((h >> 3) & 0x01) << 2) |
+           (((h >> 5) & 0x01) << 3) |
+           (((h >> 6) & 0x01) << 4) |
+           (((j >> 1) & 0x01) << 5) |
+           ((j & 0x01) << 6)        |
+           (((h >> 1) & 0x01) << 7);
+}
+#endif
+
 // TCP Server configuration (listening on port 5000)
 byte mac[] = {
     0x2C, 0xF7, 0xF1, 0x08, 0x1B, 0x0F
@@ -48,40 +137,88 @@ String FwInfo(
              ); // The IP address will be address inside setup(), after the Ethernet shield initialization
 
 // Command string maximum length.
-// Worse case scenario is command to write all outputs '=(2^numInputs-1)\n'
+// Worse case scenario is command to write all outputs '=(2^numOutputs-1)\n'
 const int maxCmdSize = 20;
 
-// Function to read the inputs channels
-String readInputs()
+// Function to read the inputs channels, as a byte
+uint8_t readInputsByte()
 {
     uint8_t v = 0;
 
-    Serial.print("Reading inputs...\n");
+    if (debug)
+        Serial.print("Reading inputs...\n");
+
+#if defined(__AVR_ATmega2560__)
+    v = readInputPorts();
+#else
     for (int i = 0; i < numInputs; i++)
     {
         if (digitalRead(inPins[i]) == HIGH)
             bitSet(v, i);
     }
+#endif
 
-    Serial.print("Done!\n");
-    Serial.print("Value read was: 0x");
-    Serial.print(v, HEX);
-    Serial.print("\n");
+    if (debug)
+    {
+        Serial.print("Done!\n");
+        Serial.print("Value read was: 0x");
+        Serial.print(v, HEX);
+        Serial.print("\n");
+    }
 
-    return String(v);
+    return v;
+}
+
+// Function to read the inputs channels, as a string
+String readInputs()
+{
+    return String(readInputsByte());
 }
 
 // Function to write the output channels
 void writeOutputs(uint32_t v)
 {
-    Serial.print("Writing 0x");
-    Serial.print(v, HEX);
-    Serial.print(" to outputs...\n");
+    if (debug)
+    {
+        Serial.print("Writing 0x");
+        Serial.print(v, HEX);
+        Serial.print(" to outputs...\n");
+    }
 
+#if defined(__AVR_ATmega2560__)
+    writeOutputPorts(v);
+#else
     for (int i = 0; i < numOutputs; i++)
         digitalWrite(outPins[i], bitRead(v, i));
+#endif
+
+    outputsValue = v;
+
+    if (debug)
+        Serial.print("Done!\n");
+}
+
+// Measure the time taken to write all the outputs, and to read all the
+// inputs, averaged over 1000 calls. Return both times in nanoseconds (the
+// total time of the 1000 calls, in microseconds), separated by a comma.
+// The outputs are written with their current value, so they do not change.
+// The output write time bounds the skew between the output channels.
+String measureUpdateTime()
+{
+    const int runs = 1000;
+    uint32_t v = outputsValue;
 
-    Serial.print("Done!\n");
+    uint32_t t0 = micros();
+    for (int i = 0; i < runs; i++)
+        writeOutputs(v);
+    uint32_t tWrite = micros() - t0;
+
+    t0 = micros();
+    for (int i = 0; i < runs; i++)
+        readInputsByte();
+    uint32_t tRead = micros() - t0;
+
+    return String(tWrite) + "," + String(tRead);
 }
 void setup() {
     // initialize the Ethernet device
@@ -126,141 +263,458 @@ void sendString(EthernetClient c, String s)
     c.write(s.c_str());
 }
 
-void loop()
+// Buffer holding the command being received.
+// Commands are terminated by '\n', and several commands can arrive back to
+// back on the same connection (the host keeps several commands in flight),
+// so the bytes are accumulated here until the terminator arrives.
+char cmdBuf[maxCmdSize];
+int  cmdLen = 0;
+
+// Binary protocol.
+// Frames start with a byte with the most significant bit set (the opcode),
+// so they can not be confused with the text commands:
+// - Write outputs (0x81), followed by the output word (4 bytes, little endian).
+// - Read inputs (0x82), no argument.
+// - Write outputs and read inputs (0x83), followed by the output word.
+// - Sequencer load (0x84), followed by the first step and the number of
+//   vectors (2 bytes each, little endian), and then the vectors (4 bytes
+//   each, little endian).
+// - Sequencer run (0x85), followed by the number of steps (2 bytes) and the
+//   step period in microseconds (4 bytes).
+// - Sequencer fetch (0x86), followed by the first step and the number of
+//   steps (2 bytes each).
+// - Timed write outputs (0x87), followed by the output word, and timed read
+//   inputs (0x88), no argument (binary protocol version 2).
+// All the replies start with 2 bytes: the replay code (0 on success, 1 for
+// unknown opcodes or invalid arguments), and the value read from the inputs
+// (0 if not read). The replay of the fetch frames is followed by the inputs
+// recorded on each step (0 if invalid), and its code is 2 if the last
+// playback overran any of its steps. The replay of the timed frames is
+// followed by two times in microseconds (2 bytes each, little endian), from
+// the reception of the frame: the time at which the outputs were written, or
+// the inputs read, and the time at which the replay is sent. With them the
+// host can place the write or the read in its own time base, from the round
+// trip of the frame.
+const int     binaryVersion = 2;
+const uint8_t opWrite       = 0x81;
+const uint8_t opRead        = 0x82;
+const uint8_t opWriteRead   = 0x83;
+const uint8_t opSeqLoad     = 0x84;
+const uint8_t opSeqRun      = 0x85;
+const uint8_t opSeqFetch    = 0x86;
+const uint8_t opWriteTimed  = 0x87;
+const uint8_t opReadTimed   = 0x88;
+const uint8_t seqOverrun    = 2;
+
+// Sequencer.
+// The vectors loaded in the table are played autonomously, one per step:
+// the outputs are written at the start of each step, and the inputs are
+// recorded 'seqSampleLead' microseconds before its end. The steps are timed
+// with micros(), in a busy loop, so no other command is processed during the
+// playback (they wait in the Ethernet controller buffer). The table and the
+// capture buffer take 2.5 KB of the 8 KB of RAM of the Arduino Mega.
+// A step overruns when its outputs are not written before its inputs must be
+// recorded, or its inputs are not recorded before the next step starts (for
+// example, with the digitalWrite() loop of the boards other than the Mega, or
+// with the debug messages enabled). The playback goes on, but the overrun is
+// reported in the replay of the fetch frames, as the capture can not be
+// trusted.
+const uint16_t seqCapacity   = 512;
+const uint32_t seqMinPeriod  = 200;
+const uint32_t seqSampleLead = 50;
+uint32_t seqTable[seqCapacity];
+uint8_t  seqCapture[seqCapacity];
+bool     seqOverrunFlag = false;
+
+// Buffer holding the binary frame being received, and its expected size
+uint8_t frameBuf[7];
+int     frameLen  = 0;
+int     frameSize = 0;
+
+// Sequencer load frame being received: its vectors are stored directly in the
+// table as they arrive. Frames out of the table are received, but dropped.
+uint16_t loadOffset = 0;
+uint32_t loadSize   = 0;
+uint32_t loadBytes  = 0;
+bool     loadValid  = false;
+
+// Return the size of a binary frame, from its opcode (the vectors of the load
+// frames are not included)
+int binaryFrameSize(uint8_t op)
 {
-    EthernetClient client = server.available();
+    if ((op == opWrite) || (op == opWriteRead) || (op == opSeqLoad) || (op == opSeqFetch) || (op == opWriteTimed))
+        return 5;
+
+    if (op == opSeqRun)
+        return 7;
+
+    return 1;
+}
+
+// Return the 16-bit and 32-bit little endian arguments of the binary frame
+// starting at byte 'i' of 'frameBuf'
+uint16_t frameWord(int i)
+{
+    return (uint16_t)frameBuf[i] | ((uint16_t)frameBuf[i+1] << 8);
+}
+
+uint32_t frameLong(int i)
+{
+    return (uint32_t)frameWord(i) | ((uint32_t)frameWord(i+2) << 16);
+}
 
-    // wait for a command from the client
-    if (client)
+// Play the first 'count' steps of the sequencer table, with a 'period' in
+// microseconds, starting at time 't0' (as returned by micros())
+void playSequence(uint32_t t0, uint16_t count, uint32_t period)
+{
+    seqOverrunFlag = false;
+
+    for (uint16_t i = 0; i < count; i++)
     {
-        // Replay:
-        // The replay structure is:
-        // [code]   [argument] [terminator]
-        // [1 char]            [1 char]
-        //
-        // For invalid commands, the code will be '1' with empty argument. Otherwise it will be '0'.
-        // For valid commands:
-        // - For a Get inputs command the argument will be the value read from the digital pins (0-255 in ASCII).
-        // - For a Set outputs command the argument will be empty.
-        // - For a Get Fw info command the argument will be the Fw info string.
-        //
-        // The terminator will be '@'.
-        String r       = "";    // String to hold the replay
-        char   rCode   = '1';   // Replay code
-        String rArg;            // Replay argument
-        bool   rUseArg = false; // Does this replay contains an argument?
+        uint32_t sampleTime = (uint32_t)(i + 1) * period - seqSampleLead;
 
+        while ((uint32_t)(micros() - t0) < (uint32_t)i * period)
+            ;
+        writeOutputs(seqTable[i]);
 
-        // Process the command from the client:
+        if ((uint32_t)(micros() - t0) > sampleTime)
+            seqOverrunFlag = true;
 
-        // Read how many bytes where sent
-        int n = client.available();
+        while ((uint32_t)(micros() - t0) < sampleTime)
+            ;
+        seqCapture[i] = readInputsByte();
+
+        if ((uint32_t)(micros() - t0) > (uint32_t)(i + 1) * period)
+            seqOverrunFlag = true;
+    }
+
+    // Wait for the end of the last step
+    while ((uint32_t)(micros() - t0) < (uint32_t)count * period)
+        ;
+}
+
+// Return the time from 't0' to 't1' (as returned by micros()), saturated to
+// 16 bits
+uint16_t elapsed16(uint32_t t0, uint32_t t1)
+{
+    uint32_t d = t1 - t0;
+
+    return (d > 0xffff) ? 0xffff : (uint16_t)d;
+}
 
-        // Valid commands have length between 2 and maxCmdSize
-        if( (n < 2) || (n > maxCmdSize))
+// Send the replay of a timed frame received at time 'tRx', whose outputs
+// were written, or inputs read, at time 'tAction' (as returned by micros())
+void sendTimedReplay(EthernetClient c, uint8_t *r, uint32_t tRx, uint32_t tAction)
+{
+    uint16_t action = elapsed16(tRx, tAction);
+    uint16_t replay = elapsed16(tRx, micros());
+    uint8_t  t[6]   = { r[0], r[1],
+                        (uint8_t)action, (uint8_t)(action >> 8),
+                        (uint8_t)replay, (uint8_t)(replay >> 8) };
+
+    c.write(t, 6);
+}
+
+// Process the binary frame hold in 'frameBuf', and send the replay
+void processFrame(EthernetClient c)
+{
+    uint32_t tRx  = micros();
+    uint8_t  r[2] = { 0, 0 };
+    uint8_t  op   = frameBuf[0];
+
+    if (op == opWriteTimed)
+    {
+        writeOutputs(frameLong(1));
+        sendTimedReplay(c, r, tRx, micros());
+        return;
+    }
+
+    if (op == opReadTimed)
+    {
+        uint32_t tAction = micros();
+        r[1] = readInputsByte();
+        sendTimedReplay(c, r, tRx, tAction);
+        return;
+    }
+
+    if ((op == opWrite) || (op == opWriteRead))
+        writeOutputs(frameLong(1));
+
+    if ((op == opRead) || (op == opWriteRead))
+        r[1] = readInputsByte();
+    else if (op == opSeqLoad)
+        r[0] = loadValid ? 0 : 1;
+    else if (op == opSeqRun)
+    {
+        uint16_t count  = frameWord(1);
+        uint32_t period = frameLong(3);
+
+        if ((count <= seqCapacity) && (period >= seqMinPeriod))
         {
-            Serial.print("Invalid command length. Omitting\n");
+            // The playback starts before the replay is sent, so the host
+            // knows it started within the round trip of the frame
+            uint32_t t0 = micros();
+            c.write(r, 2);
+            playSequence(t0, count, period);
+            return;
+        }
 
-            // client.flush() doesn't clear the buffer,
-            // So, let's clear the buffer manually.
-            while (client.available())
-                client.read();
+        r[0] = 1;
+    }
+    else if (op == opSeqFetch)
+    {
+        uint16_t offset = frameWord(1);
+        uint16_t count  = frameWord(3);
+
+        // The replay has a fixed size, even if the arguments are invalid
+        if ((uint32_t)offset + count <= seqCapacity)
+        {
+            if (seqOverrunFlag)
+                r[0] = seqOverrun;
+            c.write(r, 2);
+            c.write(seqCapture + offset, count);
+            return;
         }
-        else
+
+        r[0] = 1;
+        c.write(r, 2);
+        for (uint16_t i = 0; i < count; i++)
+            c.write((uint8_t)0);
+        return;
+    }
+    else if (op != opWrite)
+        r[0] = 1;
+
+    c.write(r, 2);
+}
+
+// Start receiving the vectors of the sequencer load frame hold in 'frameBuf'.
+// Return false if it has none.
+bool startLoad()
+{
+    loadOffset = frameWord(1);
+    loadSize   = 4 * (uint32_t)frameWord(3);
+    loadBytes  = 0;
+    loadValid  = ((uint32_t)loadOffset + frameWord(3) <= seqCapacity);
+
+    return (loadSize != 0);
+}
+
+// Process the command hold in 'cmdBuf', of length 'n' (including the
+// terminator), and return the replay string.
+String processCommand(int n)
+{
+    // Replay:
+    // The replay structure is:
+    // [code]   [argument] [terminator]
+    // [1 char]            [1 char]
+    //
+    // For invalid commands, the code will be '1' with empty argument. Otherwise it will be '0'.
+    // For valid commands:
+    // - For a Get inputs command the argument will be the value read from the digital pins (0-255 in ASCII).
+    // - For a Set outputs command the argument will be empty.
+    // - For a Get Fw info command the argument will be the Fw info string.
+    //
+    // The terminator will be '@'.
+    String r       = "";    // String to hold the replay
+    char   rCode   = '1';   // Replay code
+    String rArg;            // Replay argument
+    bool   rUseArg = false; // Does this replay contains an argument?
+
+    // Valid commands have length between 2 and maxCmdSize
+    if( (n < 2) || (n > maxCmdSize))
+    {
+        if (debug)
+            Serial.print("Invalid command length. Omitting\n");
+    }
+    else
+    {
+        // Print debug information
+        if (debug)
         {
-            // Print debug information
             Serial.print(n);
             Serial.print(" bytes received\n");
+        }
 
-            // Extract the command and argument
-            // The command structure is:
-            // [type] . [argument]  [terminator]
-            // [1 char] [0-3 chars] [1 char]
-            //
-            // Type of commands:
-            // - Get inputs commands (cmd = '?'), no argument.
-            // - Set outputs commands (cmd - '='), argument must be a numeric value between 0-255.
-            // - Get FW info (cmd = 'i'), no argument.
-            //
-            // The terminator is '\n'.
-            char     cmd       = client.read(); // Command
-            String   cArg      = "";            // String to hold the command argument
-            bool     cArgValid = true;          // Is the command argument valid?
-            uint32_t cArgVal;                   // Numeric Argument value.
-
-            // Read the argument.
-            for (int i = 0; i < n-2; i++)
-            {
-                // Write each argument char in the argument string
-                char c = static_cast<char>(client.read());
-                cArg += c;
-
-                // The argument can be only numeric, so it must only contain digits
-                cArgValid &= isDigit(c);
-            }
+        // Extract the command and argument
+        // The command structure is:
+        // [type] . [argument]  [terminator]
+        // [1 char] [0-10 chars] [1 char]
+        //
+        // Type of commands:
+        // - Get inputs commands (cmd = '?'), no argument.
+        // - Set outputs commands (cmd - '='), argument must be a numeric value between 0-(2^32-1).
+        // - Get FW info (cmd = 'i'), no argument.
+        // - Get binary protocol version (cmd = 'b'), no argument.
+        // - Get the number of steps of the sequencer (cmd = 's'), no argument.
+        // - Measure the output write and input read times (cmd = 'u'), no argument.
+        //
+        // The terminator is '\n'.
+        char     cmd       = cmdBuf[0]; // Command
+        String   cArg      = "";        // String to hold the command argument
+        bool     cArgValid = true;      // Is the command argument valid?
+        uint32_t cArgVal;               // Numeric Argument value.
+
+        // Read the argument.
+        for (int i = 1; i < n-1; i++)
+        {
+            // Write each argument char in the argument string
+            char c = cmdBuf[i];
+            cArg += c;
 
-            // Discard the terminator character
-            client.read();
+            // The argument can be only numeric, so it must only contain digits
+            cArgValid &= isDigit(c);
+        }
 
-            // If the command was Get and it contained an argument, it is invalid
-            if ((cmd == '?' || cmd == 'i') && (n != 2))
-                cArgValid = false;
+        // If the command was Get and it contained an argument, it is invalid
+        if ((cmd == '?' || cmd == 'i' || cmd == 'b' || cmd == 's' || cmd == 'u') && (n != 2))
+            cArgValid = false;
 
-            // Verify if the argument value is in the allowed range
-            if (cArgValid)
-                cArgVal = cArg.toInt();
-                // As cArgVal is unsigned and its size is 32-bit, bigger numbers than 2^32-1 will be truncated,
-                // so there is no way for testing if the value in in the range [0:2^32-1]
+        // Verify if the argument value is in the allowed range
+        // Note: String::toInt() is signed, and saturates at 2^31-1, so the
+        // argument is converted as unsigned to be able to set all 32 outputs.
+        if (cArgValid)
+            cArgVal = strtoul(cArg.c_str(), NULL, 10);
+            // As cArgVal is unsigned and its size is 32-bit, bigger numbers than 2^32-1 will be truncated,
+            // so there is no way for testing if the value in in the range [0:2^32-1]
 
-            // Print debug information
+        // Print debug information
+        if (debug)
+        {
             Serial.print("Command = '");
             Serial.print(cmd);
             Serial.print("'\n");
             Serial.print("Argument = '");
             Serial.print(cArg);
             Serial.print("'\n");
+        }
 
-            // Process only command with valid argument
-            if (!cArgValid)
-            {
+        // Process only command with valid argument
+        if (!cArgValid)
+        {
+            if (debug)
                 Serial.print("Command with invalid argument\n");
+        }
+        else
+        {
+            switch(cmd)
+            {
+                case 'i':
+                    rArg = FwInfo;
+                    rUseArg = true;
+                    rCode = '0';
+                    break;
+                case '?':
+                    rArg = readInputs();
+                    rUseArg = true;
+                    rCode = '0';
+                    break;
+                case '=':
+                    writeOutputs(cArgVal);
+                    rCode = '0';
+                    break;
+                case 'b':
+                    rArg = String(binaryVersion);
+                    rUseArg = true;
+                    rCode = '0';
+                    break;
+                case 's':
+                    rArg = String(seqCapacity);
+                    rUseArg = true;
+                    rCode = '0';
+                    break;
+                case 'u':
+                    rArg = measureUpdateTime();
+                    rUseArg = true;
+                    rCode = '0';
+                    break;
+                default:
+                    if (debug)
+                        Serial.print("Unknown command\n");
+                    break;
+            }
+        }
+    }
+
+    // Build the replay
+    r += rCode;
+    if (rUseArg)
+    r += rArg;
+    r += '@';
+
+    return r;
+}
+
+void loop()
+{
+    EthernetClient client = server.available();
+
+    if (!client)
+        return;
+
+    // Process all the commands received from the client, in order.
+    // Each command gets exactly one replay, so the client can match
+    // replies to commands in the order it sent them.
+    while (client.available())
+    {
+        char c = static_cast<char>(client.read());
+
+        // Binary frames: an opcode received at the start of a command,
+        // followed by its fixed size argument (and, for the sequencer load
+        // frames, by the vectors)
+        if ((frameLen == 0) && (cmdLen == 0) && (c & 0x80))
+            frameSize = binaryFrameSize(static_cast<uint8_t>(c));
+
+        if (frameSize)
+        {
+            if (frameLen < frameSize)
+            {
+                frameBuf[frameLen++] = static_cast<uint8_t>(c);
+                if (frameLen < frameSize)
+                    continue;
+
+                if ((frameBuf[0] == opSeqLoad) && startLoad())
+                    continue;
             }
             else
             {
-                switch(cmd)
-                {
-                    case 'i':
-                        rArg = FwInfo;
-                        rUseArg = true;
-                        rCode = '0';
-                        break;
-                    case '?':
-                        rArg = readInputs();
-                        rUseArg = true;
-                        rCode = '0';
-                        break;
-                    case '=':
-                        writeOutputs(cArgVal);
-                        rCode = '0';
-                        break;
-                    default:
-                        Serial.print("Unknown command\n");
-                        break;
-                }
+                // Vectors of a load frame. The AVR is little endian, as the
+                // frame, so the bytes are copied as they are.
+                if (loadValid)
+                    reinterpret_cast<uint8_t *>(seqTable + loadOffset)[loadBytes] = static_cast<uint8_t>(c);
+
+                if (++loadBytes < loadSize)
+                    continue;
             }
+
+            processFrame(client);
+            frameLen = 0;
+            frameSize = 0;
+            continue;
         }
 
-        // Replay to client
-        r += rCode;
-        if (rUseArg)
-        r += rArg;
-        r += '@';
+        // Commands longer than maxCmdSize are not stored, but their length
+        // is still counted so they are rejected when the terminator arrives.
+        if (cmdLen < maxCmdSize)
+            cmdBuf[cmdLen] = c;
+        cmdLen++;
+
+        // Wait for the rest of the command
+        if (c != '\n')
+            continue;
 
+        String r = processCommand(cmdLen);
+        cmdLen = 0;
+
+        // Replay to client
         sendString(client, r);
 
         // Print debug information
-        Serial.print("Replay sent to client:\n");
-        Serial.print(r);
-        Serial.println("\n");
+        if (debug)
+        {
+            Serial.print("Replay sent to client:\n");
+            Serial.print(r);
+            Serial.println("\n");
+        }
     }
 }
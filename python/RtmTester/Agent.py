@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+from RtmTester.Orchestrator import Orchestrator
+from RtmTester.RtmPool import RtmPool
+
+
+class RtmAgent():
+    """
+    Resident test application, running in the CPU node.
+
+    It accepts test jobs, each one with the same arguments as test-rtm.py
+    (FPGA IP address, slot number, test options, etc.), from the standard
+    input or from a local socket, and runs them in the same process. So,
+    the ssh connection, the CPSW environment setup, the interpreter start
+    up and the module imports are paid only once, and the CPSW root of each
+    FPGA is kept loaded between jobs: a board tested again starts testing
+    right away.
+
+    Jobs are sent as JSON lines, {"id": <id>, "args": [<arguments>]}, and
+    the agent replies with the output of each job, {"id": <id>, "output":
+    <text>}, and finally with its exit code, {"id": <id>, "exit": <code>}.
+    Several jobs can run at the same time; the jobs on the same FPGA run
+    one after the other. Up to 'pool_size' FPGA connections are kept, and
+    those idle for more than 'idle_timeout' seconds are closed (see
+    RtmPool). The manual test procedure is not available, as it needs a
+    terminal.
+    """
+
+    def __init__(self, log=None, pool_size=8, idle_timeout=600.0):
+        """
+        Initialize the object. Messages not belonging to any job are
+        written to 'log' (by default, the standard error).
+        """
+
+        self.log = log if log is not None else sys.stderr
+
+        # Loaded RTM interfaces
+        self.pool = RtmPool(max_size=pool_size, idle_timeout=idle_timeout)
+
+        # Output stream of the job run by each thread
+        self.local = threading.local()
+
+    def preload(self):
+        """
+        Import the test application modules, and CPSW if available, so the
+        first job does not wait for them.
+        """
+
+        import RtmTester.Session  # noqa: F401
+
+        try:
+            import RtmTester.CpswBackend  # noqa: F401
+        except ImportError:
+            pass
+
+    def serve_stream(self, rfile, wfile):
+        """
+        Run the jobs read from 'rfile', writing the replies to 'wfile',
+        until the end of 'rfile'. Wait for all the jobs to finish before
+        returning.
+        """
+
+        send_lock = threading.Lock()
+
+        def send(msg):
+            with send_lock:
+                try:
+                    wfile.write((json.dumps(msg) + "\n").encode())
+                    wfile.flush()
+                except (OSError, ValueError):
+                    # The client is gone, the job output is discarded
+                    pass
+
+        threads = []
+        for line in rfile:
+            try:
+                job = json.loads(line)
+                job_id = job["id"]
+                argv = [str(a) for a in job["args"]]
+            except (ValueError, KeyError, TypeError):
+                self.log.write(f"Invalid job request: {line!r}\n")
+                self.log.flush()
+                continue
+
+            t = threading.Thread(
+                target=self.run_job, args=(job_id, argv, send), daemon=True)
+            t.start()
+            threads.append(t)
+
+        for t in threads:
+            t.join()
+
+    def serve_socket(self, socket_path):
+        """
+        Accept connections on a local socket, and run the jobs sent on each
+        one of them, until interrupted.
+        """
+
+        # A socket file left by an agent which is not running any more is
+        # removed
+        if os.path.exists(socket_path):
+            try:
+                AgentClient.connect(socket_path).close()
+            except OSError:
+                os.remove(socket_path)
+            else:
+                raise RuntimeError(
+                    f"An agent is already running on {socket_path}")
+
+        agent = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                agent.serve_stream(self.rfile, self.wfile)
+
+        class Server(socketserver.ThreadingUnixStreamServer):
+            def service_actions(self):
+                # Close the idle FPGA connections, even if no jobs arrive
+                agent.pool.sweep()
+
+        with Server(socket_path, Handler) as server:
+            server.daemon_threads = True
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(socket_path)
+
+    def install(self):
+        """
+        Replace sys.stdout and sys.stderr, so what is printed by each job
+        goes to the job output.
+        """
+
+        sys.stdout = Orchestrator.StageOutput(
+            self.JobOutput(self.log, self.local))
+        sys.stderr = self.JobOutput(self.log, self.local)
+
+    def run_job(self, job_id, argv, send):
+        """
+        Run a job in the current thread, sending its output and exit code
+        with the function 'send'.
+        """
+
+        stream = self.JobStream(job_id, send)
+        self.local.stream = stream
+
+        try:
+            code = self._run(argv)
+        except SystemExit as e:
+            # Invalid arguments
+            code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            print(f"Test aborted: {e!r}")
+            code = 1
+        finally:
+            stream.flush()
+            self.local.stream = None
+
+        send({"id": job_id, "exit": code})
+
+    def _run(self, argv):
+        """
+        Run the tests of a job. Return the exit code.
+        """
+
+        from RtmTester.Session import create_rtm, parse_args, run_session
+
+        args = parse_args(argv)
+
+        if args.manual:
+            raise RuntimeError(
+                "The manual test procedure is not available in the agent")
+
+        if args.simulate:
+            rtm, tester_device = create_rtm(args)
+            try:
+                return 0 if run_session(args, rtm) else 1
+            finally:
+                tester_device.stop()
+
+        # If the tests raise an exception, the connection may be broken
+        # (for example, if the FPGA was loaded again), so it is dropped from
+        # the pool, and the next job connects again
+        with self.pool.acquire(
+                yaml_file=args.yaml_file,
+                ip_addr=args.ip_addr,
+                root_name=args.root_name,
+                yaml_cache=args.yaml_cache) as rtm:
+            return 0 if run_session(args, rtm) else 1
+
+    class JobOutput():
+        """
+        Replacement for sys.stdout and sys.stderr, which writes to the
+        output stream of the job run by the current thread. Output from
+        other threads goes to the original stream.
+        """
+
+        def __init__(self, stream, local):
+            """
+            Initialize the object.
+            """
+
+            self.stream = stream
+            self.local = local
+
+        def write(self, s):
+            """
+            Write to the stream of the current job, if any.
+            """
+
+            return self._stream().write(s)
+
+        def flush(self):
+            """
+            Flush the stream of the current job, if any.
+            """
+
+            self._stream().flush()
+
+        def _stream(self):
+            """
+            Return the stream of the current job, or the original stream.
+            """
+
+            return getattr(self.local, 'stream', None) or self.stream
+
+        def __getattr__(self, name):
+            """
+            Forward everything else to the original stream.
+            """
+
+            return getattr(self.stream, name)
+
+    class JobStream():
+        """
+        Output stream of a job, sending each complete line (or what is
+        written before a flush) as an output message.
+        """
+
+        def __init__(self, job_id, send):
+            """
+            Initialize the object.
+            """
+
+            self.job_id = job_id
+            self.send = send
+            self.buffer = []
+
+        def write(self, s):
+            """
+            Write to the buffer, sending it at the end of each line.
+            """
+
+            self.buffer.append(s)
+            if "\n" in s:
+                self.flush()
+
+            return len(s)
+
+        def flush(self):
+            """
+            Send the buffered output.
+            """
+
+            if self.buffer:
+                self.send({"id": self.job_id, "output": "".join(self.buffer)})
+                self.buffer = []
+
+
+class AgentClient():
+    """
+    Client of an RtmAgent, connected to it through a pair of file objects:
+    the standard output and input of an agent process (for example, run
+    via ssh), or a local socket (see connect()). Several jobs can run at
+    the same time, from different threads.
+    """
+
+    def __init__(self, rfile, wfile, sock=None):
+        """
+        Initialize the object, and start reading the agent replies.
+        """
+
+        self.rfile = rfile
+        self.wfile = wfile
+        self.sock = sock
+
+        # Running jobs, by id
+        self.jobs = {}
+        self.next_id = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    @classmethod
+    def connect(cls, socket_path):
+        """
+        Connect to an agent listening on a local socket.
+        """
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            raise
+
+        return cls(sock.makefile("rb"), sock.makefile("wb"), sock)
+
+    def run(self, argv, output):
+        """
+        Run a job with the test application arguments 'argv', writing its
+        output to the file object 'output'. Return its exit code.
+        """
+
+        job = self.Job(output)
+
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("The agent connection is closed")
+
+            self.next_id += 1
+            job_id = self.next_id
+            self.jobs[job_id] = job
+
+            msg = {"id": job_id, "args": list(argv)}
+            try:
+                self.wfile.write((json.dumps(msg) + "\n").encode())
+                self.wfile.flush()
+            except OSError as e:
+                del self.jobs[job_id]
+                raise RuntimeError(f"Can not send the job to the agent: {e}")
+
+        job.done.wait()
+
+        if job.exit_code is None:
+            raise RuntimeError("Lost the connection with the agent")
+
+        return job.exit_code
+
+    def close(self):
+        """
+        Close the connection. The agent finishes the running jobs, and the
+        agent process reading its standard input exits.
+        """
+
+        with self.lock:
+            self.closed = True
+            try:
+                self.wfile.close()
+                if self.sock is not None:
+                    self.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    def _read(self):
+        """
+        Read the agent replies, and dispatch them to the jobs.
+        """
+
+        for line in self.rfile:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+
+            with self.lock:
+                job = self.jobs.get(msg.get("id"))
+            if job is None:
+                continue
+
+            if "output" in msg:
+                try:
+                    job.output.write(msg["output"])
+                    job.output.flush()
+                except (OSError, ValueError):
+                    # The output is discarded, but the job runs to the end
+                    pass
+
+            if "exit" in msg:
+                with self.lock:
+                    del self.jobs[msg["id"]]
+                job.exit_code = msg["exit"]
+                job.done.set()
+
+        # The agent is gone: the running jobs have no exit code
+        with self.lock:
+            self.closed = True
+            for job in self.jobs.values():
+                job.done.set()
+            self.jobs.clear()
+
+    class Job():
+        """
+        A job running in the agent.
+        """
+
+        def __init__(self, output):
+            """
+            Initialize the object.
+            """
+
+            self.output = output
+            self.exit_code = None
+            self.done = threading.Event()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+import contextlib
+import io
+import json
+import os
+import time
+
+import numpy
+
+from RtmTester import Patterns
+from RtmTester.Orchestrator import Orchestrator, Stage
+from RtmTester.TimingTester import TimingTester
+
+
+def latency_stats(durations):
+    """
+    Return the statistics of a list of call durations, in seconds: number
+    of calls, calls per second, and mean, p50, p99 and maximum latency.
+    """
+
+    d = numpy.asarray(durations, dtype=numpy.float64)
+
+    if not d.size:
+        return {"count": 0}
+
+    total = float(d.sum())
+
+    return {
+        "count": int(d.size),
+        "total": total,
+        "rate": d.size / total if total else None,
+        "mean": float(d.mean()),
+        "p50": float(numpy.percentile(d, 50)),
+        "p99": float(numpy.percentile(d, 99)),
+        "max": float(d.max()),
+    }
+
+
+def time_calls(func, args):
+    """
+    Call 'func' once for each element of 'args', and return the duration
+    of each call, in seconds.
+    """
+
+    durations = numpy.empty(len(args), dtype=numpy.float64)
+    clock = time.perf_counter
+
+    for i, a in enumerate(args):
+        start = clock()
+        func(*a)
+        durations[i] = clock() - start
+
+    return durations
+
+
+class Benchmark():
+    """
+    Measure the speed of the test hot path, using the RTM and tester device
+    of an AutomaticIOTester: the latency of each command type, the test
+    vector throughput in each direction, and the end-to-end time of the
+    full board test.
+
+    It runs in the same way against the hardware and against the simulated
+    backends (see RtmTester.Simulator).
+    """
+
+    def __init__(self, io_tester, samples=1000, vectors=4096, board_runs=3,
+                 seed=1, backend="hardware"):
+        """
+        Initialize the object.
+
+        Each command type is timed 'samples' times, the vector throughput is
+        measured with 'vectors' random vectors in each direction, and the
+        full board test is run 'board_runs' times. 'backend' is a label
+        identifying the setup in the results.
+        """
+
+        self.io_tester = io_tester
+        self.rtm = io_tester.rtm
+        self.tester_device = io_tester.tester_device
+        self.samples = samples
+        self.vectors = vectors
+        self.board_runs = board_runs
+        self.seed = seed
+        self.backend = backend
+
+        # Results, filled by run()
+        self.results = {}
+
+    def run(self):
+        """
+        Run all the benchmarks, and return the results.
+        """
+
+        self.results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "backend": self.backend,
+            "config": {
+                "samples": self.samples,
+                "vectors": self.vectors,
+                "board_runs": self.board_runs,
+                "seed": self.seed,
+            },
+            "commands": self._bench_commands(),
+            "vectors": self._bench_vectors(),
+            "board": self._bench_board(),
+        }
+
+        return self.results
+
+    def _bench_commands(self):
+        """
+        Measure the latency of each command type.
+        """
+
+        in_words = [(int(w),) for w in Patterns.lfsr(
+            self.rtm.num_inputs, self.samples, seed=self.seed)]
+        out_words = [(int(w),) for w in Patterns.lfsr(
+            self.rtm.num_outputs, self.samples, seed=self.seed)]
+        no_args = [()] * self.samples
+
+        td = self.tester_device
+        commands = {
+            "rtm.getRtmInputWord": (self.rtm.getRtmInputWord, no_args),
+            "rtm.setRtmOutputWord": (self.rtm.setRtmOutputWord, out_words),
+            "tester.writeOutputs": (td.writeOutputs, in_words),
+            "tester.readInputs": (td.readInputs, no_args),
+            "tester.readInfo": (td.readInfo, no_args[:10]),
+        }
+
+        results = {name: latency_stats(time_calls(func, args))
+                   for name, (func, args) in commands.items()}
+
+        # Pipelined commands, timed per batch of 'pipeline_depth' commands,
+        # and reported per command
+        depth = td.socket.pipeline_depth
+        batches = [(["=" + str(w) for (w,) in in_words[i:i + depth]],)
+                   for i in range(0, len(in_words), depth)]
+        durations = time_calls(td.sendCommands, batches)
+        sizes = numpy.array([len(b[0]) for b in batches])
+        results["tester.sendCommands"] = latency_stats(
+            numpy.repeat(durations / sizes, sizes))
+
+        return results
+
+    def _bench_vectors(self):
+        """
+        Measure the test vector throughput in each direction.
+        """
+
+        results = {}
+
+        for direction, width, test in [
+                ("inputs", self.rtm.num_inputs, self.io_tester._test_inputs),
+                ("outputs", self.rtm.num_outputs,
+                 self.io_tester._test_outputs)]:
+            seq = Patterns.lfsr(width, self.vectors, seed=self.seed)
+
+            start = time.perf_counter()
+            errors = test(seq)
+            elapsed = time.perf_counter() - start
+
+            results[direction] = {
+                "vectors": errors.num_vectors,
+                "errors": int(sum(errors.errors)),
+                "seconds": elapsed,
+                "vectors_per_second":
+                    errors.num_vectors / elapsed if elapsed else None,
+            }
+
+        return results
+
+    def _bench_board(self):
+        """
+        Measure the end-to-end time of the full board test (timing and
+        automatic I/O tests, run as in test-rtm.py), with its output
+        discarded.
+        """
+
+        durations = []
+        passed = []
+
+        # As in test-rtm.py, the MPS message check depends on the timing mode
+        io_resources = ["rtm_io", "tester_device"]
+        if self.io_tester.mps_window is not None:
+            io_resources.append("timing")
+
+        for _ in range(self.board_runs):
+            stages = [
+                Stage(
+                    name="Timing",
+                    run=TimingTester(rtm=self.rtm).run_tests,
+                    resources=["timing"]),
+                Stage(
+                    name="I/O",
+                    run=self.io_tester.run_tests,
+                    resources=io_resources)]
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                passed.append(Orchestrator(stages).run())
+                durations.append(time.perf_counter() - start)
+
+        results = latency_stats(durations)
+        results["passed"] = passed
+
+        return results
+
+    def print_results(self):
+        """
+        Print the results of the last run.
+        """
+
+        r = self.results
+
+        print("")
+        print("*************************")
+        print("*** Benchmark results ***")
+        print("*************************")
+        print("")
+        print("-" * 79)
+        print(f"{'Command':24} | {'Count':6} | {'Rate (1/s)':10} | "
+              f"{'p50 (ms)':9} | {'p99 (ms)':9} | {'Max (ms)':9}")
+        print("-" * 79)
+        for name, s in r["commands"].items():
+            if not s["count"]:
+                continue
+            print(f"{name:24} | {s['count']:6} | {s['rate'] or 0:10.1f} | "
+                  f"{s['p50'] * 1e3:9.3f} | {s['p99'] * 1e3:9.3f} | "
+                  f"{s['max'] * 1e3:9.3f}")
+        print("-" * 79)
+        print("")
+
+        for direction, v in r["vectors"].items():
+            print(f"Vector throughput ({direction}): "
+                  f"{v['vectors_per_second'] or 0:.1f} vectors/s "
+                  f"({v['vectors']} vectors in {v['seconds']:.3f} s, "
+                  f"{v['errors']} errors)")
+
+        b = r["board"]
+        if b["count"]:
+            print(f"Board test time: p50 {b['p50']:.3f} s, "
+                  f"max {b['max']:.3f} s ({b['count']} runs, "
+                  f"{b['passed'].count(True)} passed)")
+        print("")
+
+    def write_results(self, file_name):
+        """
+        Write the results of the last run to a JSON file.
+        """
+
+        d = os.path.dirname(file_name)
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+        with open(file_name, "w") as f:
+            json.dump(self.results, f, indent=2)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import numpy
+
+
+# Bits of each byte value, least significant bit first, as an array (one row
+# per byte value) and as lists
+byte_bits = numpy.unpackbits(
+    numpy.arange(256, dtype=numpy.uint8)[:, None], axis=1, bitorder='little')
+_byte_lists = byte_bits.tolist()
+
+
+def word_bits(word, width=32):
+    """
+    Return the bits of a word as a list, one element per channel, channel 0
+    first.
+    """
+
+    bits = _byte_lists[word & 0xFF] + \
+        _byte_lists[(word >> 8) & 0xFF] + \
+        _byte_lists[(word >> 16) & 0xFF] + \
+        _byte_lists[(word >> 24) & 0xFF]
+
+    return bits[:width]
+
+
+def unpack(words, width=32):
+    """
+    Unpack an array of 32-bit words into an array of bits, one row per
+    word and one column per channel.
+    """
+
+    b = numpy.ascontiguousarray(words, dtype='<u4').view(numpy.uint8)
+
+    return numpy.unpackbits(
+        b.reshape(-1, 4), axis=1, bitorder='little')[:, :width]
+
+
+def changed(previous, current):
+    """
+    Return the mask of the channels which differ between two words, or
+    between two arrays of words.
+    """
+
+    return previous ^ current
+
+
+def changes(words, initial_word=0):
+    """
+    Return the mask of the channels which changed on each word of an array
+    of consecutive samples, starting from 'initial_word'.
+    """
+
+    words = numpy.asarray(words, dtype=numpy.uint32)
+    previous = numpy.empty_like(words)
+    previous[:1] = initial_word
+    previous[1:] = words[:-1]
+
+    return words ^ previous
+
+
+def channels(mask):
+    """
+    Return the list of channels set in a mask, lowest first.
+    """
+
+    mask = int(mask)
+    r = []
+    while mask:
+        low = mask & -mask
+        r.append(low.bit_length() - 1)
+        mask ^= low
+
+    return r
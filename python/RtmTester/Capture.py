@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+import time
+
+import numpy
+
+from RtmTester import Bits
+
+
+class EdgeLog():
+    """
+    Compact log of the changes of an input word.
+
+    Only the samples where the word changes are stored, as pairs of time
+    stamp and mask of the channels which changed, in arrays growing as
+    needed. The stimuli (the time stamp and the word driven on the inputs)
+    are stored in the same way. A long capture of a stable input takes no
+    memory.
+    """
+
+    def __init__(self, initial_word=0, capacity=1024):
+        """
+        Initialize the object, with the word read before the first
+        stimulus.
+        """
+
+        self.initial_word = initial_word
+        self.word = initial_word
+
+        self.edge_times = numpy.empty(capacity, dtype=numpy.float64)
+        self.edge_masks = numpy.empty(capacity, dtype=numpy.uint32)
+        self.num_edges = 0
+
+        self.stimulus_times = numpy.empty(capacity, dtype=numpy.float64)
+        self.stimulus_words = numpy.empty(capacity, dtype=numpy.uint32)
+        self.num_stimuli = 0
+
+    def add_sample(self, t, word):
+        """
+        Add a sample, logging it only if the word changed.
+        """
+
+        diff = Bits.changed(self.word, word)
+        if not diff:
+            return
+
+        if self.num_edges == len(self.edge_times):
+            self.edge_times = _grow(self.edge_times)
+            self.edge_masks = _grow(self.edge_masks)
+
+        self.edge_times[self.num_edges] = t
+        self.edge_masks[self.num_edges] = diff
+        self.num_edges += 1
+        self.word = word
+
+    def add_stimulus(self, t, word):
+        """
+        Log a stimulus: 'word' was driven on the inputs at time 't'.
+        """
+
+        if self.num_stimuli == len(self.stimulus_times):
+            self.stimulus_times = _grow(self.stimulus_times)
+            self.stimulus_words = _grow(self.stimulus_words)
+
+        self.stimulus_times[self.num_stimuli] = t
+        self.stimulus_words[self.num_stimuli] = word
+        self.num_stimuli += 1
+
+    @property
+    def edges(self):
+        """
+        Return the time stamps and masks of the logged edges.
+        """
+
+        return (self.edge_times[:self.num_edges],
+                self.edge_masks[:self.num_edges])
+
+    @property
+    def stimuli(self):
+        """
+        Return the time stamps and words of the logged stimuli.
+        """
+
+        return (self.stimulus_times[:self.num_stimuli],
+                self.stimulus_words[:self.num_stimuli])
+
+    def words_before(self, times):
+        """
+        Return the input word just before each of the given time stamps.
+        """
+
+        edge_times, edge_masks = self.edges
+
+        # The word after each edge, as the accumulated changes
+        words = numpy.bitwise_xor.accumulate(edge_masks) ^ \
+            numpy.uint32(self.initial_word)
+        words = numpy.concatenate(
+            [numpy.array([self.initial_word], dtype=numpy.uint32), words])
+
+        return words[numpy.searchsorted(edge_times, times, side='left')]
+
+
+def capture(read, log, window):
+    """
+    Read the input word continuously for 'window' seconds, using the
+    function 'read', logging the changes in 'log'. Return the last word
+    read.
+
+    Each sample is time stamped (with time.monotonic()) at the middle of its
+    read, as the word is sampled somewhere within its round trip: the error
+    can reach half the round trip time of the read.
+    """
+
+    clock = time.monotonic
+    end = clock() + window
+
+    while True:
+        start = clock()
+        w = read()
+        t = clock()
+        log.add_sample((start + t) / 2, w)
+
+        if t >= end:
+            return w
+
+
+class GlitchStats():
+    """
+    Per-channel settling, bounce and glitch statistics of an edge log.
+
+    After each stimulus, a channel expected to change should have exactly
+    one edge: the extra pairs of edges are bounces, and the time of its
+    last edge is its settling time. A channel not expected to change
+    should have no edges: each pulse (or unfinished pulse) is a glitch.
+    """
+
+    def __init__(self, log, width):
+        """
+        Initialize the object.
+        """
+
+        self.width = width
+
+        stimulus_times, stimulus_words = log.stimuli
+        edge_times, edge_masks = log.edges
+        n = len(stimulus_times)
+
+        # Number of stimuli where each channel was expected to change, and
+        # number of those where it did not change at all
+        self.transitions = numpy.zeros(width, dtype=numpy.int64)
+        self.missing = numpy.zeros(width, dtype=numpy.int64)
+
+        # Number of bounces and glitches on each channel
+        self.bounces = numpy.zeros(width, dtype=numpy.int64)
+        self.glitches = numpy.zeros(width, dtype=numpy.int64)
+
+        # Maximum and mean settling time of each channel, in seconds (NaN if
+        # the channel never changed)
+        self.max_settling = numpy.full(width, numpy.nan)
+        self.mean_settling = numpy.full(width, numpy.nan)
+
+        if not n:
+            return
+
+        # Channels expected to change on each stimulus, as words
+        before = log.words_before(stimulus_times)
+        expected = Bits.changed(before, stimulus_words)
+
+        # Stimulus each edge belongs to (edges before the first stimulus
+        # are ignored), and its time from the stimulus
+        s = numpy.searchsorted(stimulus_times, edge_times, side='right') - 1
+        valid = s >= 0
+        s = s[valid]
+        dt = edge_times[valid] - stimulus_times[s]
+        masks = edge_masks[valid]
+
+        # Each channel is aggregated from its own edges, so the memory does
+        # not grow with the number of stimuli times the number of channels
+        for ch in range(width):
+            exp = ((expected >> ch) & 1).astype(bool)
+            self.transitions[ch] = exp.sum()
+
+            # Stimuli with edges on the channel, their number of edges, and
+            # the time of the last one (the edges are in time order)
+            on_ch = ((masks >> ch) & 1).astype(bool)
+            stim, first, counts = numpy.unique(
+                s[on_ch], return_index=True, return_counts=True)
+            last = dt[on_ch][first + counts - 1]
+            changed = exp[stim]
+
+            self.missing[ch] = self.transitions[ch] - changed.sum()
+            self.bounces[ch] = ((counts[changed] - 1) // 2).sum()
+            self.glitches[ch] = ((counts[~changed] + 1) // 2).sum()
+
+            if changed.any():
+                self.max_settling[ch] = last[changed].max()
+                self.mean_settling[ch] = last[changed].mean()
+
+    def noisy_channels(self):
+        """
+        Return the list of channels with bounces or glitches.
+        """
+
+        return numpy.flatnonzero(self.bounces + self.glitches).tolist()
+
+
+def _grow(a):
+    """
+    Return a copy of an array with twice its size.
+    """
+
+    r = numpy.empty(2 * len(a), dtype=a.dtype)
+    r[:len(a)] = a
+
+    return r
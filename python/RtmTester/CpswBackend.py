@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+from RtmTester.Helpers import print_ok
+from RtmTester.YamlCache import get_pruned_yaml
+
+from pycpsw import Command, Path, ScalVal, ScalVal_RO, YamlFixup
+
+
+class CpswBackend():
+    """
+    Register access backend using CPSW, connected to the ATCA AMC carrier
+    FPGA.
+    """
+
+    def __init__(self, yaml_file, ip_addr, root_name="NetIODev",
+                 yaml_cache=True, paths=()):
+        """
+        Initialize object.
+
+        If 'yaml_cache' is True, only the part of the YAML hierarchy
+        containing the registers in 'paths' is loaded, from a cached copy,
+        which is regenerated when the YAML files change.
+        """
+
+        if yaml_cache:
+            try:
+                yaml_file = get_pruned_yaml(
+                    yaml_file=yaml_file,
+                    root_name=root_name,
+                    paths=paths)
+            except (RuntimeError, OSError) as e:
+                print(f"Can not use the YAML cache, loading the full YAML "
+                      f"hierarchy. {e}")
+
+        print(f"Connecting to FPGA (IP={ip_addr})...             ", end="")
+
+        # Crate the CPSW root
+        self.root = Path.loadYamlFile(
+            yaml_file,
+            rootName=root_name,
+            yamlFixup=self.FixupRoot(ip_addr=ip_addr))
+
+        print_ok("Done!")
+
+    def createScalVal(self, path):
+        """
+        Create an interface to a read-write register.
+        """
+
+        return ScalVal.create(self.root.findByName(path))
+
+    def createScalValRO(self, path):
+        """
+        Create an interface to a read-only register.
+        """
+
+        return ScalVal_RO.create(self.root.findByName(path))
+
+    def createCommand(self, path):
+        """
+        Create an interface to a command (for example, a sequence command).
+        """
+
+        return Command.create(self.root.findByName(path))
+
+    class FixupRoot(YamlFixup):
+        """
+        YamlFixup class, use to override the IP address defined in YAML.
+        """
+
+        def __init__(self, ip_addr):
+            """
+            Initialize object.
+            """
+
+            YamlFixup.__init__(self)
+            self.ip_addr = ip_addr
+
+        def __call__(self, root, top):
+            """
+            Look for the 'ipAddr' node and override it.
+            """
+
+            ip_addr_node = self.findByName(root, "ipAddr")
+            ip_addr_node.set(self.ip_addr)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import glob
+import os
+import re
+import subprocess
+import threading
+
+
+def check_node_connection(node_name):
+    """
+    Return True if the node is reachable.
+    """
+
+    r = subprocess.run(["ping", "-c2", node_name],
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+
+    return r.returncode == 0
+
+
+def find_mcs_file(fw_dir):
+    """
+    Return the path to the MCS file in the firmware directory.
+    """
+
+    mcs_files = glob.glob(os.path.join(fw_dir, "*mcs*"))
+
+    if len(mcs_files) != 1:
+        raise RuntimeError(
+            f"Expected one MCS file in {fw_dir}, found {len(mcs_files)}")
+
+    return mcs_files[0]
+
+
+def get_mcs_githash(mcs_file):
+    """
+    Return the short githash (7 characters) from the MCS file name.
+    """
+
+    m = re.match(r".+-+(.+)\.mcs", os.path.basename(mcs_file))
+    if not m:
+        raise RuntimeError(f"Can not get the githash from {mcs_file}")
+
+    return m.group(1)[:7]
+
+
+class ShelfManager():
+    """
+    Access to the crate information through the ATCA shelf manager, using
+    ipmitool.
+
+    IPMI requests to the same shelf manager are serialized.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize the object.
+        """
+
+        self.name = name
+        self.lock = threading.Lock()
+
+    def _raw(self, slot, *args):
+        """
+        Send a raw IPMI command to the carrier in a slot, and return the
+        list of bytes in the response.
+        """
+
+        ipmb = 128 + 2 * slot
+
+        cmd = ["ipmitool", "-I", "lan", "-H", self.name, "-t", str(ipmb),
+               "-b", "0", "-A", "NONE", "raw"] + list(args)
+
+        with self.lock:
+            r = subprocess.run(cmd,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL,
+                               universal_newlines=True)
+
+        if r.returncode != 0:
+            raise RuntimeError(
+                f"IPMI command to {self.name}, slot {slot} failed. Check "
+                "shelf manager & card state!")
+
+        return r.stdout.split()
+
+    def getCrateId(self, slot):
+        """
+        Return the crate ID, as a 4-digit hex string.
+        """
+
+        b = self._raw(slot, "0x34", "0x04", "0xFD", "0x02")
+
+        try:
+            return f"{int(b[1] + b[0], 16):04X}"
+        except (IndexError, ValueError):
+            raise RuntimeError(f"Invalid crate ID response: {b}")
+
+    def getGitHashFW(self, slot):
+        """
+        Return the short githash (7 characters) of the firmware loaded in
+        the FPGA.
+        """
+
+        # Short githash (inverted)
+        b = self._raw(slot, "0x34", "0x04", "0xe0", "0x04")
+
+        return ''.join(reversed(b))[:7]
+
+    @staticmethod
+    def getFpgaIp(crate_id, slot):
+        """
+        Return the FPGA IP address of the carrier in a slot.
+        """
+
+        # FPGA IP subnet from the crate ID, and last octet from the slot
+        # number
+        return f"10.{int(crate_id[:2], 16)}.{int(crate_id[2:], 16)}." \
+               f"{100 + slot}"
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from RtmTester.Crate import ShelfManager, find_mcs_file, get_mcs_githash
+from RtmTester.YamlCache import default_cache_dir
+
+
+# ProgramFPGA script location
+program_fpga = \
+    "/afs/slac/g/lcls/package/cpsw/utils/ProgramFPGA/current/ProgramFPGA.bash"
+
+
+class FirmwareCache():
+    """
+    On-disk cache of the crate information read via IPMI, and of the MCS
+    file githashes.
+
+    The entries are grouped in sections, and each one records the time it
+    was written, so it can be given a time to live, and optionally a stamp
+    (like the modification time of a file) which must match for the entry
+    to be valid. The file is re-read before each update, so several
+    processes can share it.
+    """
+
+    def __init__(self, cache_file=None):
+        """
+        Initialize the object.
+        """
+
+        if cache_file is None:
+            cache_file = os.path.join(default_cache_dir, "firmware.json")
+
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def get(self, section, key, ttl=None, stamp=None):
+        """
+        Return the value of an entry, or None if it is missing, older than
+        'ttl' seconds, or has a different stamp.
+        """
+
+        with self.lock:
+            e = self.data.get(section, {}).get(key)
+
+        if e is None:
+            return None
+
+        if ttl is not None and time.time() - e["time"] > ttl:
+            return None
+
+        if stamp is not None and e.get("stamp") != stamp:
+            return None
+
+        return e["value"]
+
+    def set(self, section, key, value, stamp=None):
+        """
+        Write an entry.
+        """
+
+        with self.lock:
+            self.data = self._load()
+            self.data.setdefault(section, {})[key] = {
+                "value": value,
+                "time": time.time(),
+                "stamp": stamp}
+            self._save()
+
+    def invalidate(self, section, key):
+        """
+        Remove an entry.
+        """
+
+        with self.lock:
+            self.data = self._load()
+            self.data.get(section, {}).pop(key, None)
+            self._save()
+
+    def _load(self):
+        """
+        Read the cache file. A missing or corrupted file is an empty cache.
+        """
+
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        return data if isinstance(data, dict) else {}
+
+    def _save(self):
+        """
+        Write the cache file atomically. Failing to write it only disables
+        the cache.
+        """
+
+        d = os.path.dirname(self.cache_file)
+        try:
+            os.makedirs(d, exist_ok=True)
+            fd, tmp_file = tempfile.mkstemp(dir=d, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.data, f, indent=1)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+
+
+class FirmwareChecker():
+    """
+    Check that the firmware loaded in the FPGAs matches the MCS file, and
+    load it where it does not.
+
+    The MCS file githash is cached by file modification time, and the
+    crate ID and FPGA firmware githash of each (shelfmanager, slot) for
+    'crate_id_ttl' and 'fw_ttl' seconds. So, checking a crate again right
+    after it was checked, or loaded, does not need any IPMI access. The
+    FPGAs needing the new firmware are loaded in parallel, up to 'jobs' at
+    a time.
+
+    IPMI requests are slow, and serialized per shelf manager, so the FPGA
+    firmware githashes are read directly from the FPGAs, via CPSW, with
+    'fw_reader' (see readGitHashesFW()), when given. It is a function
+    taking a list of FPGA IP addresses, and returning a dictionary with
+    the firmware version of each one (see Rtm.getFirmwareVersion()), or
+    None if it can not be reached.
+    """
+
+    def __init__(self, cpu_name, fw_dir, cache=None, crate_id_ttl=86400,
+                 fw_ttl=300, jobs=6, fw_reader=None):
+        """
+        Initialize the object.
+        """
+
+        self.cpu_name = cpu_name
+        self.fw_dir = fw_dir
+        self.cache = cache if cache is not None else FirmwareCache()
+        self.crate_id_ttl = crate_id_ttl
+        self.fw_ttl = fw_ttl
+        self.jobs = jobs
+        self.fw_reader = fw_reader
+
+        # One shelf manager object per crate
+        self.shelfmanagers = {}
+        self.shelfmanagers_lock = threading.Lock()
+
+    def getShelfManager(self, name):
+        """
+        Return the shelf manager object of a crate.
+        """
+
+        with self.shelfmanagers_lock:
+            return self.shelfmanagers.setdefault(name, ShelfManager(name))
+
+    def getMcsFile(self):
+        """
+        Return the path to the MCS file, and its short githash.
+        """
+
+        mcs_file = os.path.abspath(find_mcs_file(self.fw_dir))
+
+        st = os.stat(mcs_file)
+        stamp = f"{st.st_mtime_ns}:{st.st_size}"
+
+        githash = self.cache.get("mcs", mcs_file, stamp=stamp)
+        if githash is None:
+            githash = get_mcs_githash(mcs_file)
+            self.cache.set("mcs", mcs_file, githash, stamp=stamp)
+
+        return mcs_file, githash
+
+    def getCrateId(self, shelfmanager, slot, refresh=False):
+        """
+        Return the crate ID of the crate of a slot.
+        """
+
+        key = f"{shelfmanager}:{slot}"
+        crate_id = None if refresh else \
+            self.cache.get("crate_id", key, ttl=self.crate_id_ttl)
+
+        if crate_id is None:
+            crate_id = self.getShelfManager(shelfmanager).getCrateId(slot)
+            self.cache.set("crate_id", key, crate_id)
+
+        return crate_id
+
+    def getGitHashFW(self, shelfmanager, slot, refresh=False):
+        """
+        Return the short githash of the firmware loaded in the FPGA of a
+        slot.
+        """
+
+        key = f"{shelfmanager}:{slot}"
+        githash = None if refresh else \
+            self.cache.get("fw_githash", key, ttl=self.fw_ttl)
+
+        if githash is None:
+            githash = self.getShelfManager(shelfmanager).getGitHashFW(slot)
+            self.cache.set("fw_githash", key, githash)
+
+        return githash
+
+    def readGitHashesFW(self, slots, refresh=False):
+        """
+        Return a dictionary with the short githash of the firmware loaded
+        in the FPGAs of a list of (shelfmanager, slot, fpga_ip), by
+        (shelfmanager, slot). The githashes not in the cache are read
+        directly from all the FPGAs at once, with 'fw_reader'. The FPGAs
+        which can not be reached that way are left out, so they can be read
+        via IPMI with getGitHashFW().
+        """
+
+        githashes = {}
+        missing = {}
+        for shelfmanager, slot, fpga_ip in slots:
+            key = f"{shelfmanager}:{slot}"
+            githash = None if refresh else \
+                self.cache.get("fw_githash", key, ttl=self.fw_ttl)
+
+            if githash is not None:
+                githashes[(shelfmanager, slot)] = githash
+            elif fpga_ip is not None:
+                missing[fpga_ip] = (shelfmanager, slot)
+
+        if self.fw_reader is None or not missing:
+            return githashes
+
+        versions = self.fw_reader(list(missing))
+        for fpga_ip, (shelfmanager, slot) in missing.items():
+            version = versions.get(fpga_ip)
+            if version is None:
+                continue
+
+            githash = version["githash"][:7]
+            self.cache.set("fw_githash", f"{shelfmanager}:{slot}", githash)
+            githashes[(shelfmanager, slot)] = githash
+
+        return githashes
+
+    def program(self, slots, mcs_file, mcs_githash, logs=None):
+        """
+        Load the MCS file in the FPGAs of a list of (shelfmanager, slot),
+        in parallel. The output of each ProgramFPGA run is written to the
+        file object in 'logs' with the same key, if any. Return a dictionary
+        with the success of each (shelfmanager, slot).
+        """
+
+        logs = logs or {}
+
+        def run(key):
+            shelfmanager, slot = key
+            log = logs.get(key)
+            if log is not None:
+                log.write("Loading image...\n")
+                log.flush()
+
+            r = subprocess.run(
+                [program_fpga, "-s", shelfmanager, "-n", str(slot),
+                 "-c", self.cpu_name, "-m", mcs_file],
+                stdout=log if log is not None else subprocess.DEVNULL,
+                stderr=subprocess.STDOUT)
+
+            cache_key = f"{shelfmanager}:{slot}"
+            if r.returncode == 0:
+                self.cache.set("fw_githash", cache_key, mcs_githash)
+            else:
+                self.cache.invalidate("fw_githash", cache_key)
+
+            return r.returncode == 0
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.jobs) as executor:
+            results = list(executor.map(run, slots))
+
+        return dict(zip(slots, results))
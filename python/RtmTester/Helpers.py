@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 
+import time
+
+
 def print_ok(msg, **kargs):
     """
     Print the message in green.
@@ -12,3 +15,37 @@ def print_failed(msg, **kargs):
     Print the message in red.
     """
     print(f"\033[31m{msg}\033[0m", **kargs)
+
+
+def poll_until(condition, timeout, poll_interval, stable_samples=1):
+    """
+    Poll 'condition' every 'poll_interval' seconds, until it returns True
+    on 'stable_samples' consecutive polls, or until 'timeout' seconds have
+    passed.
+
+    Return the time, since the call, of the first poll of the stable run,
+    or None if the condition was not stable before the timeout.
+    """
+
+    start = time.monotonic()
+    deadline = start + timeout
+    first = None
+    count = 0
+
+    while True:
+        now = time.monotonic()
+
+        if condition():
+            if count == 0:
+                first = now
+            count += 1
+
+            if count >= stable_samples:
+                return first - start
+        else:
+            count = 0
+
+        if now >= deadline:
+            return None
+
+        time.sleep(poll_interval)
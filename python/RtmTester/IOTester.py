@@ -1,29 +1,117 @@
 #!/usr/bin/env python3
 
 import curses
+import time
 
+import numpy
+
+from RtmTester import Bits, Capture, Latency, MpsMessage, Patterns
+from RtmTester.InputMonitor import InputMonitor
 from RtmTester.Helpers import print_ok, print_failed
 
 
+# Test patterns used by default in the automatic I/O tests
+default_patterns = ['walking_one', 'walking_zero', 'checkerboard',
+                    'exhaustive', 'random']
+
+# Number of times the commands of a vector are retried when one of them
+# fails, before the vector is skipped, and number of vectors skipped in a
+# row after which the test is aborted (the tester device or the RTM are
+# then most likely unreachable)
+command_retries = 1
+max_consecutive_failures = 10
+
+# Number of empty sequences played to check the round trip of the sequencer
+# run command, before using the sequencer
+sequencer_probes = 3
+
+
 class AutomaticIOTester():
     """
     Test the RTM I/O channels, using the tester device.
     """
 
-    def __init__(self, rtm, ip_addr, port_number):
+    def __init__(self, rtm, ip_addr, port_number,
+                 patterns=default_patterns, iterations=1,
+                 random_vectors=1024, seed=1, ping=True,
+                 capture_window=None, latency_repeats=0,
+                 latency_timeout=0.1, mps_window=None, sequencer_period=None,
+                 result_run=None):
         """
         initialize the object.
+
+        The test vectors are built from the list of 'patterns' names (see
+        RtmTester.Patterns), repeated 'iterations' times. The 'random'
+        pattern produces 'random_vectors' vectors per iteration, from an
+        LFSR sequence starting at 'seed'. If 'ping' is False, the tester
+        device is not pinged before connecting to it.
+
+        If 'capture_window' is set, the RTM inputs are sampled continuously
+        for that many seconds after each vector, instead of once, and the
+        settling time, bounces and glitches of each input channel are
+        reported (see RtmTester.Capture).
+
+        If 'latency_repeats' is not zero, the propagation latency of each
+        channel, in both directions, is measured that many times with
+        walking-one and walking-zero vectors, waiting up to
+        'latency_timeout' seconds for each vector (see RtmTester.Latency).
+
+        If 'mps_window' is set, the input bits of the MPS digital message
+        are checked against the RTM inputs after each input vector, waiting
+        up to that many seconds for them to match (see
+        RtmTester.MpsMessage).
+
+        If 'sequencer_period' is set, and the tester device has a
+        sequencer, the input vectors are played by the tester device, one
+        every 'sequencer_period' seconds, instead of being sent one by one
+        (see _test_sequenced()). It is not used with 'capture_window' or
+        'mps_window', which need their own timing on each vector.
+
+        If 'result_run' is given (see RtmTester.Results), the test vectors,
+        channel results and measurements are recorded in it.
         """
 
         # The RTM device
         self.rtm = rtm
 
+        # Number of channels tested in each direction
+        self.num_input_channels = self.rtm.num_inputs
+        self.num_output_channels = self.rtm.num_outputs
+
+        # Test vector configuration
+        self.patterns = patterns
+        self.iterations = iterations
+        self.random_vectors = random_vectors
+        self.seed = seed
+
+        # Input capture configuration, and statistics of the last run
+        self.capture_window = capture_window
+        self.capture_log = None
+        self.input_glitches = None
+
+        # Latency measurement configuration, and results of the last run
+        self.latency_repeats = latency_repeats
+        self.latency_timeout = latency_timeout
+        self.input_latency = None
+        self.output_latency = None
+
+        # MPS message check configuration, and check of the last run
+        self.mps_window = mps_window
+        self.mps_check = None
+
+        # Sequencer configuration
+        self.sequencer_period = sequencer_period
+
+        # Result recorder
+        self.result_run = result_run
+
         # Create a tester device object
         from RtmTester.TesterDevice import TesterDevice
 
         self.tester_device = TesterDevice(
             ip_addr=ip_addr,
-            port_number=port_number)
+            port_number=port_number,
+            ping=ping)
 
         # Print tester device firmware information
         print("Tester device firmware information:")
@@ -33,9 +121,19 @@ class AutomaticIOTester():
             print(f"readInfo() command returned with an error code. {e}")
             raise
 
+        # Time the tester device takes to write all its outputs (which bounds
+        # the skew between them), and to read all its inputs. Older firmware
+        # does not report it.
+        self.tester_update_time = self.tester_device.readUpdateTime()
+        if self.tester_update_time is not None:
+            print(f"Tester device output write time: "
+                  f"{self.tester_update_time[0] * 1e6:.2f} us, input read "
+                  f"time: {self.tester_update_time[1] * 1e6:.2f} us")
+            print("")
+
     def run_tests(self):
         """
-        Run the tests.
+        Run the tests. Return True if all the channels passed.
         """
 
         print("##########################################")
@@ -43,141 +141,790 @@ class AutomaticIOTester():
         print("##########################################")
         print("")
 
-        # Verify the RTM inputs
-        print("Testing inputs channels...")
-        in_ch_result = {}
-        in_ch_error_cnt = 0
-        in_ch_log = []
-        for i in range(8):
+        in_seq = self._build_sequence(width=self.num_input_channels)
+        out_seq = self._build_sequence(width=self.num_output_channels)
+
+        # The forced bits would replace the inputs in the MPS message, so
+        # forcing is disabled during the test, and restored after it
+        mps_force = None
+        if self.mps_window is not None:
+            self.mps_check = MpsMessage.MessageCheck(
+                self.rtm, self.mps_window)
+            mps_force = self.rtm.getMpsForce()
+            if mps_force[0]:
+                print("MPS message digital bits are forced. Disabling it "
+                      "during the test.")
+                self.rtm.setMpsForce(False)
+
+        # Forcing is restored even if the test is interrupted (the CPSW
+        # exceptions are not RuntimeError)
+        try:
+            in_ch_errors, out_ch_errors = self._test_channels(in_seq, out_seq)
+        finally:
+            if mps_force is not None and mps_force[0]:
+                self.rtm.setMpsForce(True, mps_force[1])
+
+        # Measure the propagation latency
+        if self.latency_repeats:
+            print("Measuring propagation latency...")
+            self.input_latency = self._measure_input_latency()
+            self.output_latency = self._measure_output_latency()
+            print("Done!")
+            print("")
 
-            try:
-                # Navigates all the inputs bits
-                set_val = 2**i
+        print("*************************")
+        print("***   Test results:   ***")
+        print("*************************")
+        print("")
+
+        print("Input Channels:")
+        print("=============================")
+        print("")
 
-                # Write the value in the outputs of the tester device
-                self.tester_device.writeOutputs(set_val)
+        self._print_results(in_ch_errors, "input")
 
-                # Read the values from the RTM inputs
-                get_val = self.rtm.getRtmInputWord()
+        print(f"Number of Input Channel Fails: "
+              f"{len(in_ch_errors.failed_channels())}")
+        print("")
 
-                # Verify that the write and read value match
-                r = (get_val == set_val)
+        if self.input_glitches is not None:
+            self._print_glitches(self.input_glitches)
 
-                # Log result
-                if r:
-                    m = "PASSED"
-                else:
-                    m = "FAILED"
-                    in_ch_error_cnt += 1
-                    in_ch_log.append(f"Error in input channel {i}. \
-                                     Set value was: {set_val}, \
-                                     but read back value was {get_val}.")
+        mps_ch_errors = None
+        if self.mps_check is not None:
+            mps_ch_errors = self.mps_check.errors()
+            self._print_mps_results(mps_ch_errors)
 
-                in_ch_result[i] = m
+        print("Output Channels:")
+        print("=============================")
+        print("")
 
-            except RuntimeError as e:
-                print(f"writeOutputs({set_val}) or getRtmInputWord() command "
-                      f"failed on iteration {i}. {e}")
-                # log result
-            # handler cpsw exceptions
+        self._print_results(out_ch_errors, "output")
+
+        print(f"Number of Output Channels Fails: "
+              f"{len(out_ch_errors.failed_channels())}")
+        print("\n")
+
+        if self.result_run is not None:
+            self._record_results(in_ch_errors, out_ch_errors, mps_ch_errors)
+
+        if self.latency_repeats:
+            self._print_latency(self.input_latency, "Input")
+            self._print_latency(self.output_latency, "Output")
 
-        print("Done!")
+        print("")
+        print("##########################################")
+        print("###    End of Automatic I/O Tests      ###")
+        print("##########################################")
         print("")
 
-        # Verify outputs
-        print("Testing output channels...")
-        out_ch_result = {}
-        out_ch_error_cnt = 0
-        out_ch_log = []
-        for i in range(8):
+        # All the vectors must have been tested, without errors, bounces or
+        # glitches
+        return (in_ch_errors.num_vectors == len(in_seq)) and \
+            (out_ch_errors.num_vectors == len(out_seq)) and \
+            not in_ch_errors.failed_channels() and \
+            not out_ch_errors.failed_channels() and \
+            (mps_ch_errors is None or
+             not mps_ch_errors.failed_channels()) and \
+            (self.input_glitches is None or
+             not self.input_glitches.noisy_channels()) and \
+            not any(lat.degraded_channels() for lat in
+                    [self.input_latency, self.output_latency] if lat)
+
+    def _test_channels(self, in_seq, out_seq):
+        """
+        Test the input and output channels, in the mode selected by the
+        options. Return the per-channel error statistics of the inputs and
+        of the outputs.
+        """
 
-            try:
-                # Navigate all the output bits
-                set_val = 2**i
+        if self.capture_window:
+            # Verify the RTM inputs
+            print("Testing inputs channels...")
+            print(f"Number of test vectors: {len(in_seq)}")
+            in_ch_errors = self._test_inputs(in_seq)
+            print("Done!")
+            print("")
 
-                # Set the output value in the RTM
-                self.rtm.setRtmOutputWord(value=set_val)
+            # Verify outputs
+            print("Testing output channels...")
+            print(f"Number of test vectors: {len(out_seq)}")
+            out_ch_errors = self._test_outputs(out_seq)
+            print("Done!")
+            print("")
+        elif self._use_sequencer():
+            # Verify the RTM inputs and outputs at the same time, with the
+            # tester device sequencer
+            print("Testing input and output channels, with the tester "
+                  "device sequencer...")
+            print(f"Number of test vectors: {len(in_seq)} (inputs), "
+                  f"{len(out_seq)} (outputs)")
+            in_ch_errors, out_ch_errors = self._test_sequenced(
+                in_seq, out_seq)
+            print("Done!")
+            print("")
+        else:
+            # Verify the RTM inputs and outputs at the same time
+            print("Testing input and output channels...")
+            print(f"Number of test vectors: {len(in_seq)} (inputs), "
+                  f"{len(out_seq)} (outputs)")
+            in_ch_errors, out_ch_errors = self._test_inputs_outputs(
+                in_seq, out_seq)
+            print("Done!")
+            print("")
 
-                # Read the values from the tester device
-                get_val = self.tester_device.readInputs()
+        return in_ch_errors, out_ch_errors
 
-                # Verify that the write and read value match
-                r = (get_val == set_val)
+    def _build_sequence(self, width):
+        """
+        Build the test vector sequence for a number of channels.
+        """
 
-                # log result
-                if r:
-                    m = "PASSED"
-                else:
-                    m = "FAILED"
-                    out_ch_error_cnt += 1
-                    out_ch_log.append(f"Error in output channel {i}. \
-                                      Set value was: {set_val}, \
-                                      but read back value was {get_val}.")
+        return Patterns.build_sequence(
+            names=self.patterns,
+            width=width,
+            iterations=self.iterations,
+            random_vectors=self.random_vectors,
+            seed=self.seed)
 
-                out_ch_result[i] = m
+    def _test_inputs(self, seq):
+        """
+        Drive each vector on the tester device outputs, and read it back
+        from the RTM inputs. Return the per-channel error statistics.
+        """
 
-            except RuntimeError as e:
-                print(f"readInputs() or setRtmOutputWord({set_val}) command "
-                      f"failed on iteration {i}. {e}")
-                # log result
-            # handler cpsw exceptions
+        observed = numpy.zeros_like(seq)
+        tested = numpy.zeros(len(seq), dtype=bool)
+        seq_list = seq.tolist()
+
+        write = self.tester_device.writeOutputs
+        write_timed = self.tester_device.writeOutputsTimed
+        read = self.rtm.getRtmInputWord
+        mps_check = self.mps_check
+
+        if self.capture_window:
+            log = self.capture_log = Capture.EdgeLog(initial_word=read())
+
+        stream = None
+        if self.result_run is not None:
+            stream = self.result_run.vector_stream("input")
+
+        def step(i):
+            set_val = seq_list[i]
+
+            # Write the value in the outputs of the tester device, and read
+            # the values from the RTM inputs. In capture mode, log the time
+            # at which the tester device wrote it (see
+            # TesterDevice.writeOutputsTimed() for its uncertainty), and
+            # keep the value at the end of the window.
+            if self.capture_window:
+                log.add_stimulus(write_timed(set_val), set_val)
+                observed[i] = Capture.capture(
+                    read, log, self.capture_window)
+            else:
+                write(set_val)
+                observed[i] = read()
 
-        print("Done!")
-        print("")
+            if mps_check is not None:
+                mps_check.sample(int(observed[i]))
 
-        print("*************************")
-        print("***   Test results:   ***")
-        print("*************************")
-        print("")
+            if stream is not None:
+                stream.add(i, set_val, observed[i])
 
-        print("Input Channels:")
-        print("=============================")
+        self._run_vectors(
+            tested, step, "writeOutputs() or getRtmInputWord() command")
+
+        if stream is not None:
+            stream.flush()
+
+        if self.capture_window:
+            self.input_glitches = Capture.GlitchStats(
+                log, width=self.num_input_channels)
+
+        # Verify that the write and read values match
+        return Patterns.ChannelErrors(
+            expected=seq,
+            observed=observed,
+            width=self.num_input_channels,
+            tested=tested)
+
+    def _test_outputs(self, seq):
+        """
+        Set each vector on the RTM outputs, and read it back from the
+        tester device inputs. Return the per-channel error statistics.
+        """
+
+        observed = numpy.zeros_like(seq)
+        tested = numpy.zeros(len(seq), dtype=bool)
+        seq_list = seq.tolist()
+
+        write = self.rtm.setRtmOutputWord
+        read = self.tester_device.readInputs
+
+        stream = None
+        if self.result_run is not None:
+            stream = self.result_run.vector_stream("output")
+
+        def step(i):
+            set_val = seq_list[i]
+
+            # Set the output value in the RTM
+            write(value=set_val)
+
+            # Read the values from the tester device
+            observed[i] = read()
+
+            if stream is not None:
+                stream.add(i, set_val, observed[i])
+
+        self._run_vectors(
+            tested, step, "setRtmOutputWord() or readInputs() command")
+
+        if stream is not None:
+            stream.flush()
+
+        # Verify that the write and read values match
+        return Patterns.ChannelErrors(
+            expected=seq,
+            observed=observed,
+            width=self.num_output_channels,
+            tested=tested)
+
+    @staticmethod
+    def _run_vectors(tested, step, description, indices=None):
+        """
+        Test the vectors 'indices' (by default, all of them), calling
+        'step(i)' to send the commands of each vector 'i', and mark the
+        vectors tested in the boolean array 'tested'.
+
+        When a command fails, the vector is retried 'command_retries' times,
+        and then logged and skipped, so a transient error does not end the
+        test. After 'max_consecutive_failures' vectors skipped in a row, the
+        test is aborted, leaving the rest of the vectors untested.
+        """
+
+        if indices is None:
+            indices = range(len(tested))
+
+        failures = 0
+        for i in indices:
+            for _ in range(command_retries + 1):
+                try:
+                    step(i)
+                    break
+                except RuntimeError as e:
+                    error = e
+            else:
+                print(f"{description} failed on vector {i}. {error}")
+                failures += 1
+                if failures >= max_consecutive_failures:
+                    print_failed(f"{failures} vectors failed in a row. "
+                                 f"Aborting the test.")
+                    break
+                continue
+
+            tested[i] = True
+            failures = 0
+
+    def _test_inputs_outputs(self, in_seq, out_seq):
+        """
+        Test both directions in a single pass: on each step, set an output
+        vector on the RTM, and then drive an input vector on the tester
+        device outputs and read the output vector back from its inputs,
+        with a single tester device command. Return the per-channel error
+        statistics of the inputs and of the outputs.
+        """
+
+        in_observed = numpy.zeros_like(in_seq)
+        out_observed = numpy.zeros_like(out_seq)
+        n_in = len(in_seq)
+        n_out = len(out_seq)
+        tested = numpy.zeros(max(n_in, n_out), dtype=bool)
+
+        set_output = self.rtm.setRtmOutputWord
+        get_input = self.rtm.getRtmInputWord
+        mps_check = self.mps_check
+        write_read = self.tester_device.writeOutputsReadInputs
+        write = self.tester_device.writeOutputs
+        read = self.tester_device.readInputs
+
+        in_stream = out_stream = None
+        if self.result_run is not None:
+            in_stream = self.result_run.vector_stream("input")
+            out_stream = self.result_run.vector_stream("output")
+
+        in_list = in_seq.tolist()
+        out_list = out_seq.tolist()
+
+        def step(i):
+            has_in = i < n_in
+            has_out = i < n_out
+
+            # Set the output value in the RTM
+            if has_out:
+                set_output(value=out_list[i])
+
+            # Write the value in the outputs of the tester device, and read
+            # its inputs
+            if has_in and has_out:
+                out_observed[i] = write_read(in_list[i])
+            elif has_in:
+                write(in_list[i])
+            else:
+                out_observed[i] = read()
+
+            # Read the values from the RTM inputs, and check the MPS message
+            # input bits
+            if has_in:
+                in_observed[i] = get_input()
+                if mps_check is not None:
+                    mps_check.sample(int(in_observed[i]))
+
+            if in_stream is not None:
+                if has_in:
+                    in_stream.add(i, in_list[i], in_observed[i])
+                if has_out:
+                    out_stream.add(i, out_list[i], out_observed[i])
+
+        self._run_vectors(tested, step, "Tester device or RTM command")
+
+        if in_stream is not None:
+            in_stream.flush()
+            out_stream.flush()
+
+        # Verify that the write and read values match
+        return (
+            Patterns.ChannelErrors(
+                expected=in_seq,
+                observed=in_observed,
+                width=self.num_input_channels,
+                tested=tested[:n_in]),
+            Patterns.ChannelErrors(
+                expected=out_seq,
+                observed=out_observed,
+                width=self.num_output_channels,
+                tested=tested[:n_out]))
+
+    def _use_sequencer(self):
+        """
+        Return True if the I/O test must use the tester device sequencer.
+        """
+
+        if not self.sequencer_period:
+            return False
+
+        if not self.tester_device.sequencer_capacity:
+            print("The tester device has no sequencer. Sending the vectors "
+                  "one by one.")
+            return False
+
+        if self.mps_check is not None:
+            print("The MPS message check needs the vectors to be sent one "
+                  "by one. Not using the sequencer.")
+            return False
+
+        return True
+
+    def _test_sequenced(self, in_seq, out_seq):
+        """
+        Test both directions in a single pass, with the tester device
+        sequencer. The input vectors are loaded in the sequencer table, as
+        many as fit at a time, and played by the tester device, one per
+        step: it drives each vector at the start of its step, and records
+        its inputs at the end of it. Meanwhile, a quarter of a period after
+        the start of each step, the RTM inputs are read and the output
+        vector of the step is set on the RTM. The recorded inputs are then
+        fetched in a single command.
+
+        The start time of the playback is only known within the round trip
+        of the run command, so the round trip must be shorter than a quarter
+        of a period: if it is not, the sequencer is not used for the rest of
+        the test. The vectors whose RTM accesses did not fit in their step (for
+        example, because of a scheduling delay in the host) are tested
+        again, one by one, at the end, and so are all the vectors of a
+        sequence when one of its commands fails, or when the tester device
+        overruns its steps. Return the per-channel error statistics of the
+        inputs and of the outputs.
+        """
+
+        in_observed = numpy.zeros_like(in_seq)
+        out_observed = numpy.zeros_like(out_seq)
+        n_in = len(in_seq)
+        n_out = len(out_seq)
+        steps = max(n_in, n_out)
+        tested = numpy.zeros(steps, dtype=bool)
+
+        tester = self.tester_device
+        set_output = self.rtm.setRtmOutputWord
+        get_input = self.rtm.getRtmInputWord
+        clock = time.monotonic
+
+        period = self.sequencer_period
+        guard = period / 4
+        capacity = tester.sequencer_capacity
+
+        in_list = in_seq.tolist()
+        out_list = out_seq.tolist()
+
+        # The tester device outputs keep the last input vector on the steps
+        # past the end of the input sequence
+        drive = in_list + in_list[-1:] * (steps - n_in) if in_list \
+            else [0] * steps
+
+        # Vectors to test again, one by one
+        missed = []
+
+        # The round trip of the run command is checked first, with empty
+        # sequences (the shortest of a few, as a scheduling delay in the
+        # host can make any of them longer), so that no sequence is played
+        # in vain when it is too long
+        starts = range(0, steps, capacity)
+        try:
+            round_trip = min(
+                t_max - t_min for t_min, t_max in
+                (tester.runSequence(0, period)
+                 for _ in range(sequencer_probes)))
+            print(f"Sequencer run command round trip: "
+                  f"{round_trip * 1e6:.0f} us")
+            if round_trip > guard:
+                print(f"The round trip of the sequencer run command is "
+                      f"longer than a quarter of the period. Not using the "
+                      f"sequencer.")
+                starts = []
+                missed.extend(range(steps))
+        except RuntimeError:
+            pass
+
+        for start in starts:
+            count = min(capacity, steps - start)
+
+            try:
+                tester.loadSequence(drive[start:start + count])
+                t_min, t_max = tester.runSequence(count, period)
+
+                if t_max - t_min > guard:
+                    # Wait for the playback to finish, and test the vectors
+                    # of the sequence again, one by one
+                    print(f"The sequencer start time is not known precisely "
+                          f"enough ({(t_max - t_min) * 1e6:.0f} us). Testing "
+                          f"the vectors again, one by one.")
+                    tester.fetchCapture(
+                        count,
+                        timeout=tester.socket.timeout + count * period)
+                    missed.extend(range(start, start + count))
+                    continue
+
+                for j in range(count):
+                    i = start + j
+                    delay = t_max + j * period + guard - clock()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                    # Read the values from the RTM inputs, and set the
+                    # output value in the RTM
+                    if i < n_in:
+                        in_observed[i] = get_input()
+                    if i < n_out:
+                        set_output(value=out_list[i])
+
+                    if clock() > t_min + (j + 1) * period - guard:
+                        missed.append(i)
+
+                # Fetch the tester device inputs recorded on each step, once
+                # the playback has finished
+                capture, overrun = tester.fetchCapture(
+                    count,
+                    timeout=tester.socket.timeout + count * period)
+
+            except RuntimeError as e:
+                # The whole sequence is tested again, one by one
+                print(f"Tester device or RTM command failed on the sequence "
+                      f"starting at vector {start}. Testing its vectors "
+                      f"again, one by one. {e}")
+                missed = [i for i in missed if i < start]
+                missed.extend(range(start, start + count))
+                continue
+
+            if overrun:
+                print(f"The tester device overran the steps of the sequence "
+                      f"starting at vector {start} (the period is too short "
+                      f"for it). Testing its vectors again, one by one.")
+                missed = [i for i in missed if i < start]
+                missed.extend(range(start, start + count))
+                continue
+
+            tested[start:start + count] = True
+
+            end = min(start + count, n_out)
+            if end > start:
+                out_observed[start:end] = list(capture[:end - start])
+
+        tested[missed] = False
+        if missed:
+            print(f"Number of vectors tested again, one by one: "
+                  f"{len(missed)}")
+
+        def step(i):
+            if i < n_out:
+                set_output(value=out_list[i])
+                out_observed[i] = tester.writeOutputsReadInputs(drive[i])
+            else:
+                tester.writeOutputs(drive[i])
+
+            if i < n_in:
+                in_observed[i] = get_input()
+
+        self._run_vectors(
+            tested, step, "Tester device or RTM command", indices=missed)
+
+        if self.result_run is not None:
+            in_stream = self.result_run.vector_stream("input")
+            for i in numpy.flatnonzero(tested[:n_in]).tolist():
+                in_stream.add(i, in_list[i], in_observed[i])
+            in_stream.flush()
+
+            out_stream = self.result_run.vector_stream("output")
+            for i in numpy.flatnonzero(tested[:n_out]).tolist():
+                out_stream.add(i, out_list[i], out_observed[i])
+            out_stream.flush()
+
+        # Verify that the write and read values match
+        return (
+            Patterns.ChannelErrors(
+                expected=in_seq,
+                observed=in_observed,
+                width=self.num_input_channels,
+                tested=tested[:n_in]),
+            Patterns.ChannelErrors(
+                expected=out_seq,
+                observed=out_observed,
+                width=self.num_output_channels,
+                tested=tested[:n_out]))
+
+    def _print_results(self, errors, direction):
+        """
+        Print the result table and error log of one test direction.
+        """
+
+        print(f"Number of test vectors: {errors.num_vectors}")
+        if errors.untested:
+            print_failed(f"Number of vectors not tested, after command "
+                         f"failures: {errors.untested}")
         print("")
 
-        print("---------------------")
-        print("Channel | Test result")
-        print("---------------------")
-        for v, k in in_ch_result.items():
-            print(f"   {v:02}   | {k}")
-        print("---------------------")
+        print("--------------------------------------------------")
+        print("Channel | Errors     | Test result")
+        print("--------------------------------------------------")
+        for ch in range(errors.width):
+            print(f"   {ch:02}   | {errors.errors[ch]:10} | "
+                  f"{errors.result(ch)}")
+        print("--------------------------------------------------")
         print("")
 
         print("Log:")
         print("-------------------------------")
-        for log in in_ch_log:
-            print(log)
+        for ch in errors.failed_channels():
+            i = errors.first_error[ch]
+            print(f"Error in {direction} channel {ch}. "
+                  f"Read low when set high {errors.stuck_low[ch]} times, "
+                  f"read high when set low {errors.stuck_high[ch]} times. "
+                  f"First error on vector {i}: "
+                  f"set value was {errors.expected[i]}, "
+                  f"but read back value was {errors.observed[i]}.")
         print("-------------------------------")
         print("")
 
-        print(f"Number of Input Channel Fails: {in_ch_error_cnt}")
+    def _print_mps_results(self, errors):
+        """
+        Print the results of the MPS message input bits check.
+        """
+
+        check = self.mps_check
+
+        print("MPS Message Input Bits:")
+        print("=============================")
         print("")
 
-        print("Output Channels:")
+        if check.message_width < self.num_input_channels:
+            print_failed(f"The MPS message carries only "
+                         f"{check.message_width} input channels")
+            print("")
+
+        settle = check.max_settle_time()
+        if settle is not None:
+            print(f"Maximum time to match the RTM inputs: "
+                  f"{settle * 1e3:.3f} ms")
+        print(f"Vectors not matching the RTM inputs after "
+              f"{check.window * 1e3:.3f} ms: {check.unmatched_vectors()}")
+        print("")
+
+        self._print_results(errors, "MPS message input")
+
+        print(f"Number of MPS Message Input Channel Fails: "
+              f"{len(errors.failed_channels())}")
+        print("")
+
+    def _record_results(self, in_ch_errors, out_ch_errors,
+                        mps_ch_errors=None):
+        """
+        Record the channel results and measurements in the result run.
+        """
+
+        run = self.result_run
+
+        run.add_channel_results("input", in_ch_errors)
+        run.add_channel_results("output", out_ch_errors)
+        if self.tester_update_time is not None:
+            run.add_measurement(
+                "tester_output_write_time", self.tester_update_time[0])
+            run.add_measurement(
+                "tester_input_read_time", self.tester_update_time[1])
+        if mps_ch_errors is not None:
+            run.add_channel_results("mps_input", mps_ch_errors)
+            run.add_measurement(
+                "mps_input_settling_max", self.mps_check.max_settle_time())
+
+        for direction, latency in [("input", self.input_latency),
+                                   ("output", self.output_latency)]:
+            if latency is None:
+                continue
+            channels = range(latency.width)
+            run.add_measurements(
+                f"{direction}_latency_p50",
+                [(ch, latency.percentile(ch, 50)) for ch in channels])
+            run.add_measurements(
+                f"{direction}_latency_max",
+                [(ch, latency.max(ch)) for ch in channels])
+            run.add_measurements(
+                f"{direction}_latency_timeouts",
+                [(ch, latency.timeouts[ch]) for ch in channels])
+
+        stats = self.input_glitches
+        if stats is not None:
+            channels = range(stats.width)
+            run.add_measurements(
+                "input_settling_max",
+                [(ch, stats.max_settling[ch]) for ch in channels])
+            run.add_measurements(
+                "input_bounces", [(ch, stats.bounces[ch]) for ch in channels])
+            run.add_measurements(
+                "input_glitches",
+                [(ch, stats.glitches[ch]) for ch in channels])
+
+    def _latency_sequence(self, width):
+        """
+        Build the latency measurement vector sequence for a number of
+        channels, where each vector changes a couple of channels.
+        """
+
+        seq = numpy.concatenate(
+            [Patterns.walking_one(width), Patterns.walking_zero(width)])
+
+        return numpy.tile(seq, self.latency_repeats)
+
+    def _measure_input_latency(self):
+        """
+        Measure the latency from the tester device outputs to the RTM
+        inputs.
+        """
+
+        latency = Latency.ChannelLatency(self.num_input_channels)
+        Latency.measure(
+            write=self.tester_device.writeOutputsTimed,
+            read=Latency.timed_read(self.rtm.getRtmInputWord),
+            words=self._latency_sequence(self.num_input_channels),
+            latency=latency,
+            initial_word=self.rtm.getRtmInputWord(),
+            timeout=self.latency_timeout)
+
+        return latency
+
+    def _measure_output_latency(self):
+        """
+        Measure the latency from the RTM outputs to the tester device
+        inputs.
+        """
+
+        latency = Latency.ChannelLatency(self.num_output_channels)
+        Latency.measure(
+            write=Latency.timed_write(self.rtm.setRtmOutputWord),
+            read=self.tester_device.readInputsTimed,
+            words=self._latency_sequence(self.num_output_channels),
+            latency=latency,
+            initial_word=self.tester_device.readInputs(),
+            timeout=self.latency_timeout)
+
+        return latency
+
+    def _print_latency(self, latency, direction):
+        """
+        Print the latency table and histograms of one direction.
+        """
+
+        edges = [f"{e * 1e3:g}" for e in latency.bin_edges]
+        bins = [f"<{edges[0]}"] + \
+            [f"{a}-{b}" for a, b in zip(edges[:-1], edges[1:])] + \
+            [f">{edges[-1]}"]
+
+        print(f"{direction} Channels Latency:")
         print("=============================")
         print("")
+        print("Latency histogram bins (ms): " + ", ".join(bins))
+        print("")
 
-        print("---------------------")
-        print("Channel | Test result")
-        print("---------------------")
-        for v, k in out_ch_result.items():
-            print(f"   {v:02}   | {k}")
-        print("---------------------")
+        header = "Channel | Timeouts | p50 (ms) | p99 (ms) | Max (ms) | " + \
+            "Histogram"
+        print("-" * (len(header) + 6 * len(bins)))
+        print(header)
+        print("-" * (len(header) + 6 * len(bins)))
+        degraded = latency.degraded_channels()
+        for ch in range(latency.width):
+            hist = "".join(f"{c:6}" for c in latency.histogram(ch))
+            print(f"   {ch:02}   | {latency.timeouts[ch]:8} | "
+                  f"{latency.percentile(ch, 50) * 1e3:8.3f} | "
+                  f"{latency.percentile(ch, 99) * 1e3:8.3f} | "
+                  f"{latency.max(ch) * 1e3:8.3f} | {hist}", end="")
+            if ch in degraded:
+                print_failed("  DEGRADED", end="")
+            print("")
+        print("-" * (len(header) + 6 * len(bins)))
         print("")
 
-        print("Log:")
-        print("-------------------------------")
-        for log in out_ch_log:
-            print(log)
-        print("-------------------------------")
+        print(f"Minimum safe settle time: "
+              f"{latency.settle_time() * 1e3:.3f} ms")
+        print(f"Number of {direction} Channels degraded: {len(degraded)}")
         print("")
 
-        print(f"Number of Output Channels Fails: {out_ch_error_cnt}")
-        print("\n")
+    def _print_glitches(self, stats):
+        """
+        Print the input capture table.
+        """
 
+        print("Input Capture:")
+        print("=============================")
         print("")
-        print("##########################################")
-        print("###    End of Automatic I/O Tests      ###")
-        print("##########################################")
+        print(f"Capture window: {self.capture_window * 1e3:.3f} ms, "
+              f"{self.capture_log.num_edges} edges logged")
+        print("")
+
+        print("-" * 73)
+        print("Channel | Transitions | Missing | Settling mean/max (ms) | "
+              "Bounces | Glitches")
+        print("-" * 73)
+        for ch in range(stats.width):
+            if numpy.isnan(stats.max_settling[ch]):
+                settling = "-"
+            else:
+                settling = f"{stats.mean_settling[ch] * 1e3:.3f}/" \
+                           f"{stats.max_settling[ch] * 1e3:.3f}"
+            print(f"   {ch:02}   | {stats.transitions[ch]:11} | "
+                  f"{stats.missing[ch]:7} | {settling:>22} | "
+                  f"{stats.bounces[ch]:7} | {stats.glitches[ch]:8}")
+        print("-" * 73)
+        print("")
+
+        print(f"Number of Input Channels with bounces or glitches: "
+              f"{len(stats.noisy_channels())}")
         print("")
 
 
@@ -186,12 +933,26 @@ class ManualIOTester():
     Test the RTM I/O channels, without using the tester device.
     """
 
-    def __init__(self, rtm):
+    def __init__(self, rtm, sample_rate=1000.0, buffer_size=65536,
+                 refresh_interval=0.05):
         """
         initialize the object.
+
+        The inputs are sampled in the background at 'sample_rate' samples
+        per second (see InputMonitor), and the screen is updated every
+        'refresh_interval' seconds.
         """
 
         self.rtm = rtm
+        self.refresh_interval = refresh_interval
+
+        self.monitor = InputMonitor(
+            rtm=rtm,
+            rate=sample_rate,
+            buffer_size=buffer_size)
+
+        # Screen position of each table cell, by (row name, channel)
+        self.cells = {}
 
         self.num_input_channels = 32
         self.num_output_channels = 8
@@ -206,7 +967,8 @@ class ManualIOTester():
 
     def run_tests(self):
         """
-        Run the tests.
+        Run the tests. Return True if all the channels were tested, and the
+        input sampling did not stop on an error.
         """
 
         print("##########################################")
@@ -225,6 +987,10 @@ class ManualIOTester():
 
         print("I/O test stopped.")
 
+        if self.monitor.error is not None:
+            print_failed(f"Input sampling stopped on error: "
+                         f"{self.monitor.error}")
+
         print("")
         print("Test Summary:")
         print("")
@@ -280,9 +1046,15 @@ class ManualIOTester():
         print("##########################################")
         print("")
 
+        if self.monitor.error is not None:
+            return False
+
+        return 'N' not in self.input_channel_tested + \
+            self.output_channel_tested
+
     def _print_io_table(self, win):
         """
-        Print the I/O state table.
+        Print the I/O state table, recording the position of each cell.
         """
         win.addstr("Input Channels:\n")
         win.addstr("=============================\n")
@@ -298,16 +1070,16 @@ class ManualIOTester():
             win.addstr("\n")
 
             win.addstr("Tested         | ")
-            for i in self.input_channel_tested[start:stop]:
-                win.addstr(f"  {i}", curses.color_pair(
-                    self.green if i == "Y" else self.red))
+            for i in self.input_channel_index[start:stop]:
+                self._add_cell(win, "input_tested", i,
+                               self.input_channel_tested[i])
                 win.addstr(" |")
             win.addstr("\n")
 
             win.addstr("Current State  | ")
-            for i in self.input_channel_state[start:stop]:
-                win.addstr(f"  {i}", curses.color_pair(
-                    self.magenta if i else self.blue))
+            for i in self.input_channel_index[start:stop]:
+                self._add_cell(win, "input_state", i,
+                               self.input_channel_state[i])
                 win.addstr(" |")
             win.addstr("\n")
             win.addstr("\n")
@@ -320,16 +1092,16 @@ class ManualIOTester():
         win.addstr("\n")
 
         win.addstr("Tested         | ")
-        for i in self.output_channel_tested:
-            win.addstr(f"  {i}", curses.color_pair(
-                self.green if i == "Y" else self.red))
+        for i in self.output_channel_index:
+            self._add_cell(win, "output_tested", i,
+                           self.output_channel_tested[i])
             win.addstr(" |")
         win.addstr("\n")
 
         win.addstr("Current State  | ")
-        for i in self.output_channel_state:
-            win.addstr(f"  {i}", curses.color_pair(
-                self.magenta if i else self.blue))
+        for i in self.output_channel_index:
+            self._add_cell(win, "output_state", i,
+                           self.output_channel_state[i])
             win.addstr(" |")
         win.addstr("\n")
 
@@ -352,7 +1124,8 @@ class ManualIOTester():
                    "channel at a time.\n")
         win.addstr("  The row 'Tested' shows which channel has changed state "
                    "during this test.\n")
-        win.addstr("- The table is refreshed every second.\n")
+        win.addstr(f"- The inputs are sampled at {self.monitor.rate:.0f} Hz, "
+                   "so short pulses are also detected.\n")
         win.addstr("- After testing all channel, press the 'ESC' key to stop "
                    "the test.\n")
         win.addstr("  A summary will be presented at the end.\n")
@@ -371,53 +1144,93 @@ class ManualIOTester():
         curses.init_pair(self.red,     1, -1)  # 'N' color, red
         curses.init_pair(self.magenta, 5, -1)  # '1' color, magenta
         curses.init_pair(self.blue,    4, -1)  # '0' color, blue
-        win.timeout(1000)
+        win.timeout(max(1, int(self.refresh_interval * 1000)))
         win.clear()
         self._print_io_table(win)
-        while True:
-            try:
-                key = win.getkey()
+
+        # Only the cells which change are redrawn from here on
+        self.monitor.start()
+        try:
+            while True:
+                try:
+                    key = win.getkey()
+                except curses.error:
+                    key = None
+
                 if key == '\x1b':
                     break
-                else:
-                    try:
-                        ch = int(key)
-                        if 0 <= ch <= 7:
-                            # Toggle the output channel
-                            new_val = self.output_channel_state[ch] ^ 1
-                            self.rtm.setRtmOutputChannel(ch, value=new_val)
-                            self.output_channel_state[ch] = int(new_val)
-                            self.output_channel_tested[ch] = 'Y'
-
-                            # Update the input states
-                            self._update_input_states()
-
-                            # Refresh the I/O table
-                            win.clear()
-                            self._print_io_table(win)
-
-                    except ValueError:
-                        pass
-            except curses.error:
+
+                # The input states would be stale from here on
+                if self.monitor.error is not None:
+                    break
+
+                try:
+                    ch = int(key) if key is not None else None
+                except ValueError:
+                    ch = None
+
+                if ch is not None and 0 <= ch <= 7:
+                    # Toggle the output channel
+                    new_val = self.output_channel_state[ch] ^ 1
+                    self.rtm.setRtmOutputChannel(ch, value=new_val)
+                    self.output_channel_state[ch] = int(new_val)
+                    self.output_channel_tested[ch] = 'Y'
+
+                    self._update_cell(win, "output_state", ch, int(new_val))
+                    self._update_cell(win, "output_tested", ch, 'Y')
+
                 # Update the input states
-                self._update_input_states()
+                self._update_input_states(win)
+
+                win.refresh()
+        finally:
+            self.monitor.stop()
+
+    def _add_cell(self, win, row, ch, value):
+        """
+        Print a table cell at the cursor position, and record its position.
+        """
+
+        self.cells[(row, ch)] = win.getyx()
+        win.addstr(f"  {value}",
+                   curses.color_pair(self._cell_color(row, value)))
+
+    def _update_cell(self, win, row, ch, value):
+        """
+        Redraw a table cell.
+        """
 
-                # Refresh the I/O table
-                win.clear()
-                self._print_io_table(win)
+        y, x = self.cells[(row, ch)]
+        win.addstr(y, x, f"  {value}",
+                   curses.color_pair(self._cell_color(row, value)))
 
-    def _update_input_states(self):
+    def _cell_color(self, row, value):
         """
-        Read the inputs and update the state and tested lists.
+        Return the color pair of a table cell.
         """
 
-        # Read the input states
-        new_inputs = self.rtm.getRtmInputListBits()
+        if row.endswith("_tested"):
+            return self.green if value == "Y" else self.red
+
+        return self.magenta if value else self.blue
+
+    def _update_input_states(self, win):
+        """
+        Update the state and tested lists, and their cells, with the input
+        changes seen by the monitor since the last update.
+        """
+
+        word, changed = self.monitor.poll()
+
+        # Channels which changed, even if they are back to their previous
+        # state, have been tested
+        for ch in Bits.channels(changed):
+            state = (word >> ch) & 1
 
-        # Update the tested list
-        for i in range(self.num_input_channels):
-            if new_inputs[i] != self.input_channel_state[i]:
-                self.input_channel_tested[i] = 'Y'
+            if state != self.input_channel_state[ch]:
+                self.input_channel_state[ch] = state
+                self._update_cell(win, "input_state", ch, state)
 
-        # Update the input state list
-        self.input_channel_state = new_inputs
+            if self.input_channel_tested[ch] != 'Y':
+                self.input_channel_tested[ch] = 'Y'
+                self._update_cell(win, "input_tested", ch, 'Y')
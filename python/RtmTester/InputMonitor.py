@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+import numpy
+
+from RtmTester import Bits
+
+
+class InputMonitor():
+    """
+    Sample the RTM input word in a background thread, at a fixed rate.
+
+    The samples are stored, with their time stamps, in a ring buffer
+    holding the last 'buffer_size' samples. Every edge seen on each channel
+    is latched until it is read with 'poll()', so pulses shorter than the
+    reader's polling interval are not lost.
+    """
+
+    def __init__(self, rtm, rate=1000.0, buffer_size=65536):
+        """
+        Initialize the object. The sampling starts with 'start()'.
+        """
+
+        self.rtm = rtm
+        self.rate = rate
+        self.buffer_size = buffer_size
+
+        # Ring buffer, and total number of samples written to it
+        self.timestamps = numpy.zeros(buffer_size, dtype=numpy.float64)
+        self.words = numpy.zeros(buffer_size, dtype=numpy.uint32)
+        self.count = 0
+
+        # Last sampled word, channels which changed since the last poll(),
+        # and number of rising and falling edges per channel
+        self.word = None
+        self.changed = 0
+        self.rising = [0] * rtm.num_inputs
+        self.falling = [0] * rtm.num_inputs
+
+        # Last sampling error, if the thread stopped because of one. Any
+        # exception stops the sampling, not only the RuntimeErrors of the
+        # drivers, so that the owner can tell a dead thread from stale inputs
+        self.error = None
+
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Start sampling.
+        """
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop sampling, and wait for the thread to finish.
+        """
+
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def poll(self):
+        """
+        Return the last sampled word (None if there is no sample yet), and
+        the mask of channels which changed since the previous call.
+        """
+
+        with self.lock:
+            changed = self.changed
+            self.changed = 0
+            return self.word, changed
+
+    def samples(self):
+        """
+        Return the time stamps and words in the ring buffer, oldest first.
+        """
+
+        with self.lock:
+            n = min(self.count, self.buffer_size)
+            i = self.count % self.buffer_size
+            idx = numpy.arange(i - n, i) % self.buffer_size
+            return self.timestamps[idx], self.words[idx]
+
+    @property
+    def sample_rate(self):
+        """
+        Measured sampling rate, in samples per second, over the ring buffer.
+        """
+
+        t, _ = self.samples()
+        if len(t) < 2 or t[-1] == t[0]:
+            return 0.0
+
+        return (len(t) - 1) / (t[-1] - t[0])
+
+    def _run(self):
+        """
+        Sampling thread.
+        """
+
+        period = 1.0 / self.rate
+        read = self.rtm.getRtmInputWord
+        clock = time.monotonic
+        next_time = clock()
+
+        while not self.stop_event.is_set():
+            try:
+                w = read()
+            except Exception as e:
+                self.error = e
+                break
+            t = clock()
+
+            with self.lock:
+                i = self.count % self.buffer_size
+                self.timestamps[i] = t
+                self.words[i] = w
+                self.count += 1
+
+                if self.word is not None:
+                    diff = Bits.changed(self.word, w)
+                    if diff:
+                        self.changed |= diff
+                        self._count_edges(diff, w)
+
+                self.word = w
+
+            # Keep the sampling rate, without accumulating delays when a
+            # read takes longer than the period
+            next_time = max(next_time + period, t)
+            delay = next_time - clock()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _count_edges(self, diff, word):
+        """
+        Update the edge counters of the channels in the 'diff' mask.
+        """
+
+        for ch in Bits.channels(diff):
+            if (word >> ch) & 1:
+                self.rising[ch] += 1
+            else:
+                self.falling[ch] += 1
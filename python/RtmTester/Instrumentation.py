@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+import contextlib
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+
+from RtmTester import TesterDevice
+from RtmTester.Benchmark import latency_stats
+
+
+# Operation name of each tester device command, by its first character,
+# and of each binary protocol frame, by its opcode
+_command_names = {
+    "=": "tester.write", "?": "tester.read", "i": "tester.info",
+    "s": "tester.info", "u": "tester.info"}
+_frame_names = {
+    TesterDevice.op_write: "tester.write",
+    TesterDevice.op_read: "tester.read",
+    TesterDevice.op_write_read: "tester.write_read",
+    TesterDevice.op_seq_load: "tester.seq_load",
+    TesterDevice.op_seq_run: "tester.seq_run",
+    TesterDevice.op_seq_fetch: "tester.seq_fetch",
+    TesterDevice.op_write_timed: "tester.write_timed",
+    TesterDevice.op_read_timed: "tester.read_timed"}
+
+# Name used for the operations run outside of any test stage
+_no_stage = "(no stage)"
+
+
+class Instrumentation():
+    """
+    Opt-in counters and timers of the operations of a test run: the CPSW
+    register accesses, the tester device commands and the test stages.
+
+    Nothing is timed until objects are attached to it: attach_rtm() and
+    attach_tester() replace the register interfaces of an Rtm object and
+    the command methods of a TesterDevice object by timed wrappers, until
+    detach() is called. So, when it is not used, there is no overhead at
+    all. The stages are timed by the Orchestrator (see its
+    'instrumentation' argument), and each operation is attributed to the
+    stage running in the same thread.
+
+    The time of a stage not spent in register accesses or tester device
+    commands is spent in Python (or sleeping). With 'profile_dir', each
+    stage also runs under cProfile, and its statistics are written there,
+    to be inspected with pstats or a flame graph viewer (for example,
+    snakeviz or flameprof).
+    """
+
+    def __init__(self, profile_dir=None):
+        """
+        Initialize the object.
+        """
+
+        self.profile_dir = profile_dir
+
+        # Durations of each operation, by (stage, operation), and elapsed
+        # time of each stage, in seconds
+        self.durations = {}
+        self.stages = {}
+
+        # Stage run by each thread
+        self.local = threading.local()
+
+        # Replaced attributes, restored by detach()
+        self.patched = []
+
+    def record(self, op, duration):
+        """
+        Record the duration of an operation.
+        """
+
+        stage = getattr(self.local, 'stage', None) or _no_stage
+        self.durations.setdefault((stage, op), []).append(duration)
+
+    def timed(self, op, func):
+        """
+        Return a wrapper of 'func', recording the duration of each call as
+        the operation 'op'.
+        """
+
+        clock = time.perf_counter
+        record = self.record
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(op, clock() - start)
+
+        return wrapper
+
+    def attach_rtm(self, rtm):
+        """
+        Time the register accesses of an Rtm object.
+        """
+
+        for name in rtm.register_paths:
+            handle = getattr(rtm, name, None)
+            if handle is not None:
+                self._patch(rtm, name, self.TimedRegister(handle, self, name))
+
+    def attach_tester(self, tester_device):
+        """
+        Time the commands of a TesterDevice object.
+        """
+
+        send = tester_device.sendCommand
+        send_binary = tester_device.sendBinary
+        send_binary_many = tester_device.sendBinaryMany
+        clock = time.perf_counter
+        record = self.record
+
+        def send_command(command, *args, **kwargs):
+            start = clock()
+            try:
+                return send(command, *args, **kwargs)
+            finally:
+                record(_command_names.get(command[:1], "tester.other"),
+                       clock() - start)
+
+        def send_binary_timed(frame, *args, **kwargs):
+            start = clock()
+            try:
+                return send_binary(frame, *args, **kwargs)
+            finally:
+                record(_frame_names.get(frame[0], "tester.other"),
+                       clock() - start)
+
+        # The frames of a call are in flight at the same time, so the call
+        # is recorded as a single operation, named after its first frame
+        def send_binary_many_timed(frames, *args, **kwargs):
+            start = clock()
+            try:
+                return send_binary_many(frames, *args, **kwargs)
+            finally:
+                op = frames[0][0] if frames else None
+                record(_frame_names.get(op, "tester.other"),
+                       clock() - start)
+
+        self._patch(tester_device, "sendCommand", send_command)
+        self._patch(tester_device, "sendBinary", send_binary_timed)
+        self._patch(tester_device, "sendBinaryMany", send_binary_many_timed)
+        self._patch(tester_device, "sendCommands", self.timed(
+            "tester.sendCommands", tester_device.sendCommands))
+
+    def detach(self):
+        """
+        Restore all the attributes replaced by the attach methods.
+        """
+
+        for obj, name, value in reversed(self.patched):
+            if value is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, value)
+
+        self.patched = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager timing a stage run in the current thread, and
+        profiling it if enabled.
+        """
+
+        profiler = None
+        if self.profile_dir is not None:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Only one profiler can be active at a time in recent
+                # Python versions, so concurrent stages are not profiled
+                print(f"Stage '{name}' not profiled: another stage is being "
+                      "profiled")
+                profiler = None
+
+        self.local.stage = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.perf_counter() - start
+            self.local.stage = None
+
+            if profiler is not None:
+                profiler.disable()
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(
+                    self.profile_dir,
+                    re.sub(r'[^\w.-]', '_', name) + ".prof"))
+
+    def report(self):
+        """
+        Return the timing breakdown: for each stage, its elapsed time, the
+        statistics of each operation, and the time spent in register
+        accesses, tester device commands, and the rest.
+        """
+
+        report = {}
+        for (stage, op), durations in sorted(self.durations.items()):
+            s = report.setdefault(stage, {"elapsed": None, "operations": {}})
+            s["operations"][op] = latency_stats(durations)
+
+        for stage, elapsed in self.stages.items():
+            report.setdefault(stage, {"operations": {}})["elapsed"] = elapsed
+
+        for s in report.values():
+            ops = s["operations"]
+            s["cpsw"] = sum(v["total"] for k, v in ops.items()
+                            if k.startswith("cpsw."))
+            s["tester"] = sum(v["total"] for k, v in ops.items()
+                              if k.startswith("tester."))
+            if s["elapsed"] is not None:
+                s["other"] = s["elapsed"] - s["cpsw"] - s["tester"]
+
+        return report
+
+    def print_report(self):
+        """
+        Print the timing breakdown.
+        """
+
+        print("*************************")
+        print("***  Timing breakdown: ***")
+        print("*************************")
+        print("")
+
+        for stage, s in self.report().items():
+            print(f"Stage: {stage}")
+            if s["elapsed"] is not None:
+                print(f"  Elapsed: {s['elapsed']:.3f} s, CPSW: "
+                      f"{s['cpsw']:.3f} s, tester device: {s['tester']:.3f} s, "
+                      f"other (Python, sleeps): {s['other']:.3f} s")
+            print("  ---------------------------------------------------------"
+                  "-------------")
+            print(f"  {'Operation':36} | {'Count':>7} | {'Mean (us)':>9} | "
+                  f"{'p99 (us)':>9}")
+            print("  ---------------------------------------------------------"
+                  "-------------")
+            for op, v in s["operations"].items():
+                print(f"  {op:36} | {v['count']:7} | {v['mean'] * 1e6:9.1f} | "
+                      f"{v['p99'] * 1e6:9.1f}")
+            print("  ---------------------------------------------------------"
+                  "-------------")
+            print("")
+
+    def write_report(self, file_name):
+        """
+        Write the timing breakdown to a JSON file.
+        """
+
+        with open(file_name, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def _patch(self, obj, name, value):
+        """
+        Replace an attribute of an object, remembering the original value
+        (None if it was not an instance attribute, like a method).
+        """
+
+        self.patched.append((obj, name, vars(obj).get(name)))
+        setattr(obj, name, value)
+
+    class TimedRegister():
+        """
+        Wrapper of a register interface (a CPSW ScalVal, ScalVal_RO or
+        Command object), timing its getVal(), setVal() and execute() calls.
+        """
+
+        def __init__(self, handle, instrumentation, name):
+            """
+            Initialize the object.
+            """
+
+            self.handle = handle
+            for method in ["getVal", "setVal", "execute"]:
+                if hasattr(handle, method):
+                    setattr(self, method, instrumentation.timed(
+                        f"cpsw.{method} {name}", getattr(handle, method)))
+
+        def __getattr__(self, name):
+            """
+            Forward everything else to the register interface.
+            """
+
+            return getattr(self.handle, name)
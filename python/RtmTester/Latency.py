@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import time
+
+import numpy
+
+from RtmTester import Bits
+
+
+# Default histogram bin edges, in seconds: one bin per decade, from 10 us
+# to 100 ms, plus the underflow and overflow bins
+default_bin_edges = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1]
+
+
+class ChannelLatency():
+    """
+    Per-channel propagation latency samples, histograms and statistics.
+    """
+
+    def __init__(self, width, bin_edges=default_bin_edges):
+        """
+        Initialize the object.
+        """
+
+        self.width = width
+        self.bin_edges = numpy.asarray(bin_edges, dtype=numpy.float64)
+
+        # Latency samples of each channel, in seconds
+        self.samples = [[] for _ in range(width)]
+
+        # Number of stimuli where each channel did not change before the
+        # timeout
+        self.timeouts = numpy.zeros(width, dtype=numpy.int64)
+
+    def add(self, channel, latency):
+        """
+        Add a latency sample to a channel.
+        """
+
+        self.samples[channel].append(latency)
+
+    def histogram(self, channel):
+        """
+        Return the number of samples of a channel in each bin: below the
+        first edge, between each pair of edges, and above the last edge.
+        """
+
+        return numpy.bincount(
+            numpy.searchsorted(self.bin_edges, self.samples[channel],
+                               side='right'),
+            minlength=len(self.bin_edges) + 1)
+
+    def percentile(self, channel, q):
+        """
+        Return a percentile of the latency of a channel (NaN if there are
+        no samples).
+        """
+
+        if not self.samples[channel]:
+            return numpy.nan
+
+        return float(numpy.percentile(self.samples[channel], q))
+
+    def max(self, channel):
+        """
+        Return the maximum latency of a channel (NaN if there are no
+        samples).
+        """
+
+        return self.percentile(channel, 100)
+
+    def settle_time(self):
+        """
+        Return the minimum safe settle time: the maximum latency seen on any
+        channel (NaN if there are no samples).
+        """
+
+        m = [self.max(ch) for ch in range(self.width)
+             if self.samples[ch]]
+
+        return max(m) if m else numpy.nan
+
+    def degraded_channels(self, factor=2.0, margin=50e-6):
+        """
+        Return the list of channels which timed out, or with a median
+        latency more than 'factor' times, and 'margin' seconds over, the
+        median latency of all the channels. The margin keeps the timing
+        jitter of very fast channels from flagging them.
+        """
+
+        p50 = numpy.array([self.percentile(ch, 50)
+                           for ch in range(self.width)])
+
+        if numpy.isnan(p50).all():
+            return numpy.flatnonzero(self.timeouts).tolist()
+
+        median = numpy.nanmedian(p50)
+        limit = max(factor * median, median + margin)
+
+        return numpy.flatnonzero(
+            (self.timeouts > 0) | (p50 > limit)).tolist()
+
+
+def timed_write(write):
+    """
+    Return a wrapper of the function 'write', returning the time (as
+    returned by time.monotonic()) at which it applied its word, for
+    measure(). It is taken as the middle of the call, as the driver applies
+    the word somewhere within its round trip: the error can reach half the
+    round trip time of the call.
+    """
+
+    def timed(w):
+        start = time.monotonic()
+        write(w)
+        return (start + time.monotonic()) / 2
+
+    return timed
+
+
+def timed_read(read):
+    """
+    Return a wrapper of the function 'read', returning the word read and
+    the time at which it was sampled, for measure(), taken as in
+    timed_write().
+    """
+
+    def timed():
+        start = time.monotonic()
+        r = read()
+        return r, (start + time.monotonic()) / 2
+
+    return timed
+
+
+def measure(write, read, words, latency, initial_word=0, timeout=0.1):
+    """
+    Measure the propagation latency of each channel.
+
+    For each word, 'write' drives it, and returns the time (as returned by
+    time.monotonic()) at which the driver applied it. Then 'read', which
+    returns the word read and the time at which it was sampled, is called
+    until all the channels which changed read their new value, or until
+    'timeout' seconds have passed. The latency of a channel is the time from
+    the write to the first read returning its new value, so the error of
+    both times adds to it (see timed_write() and TesterDevice.
+    writeOutputsTimed()). The samples are added to the ChannelLatency object
+    'latency'. Return the number of words tested.
+    """
+
+    previous = initial_word
+    words = numpy.asarray(words).tolist()
+
+    for n, w in enumerate(words):
+        try:
+            t0 = write(w)
+
+            pending = Bits.changed(previous, w)
+            deadline = time.monotonic() + timeout
+
+            while pending:
+                r, t = read()
+
+                done = pending & ~Bits.changed(r, w)
+                if done:
+                    pending &= ~done
+                    for ch in Bits.channels(done):
+                        latency.add(ch, t - t0)
+
+                if time.monotonic() >= deadline:
+                    break
+
+        except RuntimeError as e:
+            print(f"Latency measurement failed on word {w}. {e}")
+            return n
+
+        # Channels which did not follow in time
+        for ch in Bits.channels(pending):
+            latency.timeouts[ch] += 1
+
+        previous = w
+
+    return len(words)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import time
+
+import numpy
+
+from RtmTester import Patterns
+
+
+class MessageCheck():
+    """
+    Check of the MPS message input path: the RTM input pins, as seen by the
+    FPGA (RtmDin), must reach the input bits of the MPS digital message
+    (MpsDigitalMessage/RegInputBits), after the debounce time, inverted
+    where the polarity of the active timing mode (L1Polarity or L2Polarity)
+    is set. The timing mode must not change during the check.
+
+    It runs in the same pass as the input test: after each input vector,
+    sample() samples both words, back to back, until they match or the
+    'window' expires. The pairs of words are then compared all at once, by
+    errors(). The input bits of the message are compared with the input
+    pins, and not with the driven vector, so a pin fault is not reported
+    again here.
+    """
+
+    def __init__(self, rtm, window):
+        """
+        Initialize the object.
+        """
+
+        self.window = window
+        self.read_pins = rtm.getRtmInputWord
+        self.read_message = rtm.getMpsInputWord
+
+        self.width = rtm.num_inputs
+
+        # Number of input channels carried by the message. Channels out of
+        # the message are not waited for, but still fail in errors().
+        self.message_width = min(self.width, 8 * rtm.getMpsDigitalBytes())
+        self.mask = (1 << self.message_width) - 1
+
+        # Polarity bits of the active timing mode
+        self.polarity = rtm.getMpsPolarity() & self.mask
+
+        # Last pair of words sampled after each vector, and the time it
+        # took for them to match (NaN if they did not)
+        self.pins = []
+        self.messages = []
+        self.settle_times = []
+
+    def sample(self, pins):
+        """
+        Sample the message input bits, and the input pins again, until they
+        match or the window expires. 'pins' is the input pins word just read
+        by the input test.
+        """
+
+        clock = time.monotonic
+        read_pins = self.read_pins
+        read_message = self.read_message
+        mask = self.mask
+        polarity = self.polarity
+
+        start = clock()
+        message = read_message()
+        settle = 0.0
+        while (message ^ pins ^ polarity) & mask:
+            settle = clock() - start
+            if settle > self.window:
+                settle = numpy.nan
+                break
+            pins = read_pins()
+            message = read_message()
+
+        self.pins.append(pins)
+        self.messages.append(message)
+        self.settle_times.append(settle)
+
+    def errors(self):
+        """
+        Return the per-channel error statistics of the message input bits.
+        """
+
+        return Patterns.ChannelErrors(
+            expected=[pins ^ self.polarity for pins in self.pins],
+            observed=self.messages,
+            width=self.width)
+
+    def max_settle_time(self):
+        """
+        Return the longest time the message input bits took to match the
+        input pins, in seconds, on the vectors where they matched (None if
+        they never matched).
+        """
+
+        t = numpy.asarray(self.settle_times, dtype=numpy.float64)
+        t = t[~numpy.isnan(t)]
+        if not t.size:
+            return None
+
+        return float(t.max())
+
+    def unmatched_vectors(self):
+        """
+        Return the number of vectors where the message input bits did not
+        match the input pins within the window.
+        """
+
+        return int(numpy.isnan(
+            numpy.asarray(self.settle_times, dtype=numpy.float64)).sum())
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+import asyncio
+import concurrent.futures
+import contextlib
+import sys
+import threading
+import time
+
+from RtmTester.Helpers import print_ok, print_failed
+
+
+class Stage():
+    """
+    A test stage, run by the Orchestrator.
+
+    'run' is a callable returning True if the stage passed. The stage starts
+    only after all the stages named in 'depends_on' have passed, and holds
+    the locks of all the 'resources' it uses (for example, a group of
+    registers) while it runs.
+    """
+
+    def __init__(self, name, run, depends_on=(), resources=()):
+        """
+        Initialize the object.
+        """
+
+        self.name = name
+        self.run = run
+        self.depends_on = list(depends_on)
+        self.resources = sorted(resources)
+
+        # Stage status, updated by the Orchestrator
+        self.status = "NOT RUN"
+        self.result = None
+        self.elapsed = None
+
+
+class Orchestrator():
+    """
+    Run test stages concurrently, respecting the dependencies between them
+    and the locks on the resources they share.
+
+    Each stage runs in its own worker thread. The output printed by a stage
+    is held until the stage finishes, and then printed as a whole, so the
+    output of concurrent stages is not interleaved.
+
+    If 'instrumentation' is given (see RtmTester.Instrumentation), each
+    stage is timed, and profiled if enabled, by it.
+    """
+
+    def __init__(self, stages, instrumentation=None):
+        """
+        Initialize the object.
+        """
+
+        self.instrumentation = instrumentation
+
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise RuntimeError(f"Duplicated stage name '{stage.name}'")
+            self.stages[stage.name] = stage
+
+        # Check the dependencies
+        for stage in self.stages.values():
+            for dep in stage.depends_on:
+                if dep not in self.stages:
+                    raise RuntimeError(
+                        f"Stage '{stage.name}' depends on unknown "
+                        f"stage '{dep}'")
+
+        self._check_cycles()
+
+    def run(self):
+        """
+        Run all the stages, and print a summary. Return True if all the
+        stages passed.
+        """
+
+        # When the output is already captured for the whole process (see
+        # RtmTester.Agent, which runs several orchestrators at the same
+        # time), it is used as it is
+        installed = isinstance(sys.stdout, self.StageOutput)
+        output = sys.stdout if installed else self.StageOutput(sys.stdout)
+        sys.stdout = output
+        try:
+            start = time.monotonic()
+            asyncio.run(self._run_all(output))
+            elapsed = time.monotonic() - start
+        finally:
+            if not installed:
+                sys.stdout = output.stream
+
+        self._print_summary(elapsed)
+
+        return all(s.status == "PASSED" for s in self.stages.values())
+
+    async def _run_all(self, output):
+        """
+        Create a task for each stage, and wait for all of them.
+        """
+
+        locks = {}
+        for stage in self.stages.values():
+            for r in stage.resources:
+                locks.setdefault(r, asyncio.Lock())
+
+        tasks = {}
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self.stages) or 1)
+
+        try:
+            # Tasks are created in dependency order, so each stage can wait
+            # for the tasks of the stages it depends on
+            for stage in self._sorted_stages():
+                tasks[stage.name] = asyncio.ensure_future(
+                    self._run_stage(stage, tasks, locks, executor, output))
+
+            await asyncio.gather(*tasks.values())
+        finally:
+            executor.shutdown(wait=True)
+
+    async def _run_stage(self, stage, tasks, locks, executor, output):
+        """
+        Wait for the dependencies of a stage, and then run it in a worker
+        thread, holding its resource locks.
+        """
+
+        for dep in stage.depends_on:
+            await tasks[dep]
+
+        failed = [d for d in stage.depends_on
+                  if self.stages[d].status != "PASSED"]
+        if failed:
+            stage.status = "SKIPPED"
+            print(f"Stage '{stage.name}' skipped, as it depends on failed "
+                  f"stages: {', '.join(failed)}")
+            print("")
+            return
+
+        # Locks are always acquired in the same (sorted) order, to avoid
+        # dead locks between stages
+        for r in stage.resources:
+            await locks[r].acquire()
+
+        try:
+            loop = asyncio.get_running_loop()
+            stage.result, text, stage.elapsed = await loop.run_in_executor(
+                executor, self._call, stage, output, self.instrumentation)
+        finally:
+            for r in stage.resources:
+                locks[r].release()
+
+        stage.status = "PASSED" if stage.result else "FAILED"
+
+        # Print the whole output of the stage at once
+        output.stream.write(text)
+        output.stream.flush()
+
+    @staticmethod
+    def _call(stage, output, instrumentation=None):
+        """
+        Run a stage in the current thread, capturing its output.
+        Return the stage result, its output, and its duration.
+        """
+
+        output.local.buffer = []
+        start = time.monotonic()
+        try:
+            if instrumentation is None:
+                timer = contextlib.nullcontext()
+            else:
+                timer = instrumentation.stage(stage.name)
+            with timer:
+                result = stage.run()
+        except (Exception, SystemExit) as e:
+            print(f"Stage '{stage.name}' aborted: {e!r}")
+            result = False
+        finally:
+            elapsed = time.monotonic() - start
+            text = ''.join(output.local.buffer)
+            output.local.buffer = None
+
+        return result, text, elapsed
+
+    def _sorted_stages(self):
+        """
+        Return the list of stages, sorted so that each stage comes after
+        the stages it depends on.
+        """
+
+        done = []
+
+        def visit(stage):
+            if stage in done:
+                return
+            for dep in stage.depends_on:
+                visit(self.stages[dep])
+            done.append(stage)
+
+        for stage in self.stages.values():
+            visit(stage)
+
+        return done
+
+    def _check_cycles(self):
+        """
+        Raise an exception if the stage dependencies have cycles.
+        """
+
+        visiting = set()
+        visited = set()
+
+        def visit(name, path):
+            if name in visited:
+                return
+            if name in visiting:
+                raise RuntimeError(
+                    "Circular stage dependency: " + " -> ".join(path))
+            visiting.add(name)
+            for dep in self.stages[name].depends_on:
+                visit(dep, path + [dep])
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name, [name])
+
+    def _print_summary(self, elapsed):
+        """
+        Print the result and duration of each stage.
+        """
+
+        print("*************************")
+        print("***   Stage summary:  ***")
+        print("*************************")
+        print("")
+        print("-------------------------------------------------")
+        print("Stage                | Result     | Duration (s)")
+        print("-------------------------------------------------")
+        for stage in self.stages.values():
+            print(f"{stage.name:20} | ", end="")
+            if stage.status == "PASSED":
+                print_ok(f"{stage.status:10}", end="")
+            else:
+                print_failed(f"{stage.status:10}", end="")
+            if stage.elapsed is None:
+                print(" |")
+            else:
+                print(f" | {stage.elapsed:12.3f}")
+        print("-------------------------------------------------")
+        print(f"Total duration: {elapsed:.3f} s")
+        print("")
+
+    class StageOutput():
+        """
+        Replacement for sys.stdout, which holds the output written by a
+        worker thread running a stage in a per-thread buffer. Output from
+        other threads goes directly to the original stream.
+        """
+
+        def __init__(self, stream):
+            """
+            Initialize the object.
+            """
+
+            self.stream = stream
+            self.local = threading.local()
+
+        def write(self, s):
+            """
+            Write to the buffer of the current thread, if any.
+            """
+
+            buffer = getattr(self.local, 'buffer', None)
+            if buffer is None:
+                return self.stream.write(s)
+
+            buffer.append(s)
+            return len(s)
+
+        def flush(self):
+            """
+            Flush the original stream, if not buffering.
+            """
+
+            if getattr(self.local, 'buffer', None) is None:
+                self.stream.flush()
+
+        def __getattr__(self, name):
+            """
+            Forward everything else to the original stream.
+            """
+
+            return getattr(self.stream, name)
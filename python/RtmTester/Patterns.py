@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+import numpy
+
+from RtmTester import Bits
+
+
+# Galois LFSR feedback taps for x^32 + x^22 + x^2 + x + 1 (maximal length)
+lfsr_taps = 0x80200003
+
+# Number of LFSR steps between consecutive pseudo-random vectors, so that
+# each vector is made of fresh bits from the sequence
+lfsr_stride = 32
+
+
+def walking_one(width):
+    """
+    Walking-one pattern: a single bit set, moving across all the channels.
+    """
+
+    return numpy.left_shift(1, numpy.arange(width, dtype=numpy.uint32),
+                            dtype=numpy.uint32)
+
+
+def walking_zero(width):
+    """
+    Walking-zero pattern: a single bit cleared, moving across all the
+    channels.
+    """
+
+    return walking_one(width) ^ numpy.uint32(_mask(width))
+
+
+def checkerboard(width):
+    """
+    Checkerboard pattern: alternating bits, and their complement.
+    """
+
+    mask = _mask(width)
+
+    return numpy.array([0x55555555 & mask, 0xAAAAAAAA & mask],
+                       dtype=numpy.uint32)
+
+
+def exhaustive(width):
+    """
+    Exhaustive pattern: all the possible values.
+
+    For more than 8 channels, testing all the values is not practical, so
+    each group of 8 channels goes through all its possible values in turn,
+    with the rest of the channels low.
+    """
+
+    if width <= 8:
+        return numpy.arange(2**width, dtype=numpy.uint32)
+
+    values = numpy.arange(256, dtype=numpy.uint32)
+    lanes = [values << numpy.uint32(8 * i) for i in range((width + 7) // 8)]
+
+    return numpy.concatenate(lanes) & numpy.uint32(_mask(width))
+
+
+def lfsr(width, n, seed=1):
+    """
+    Pseudo-random pattern: 'n' vectors taken from a 32-bit maximal length
+    LFSR sequence, starting from 'seed'.
+
+    The sequence is generated without stepping the LFSR one vector at a
+    time: as the LFSR is linear, the states are produced by repeatedly
+    doubling the array of known states, applying the jump-ahead map to the
+    whole array at once.
+    """
+
+    if not (seed & 0xFFFFFFFF):
+        raise RuntimeError("The LFSR seed can not be zero")
+
+    # Map advancing the LFSR by one step, as the images of each state bit
+    cols = numpy.array([lfsr_taps] + [1 << i for i in range(31)],
+                       dtype=numpy.uint32)
+
+    # Map advancing the LFSR by one vector
+    step = cols
+    for _ in range(lfsr_stride.bit_length() - 1):
+        step = _apply(step, step)
+
+    # Generate the states, doubling the array on each iteration
+    states = numpy.array([seed & 0xFFFFFFFF], dtype=numpy.uint32)
+    while len(states) < n:
+        states = numpy.concatenate((states, _apply(step, states)))
+        step = _apply(step, step)
+
+    return states[:n] & numpy.uint32(_mask(width))
+
+
+# Available patterns. Each one is a function of the channel width and the
+# number of pseudo-random vectors requested, and returns an array of words.
+patterns = {
+    'walking_one':  lambda width, n, seed: walking_one(width),
+    'walking_zero': lambda width, n, seed: walking_zero(width),
+    'checkerboard': lambda width, n, seed: checkerboard(width),
+    'exhaustive':   lambda width, n, seed: exhaustive(width),
+    'random':       lambda width, n, seed: lfsr(width, n, seed),
+}
+
+
+def build_sequence(names, width, iterations=1, random_vectors=1024, seed=1):
+    """
+    Build a test vector sequence from a list of pattern names.
+
+    The whole set of patterns is repeated 'iterations' times. Each
+    repetition of the 'random' pattern continues the LFSR sequence, so
+    no pseudo-random vector is repeated.
+    """
+
+    for name in names:
+        if name not in patterns:
+            raise RuntimeError(f"Unknown test pattern '{name}'")
+
+    seq = []
+    for _ in range(iterations):
+        for name in names:
+            seq.append(patterns[name](width, random_vectors, seed))
+
+            # Continue the LFSR sequence on the next repetition
+            if name == 'random':
+                seed = int(lfsr(32, random_vectors + 1, seed)[-1])
+
+    if not seq:
+        return numpy.empty(0, dtype=numpy.uint32)
+
+    return numpy.concatenate(seq).astype(numpy.uint32)
+
+
+class ChannelErrors():
+    """
+    Per-channel error statistics of a test vector sequence, comparing the
+    expected and observed words of all the vectors at once.
+    """
+
+    def __init__(self, expected, observed, width, tested=None,
+                 chunk_size=65536):
+        """
+        Initialize the object.
+
+        'tested' optionally marks, with a boolean array, the vectors that
+        were actually tested (for example, not the ones whose commands
+        failed). The other vectors are not compared, and the channels
+        without errors are then reported as incomplete.
+        """
+
+        expected = numpy.asarray(expected, dtype=numpy.uint32)
+        observed = numpy.asarray(observed, dtype=numpy.uint32)
+
+        self.expected = expected
+        self.observed = observed
+
+        # Index of each compared vector in the sequence
+        index = None
+        self.untested = 0
+        if tested is not None:
+            index = numpy.flatnonzero(numpy.asarray(tested, dtype=bool))
+            self.untested = len(expected) - len(index)
+            expected = expected[index]
+            observed = observed[index]
+
+        mask = numpy.uint32(_mask(width))
+
+        self.width = width
+        self.num_vectors = len(expected)
+
+        # Number of vectors where each channel was expected high
+        self.expected_high = numpy.zeros(width, dtype=numpy.int64)
+
+        # Number of vectors where each channel read low while expected high
+        self.stuck_low = numpy.zeros(width, dtype=numpy.int64)
+
+        # Number of vectors where each channel read high while expected low
+        self.stuck_high = numpy.zeros(width, dtype=numpy.int64)
+
+        # Index of the first vector failing on each channel (-1 if none)
+        self.first_error = numpy.full(width, -1, dtype=numpy.int64)
+
+        # Process the vectors in chunks to bound the memory used by the
+        # unpacked bits
+        for start in range(0, self.num_vectors, chunk_size):
+            e = expected[start:start + chunk_size] & mask
+            o = observed[start:start + chunk_size] & mask
+            diff = e ^ o
+
+            self.expected_high += _bit_counts(e, width)
+
+            # Skip the chunk quickly if all the vectors matched
+            if not diff.any():
+                continue
+
+            self.stuck_low += _bit_counts(diff & e, width)
+            self.stuck_high += _bit_counts(diff & o, width)
+
+            # Update the first error index of the channels failing for the
+            # first time in this chunk
+            bits = Bits.unpack(diff, width)
+            new = (self.first_error < 0) & bits.any(axis=0)
+            self.first_error[new] = start + bits[:, new].argmax(axis=0)
+
+        self.errors = self.stuck_low + self.stuck_high
+
+        # Refer the first errors to the whole sequence
+        if index is not None:
+            failed = self.first_error >= 0
+            self.first_error[failed] = index[self.first_error[failed]]
+
+    def result(self, channel):
+        """
+        Return the test result string of a channel.
+        """
+
+        if not self.errors[channel]:
+            return "INCOMPLETE" if self.untested else "PASSED"
+
+        expected_low = self.num_vectors - self.expected_high[channel]
+
+        # The channel never followed the stimulus in one direction
+        if not self.stuck_high[channel] and \
+                self.stuck_low[channel] == self.expected_high[channel]:
+            return "FAILED (stuck-at-0)"
+
+        if not self.stuck_low[channel] and \
+                self.stuck_high[channel] == expected_low:
+            return "FAILED (stuck-at-1)"
+
+        return "FAILED"
+
+    def failed_channels(self):
+        """
+        Return the list of failing channels.
+        """
+
+        return numpy.flatnonzero(self.errors).tolist()
+
+
+def _mask(width):
+    """
+    Return the word mask for a number of channels.
+    """
+
+    return (1 << width) - 1
+
+
+def _bit_counts(words, width):
+    """
+    Return the number of words with each bit set.
+    """
+
+    return Bits.unpack(words, width).sum(axis=0, dtype=numpy.int64)
+
+
+def _apply(cols, words):
+    """
+    Apply the GF(2) linear map defined by the images of each bit 'cols' to
+    an array of 32-bit words.
+    """
+
+    words = numpy.asarray(words, dtype=numpy.uint32)
+    r = numpy.zeros(words.shape, dtype=numpy.uint32)
+
+    # Byte-wise lookup tables of the map
+    v = numpy.arange(256, dtype=numpy.uint32)
+    for byte in range(4):
+        table = numpy.zeros(256, dtype=numpy.uint32)
+        for bit in range(8):
+            table[((v >> bit) & 1).astype(bool)] ^= cols[8 * byte + bit]
+        r ^= table[(words >> (8 * byte)) & 0xFF]
+
+    return r
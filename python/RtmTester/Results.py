@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+import json
+import sqlite3
+import threading
+import time
+
+
+# Database schema. Results are only appended; the indexes cover the board
+# history and channel failure rate queries.
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    start_time REAL,
+    end_time REAL,
+    crate_id TEXT,
+    slot INTEGER,
+    fw_githash TEXT,
+    rtm_serial TEXT,
+    status TEXT,
+    config TEXT);
+CREATE INDEX IF NOT EXISTS runs_serial ON runs (rtm_serial, start_time);
+CREATE INDEX IF NOT EXISTS runs_slot ON runs (crate_id, slot, start_time);
+CREATE INDEX IF NOT EXISTS runs_fw ON runs (fw_githash, start_time);
+
+CREATE TABLE IF NOT EXISTS vectors (
+    run_id INTEGER,
+    direction TEXT,
+    idx INTEGER,
+    expected INTEGER,
+    observed INTEGER);
+CREATE INDEX IF NOT EXISTS vectors_run ON vectors (run_id, direction, idx);
+
+CREATE TABLE IF NOT EXISTS channels (
+    run_id INTEGER,
+    direction TEXT,
+    channel INTEGER,
+    vectors INTEGER,
+    errors INTEGER,
+    result TEXT);
+CREATE INDEX IF NOT EXISTS channels_channel
+    ON channels (direction, channel, run_id);
+
+CREATE TABLE IF NOT EXISTS measurements (
+    run_id INTEGER,
+    name TEXT,
+    channel INTEGER,
+    value REAL);
+CREATE INDEX IF NOT EXISTS measurements_name
+    ON measurements (name, channel, run_id);
+CREATE INDEX IF NOT EXISTS measurements_run ON measurements (run_id);
+"""
+
+
+class ResultStore():
+    """
+    On-disk store of the test results, in an SQLite database.
+
+    Each test run is keyed by the crate ID, slot number, FPGA firmware
+    githash and RTM serial number, and its records (test vectors, channel
+    results and measurements) are written as they are produced. Several
+    test processes in the same node can write to the same database (it
+    should not be placed on a network file system).
+    """
+
+    def __init__(self, file_name, timeout=30.0):
+        """
+        Open the database, creating it if needed.
+        """
+
+        self.file_name = file_name
+        self.db = sqlite3.connect(
+            file_name, timeout=timeout, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+
+        # The test stages run in several threads
+        self.lock = threading.Lock()
+
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.executescript(_schema)
+            self.db.commit()
+
+    def close(self):
+        """
+        Close the database.
+        """
+
+        with self.lock:
+            self.db.close()
+
+    def start_run(self, crate_id=None, slot=None, fw_githash=None,
+                  rtm_serial=None, config=None):
+        """
+        Record the start of a test run, and return its ResultRun object.
+        """
+
+        with self.lock:
+            c = self.db.execute(
+                "INSERT INTO runs (start_time, crate_id, slot, fw_githash, "
+                "rtm_serial, status, config) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), crate_id, slot, fw_githash, rtm_serial,
+                 "RUNNING", json.dumps(config or {})))
+            self.db.commit()
+
+        return ResultRun(self, c.lastrowid)
+
+    def _insert(self, table, rows, commit=True):
+        """
+        Insert rows in a table.
+        """
+
+        if not rows:
+            return
+
+        placeholders = ", ".join("?" * len(rows[0]))
+        with self.lock:
+            self.db.executemany(
+                f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            if commit:
+                self.db.commit()
+
+    def _execute(self, query, args=()):
+        """
+        Execute a statement and commit it.
+        """
+
+        with self.lock:
+            self.db.execute(query, args)
+            self.db.commit()
+
+    def _query(self, query, args=()):
+        """
+        Run a query, and return the rows as dictionaries.
+        """
+
+        with self.lock:
+            return [dict(r) for r in self.db.execute(query, args)]
+
+    def board_history(self, rtm_serial=None, crate_id=None, slot=None,
+                      limit=None):
+        """
+        Return the test runs of a board, selected by RTM serial number, or
+        by crate ID and slot, most recent first.
+        """
+
+        where = []
+        args = []
+        for column, value in [("rtm_serial", rtm_serial),
+                              ("crate_id", crate_id),
+                              ("slot", slot)]:
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+
+        query = "SELECT * FROM runs"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY start_time DESC"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+
+        return self._query(query, args)
+
+    def channel_failure_rate(self, direction, channel=None, since=None):
+        """
+        Return, for each channel of a direction ("input" or "output"), the
+        number of runs it was tested in, the number of runs it failed, and
+        the failure rate. Only the runs started after the 'since' time
+        stamp are counted, if given.
+        """
+
+        query = "SELECT channel, COUNT(*) AS runs, " \
+                "SUM(errors > 0) AS failed FROM channels"
+        where = ["direction = ?"]
+        args = [direction]
+
+        if channel is not None:
+            where.append("channel = ?")
+            args.append(channel)
+
+        if since is not None:
+            where.append(
+                "run_id IN (SELECT id FROM runs WHERE start_time >= ?)")
+            args.append(since)
+
+        query += " WHERE " + " AND ".join(where) + \
+            " GROUP BY channel ORDER BY channel"
+
+        rows = self._query(query, args)
+        for r in rows:
+            r["rate"] = r["failed"] / r["runs"] if r["runs"] else 0.0
+
+        return rows
+
+    def run_vectors(self, run_id, direction):
+        """
+        Return the test vectors of a run, in order.
+        """
+
+        return self._query(
+            "SELECT idx, expected, observed FROM vectors "
+            "WHERE run_id = ? AND direction = ? ORDER BY idx",
+            (run_id, direction))
+
+
+class ResultRun():
+    """
+    Recorder of the results of a test run, created by
+    ResultStore.start_run().
+    """
+
+    def __init__(self, store, run_id):
+        """
+        Initialize the object.
+        """
+
+        self.store = store
+        self.id = run_id
+
+    def vector_stream(self, direction, chunk_size=256):
+        """
+        Return a VectorStream, to record the test vectors of a direction.
+        """
+
+        return VectorStream(self, direction, chunk_size)
+
+    def add_channel_results(self, direction, errors):
+        """
+        Record the per-channel results of a direction, from a
+        Patterns.ChannelErrors object.
+        """
+
+        self.store._insert("channels", [
+            (self.id, direction, ch, errors.num_vectors,
+             int(errors.errors[ch]), errors.result(ch))
+            for ch in range(errors.width)])
+
+    def add_measurement(self, name, value, channel=None):
+        """
+        Record a measurement, optionally for a channel.
+        """
+
+        self.add_measurements(name, [(channel, value)])
+
+    def add_measurements(self, name, values):
+        """
+        Record a list of (channel, value) measurements.
+        """
+
+        self.store._insert("measurements", [
+            (self.id, name, ch, None if v is None else float(v))
+            for ch, v in values])
+
+    def finish(self, status):
+        """
+        Record the end of the run, and its status.
+        """
+
+        self.store._execute(
+            "UPDATE runs SET end_time = ?, status = ? WHERE id = ?",
+            (time.time(), status, self.id))
+
+
+class VectorStream():
+    """
+    Record the test vectors of a direction, as they are tested. The
+    vectors are written in chunks of 'chunk_size'.
+    """
+
+    def __init__(self, run, direction, chunk_size=256):
+        """
+        Initialize the object.
+        """
+
+        self.run = run
+        self.direction = direction
+        self.chunk_size = chunk_size
+        self.rows = []
+
+    def add(self, index, expected, observed):
+        """
+        Record a test vector.
+        """
+
+        self.rows.append((self.run.id, self.direction, index,
+                          int(expected), int(observed)))
+
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending vectors.
+        """
+
+        self.run.store._insert("vectors", self.rows)
+        self.rows = []
@@ -1,8 +1,9 @@
 #!/usr/bin/env python3
 
-from RtmTester.Helpers import print_ok
+import numpy
 
-from pycpsw import Path, ScalVal, ScalVal_RO, YamlFixup
+from RtmTester import Bits
+from RtmTester.Crate import get_mcs_githash
 
 
 class Rtm():
@@ -11,49 +12,188 @@ class Rtm():
     AMCc FPGA.
 
     This class crates an interface to the ATCA AMC carrier FPGA register space,
-    using CPSW, for testing the MPS RTM board.
+    using CPSW, for testing the MPS RTM board. The register access is done
+    through a backend object, so a simulated register model can be used
+    instead (see RtmTester.Simulator).
     """
-    def __init__(self, yaml_file, ip_addr, root_name="NetIODev"):
+    # CPSW paths of the registers used by the tester, relative to the root
+    # device
+    register_paths = {
+        "timing_clksel":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/ClkSel",
+        "timing_rxlinkup":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/RxLinkUp",
+        "fw_githash":
+            "mmio/AmcCarrierCore/AxiVersion/GitHash",
+        "fw_buildstamp":
+            "mmio/AmcCarrierCore/AxiVersion/BuildStamp",
+        "fw_fpgaversion":
+            "mmio/AmcCarrierCore/AxiVersion/FpgaVersion",
+        "fw_uptime":
+            "mmio/AmcCarrierCore/AxiVersion/UpTimeCnt",
+        "timing_sofcount":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/sofCount",
+        "timing_eofcount":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/eofCount",
+        "timing_crcerrcount":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/CrcErrCount",
+        "timing_rxdecerrcount":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/"
+            "RxDecErrCount",
+        "timing_rxdsperrcount":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/"
+            "RxDspErrCount",
+        "timing_rxclkcount":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/RxClkCount",
+        "timing_clearrxcounters":
+            "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/"
+            "ClearRxCounters",
+        "timing_outputconfig":
+            "mmio/AmcCarrierCore/AxiSy56040/OutputConfig[1]",
+        "rtm_output":
+            "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
+            "OutputBits",
+        "mps_force_en":
+            "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
+            "DigitalForceEn",
+        "mps_force_bits":
+            "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
+            "DigitalForceBits",
+        "mps_input_bits":
+            "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
+            "RegInputBits",
+        "mps_digital_bytes":
+            "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
+            "DigitalBytes",
+        "mps_l1_polarity":
+            "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
+            "L1Polarity",
+        "mps_l2_polarity":
+            "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
+            "L2Polarity",
+        "rtm_output_rbv":
+            "mmio/AppTop/AppCore/RtmMpsLinkNode/RtmDout",
+        "rtm_inputs":
+            "mmio/AppTop/AppCore/RtmMpsLinkNode/RtmDin",
+    }
+
+    def __init__(self, yaml_file=None, ip_addr=None, root_name="NetIODev",
+                 yaml_cache=True, backend=None):
         """
         Initialize object.
+
+        The registers are accessed through 'backend'. By default, a CPSW
+        backend is created, connecting to the FPGA at 'ip_addr' using the
+        YAML hierarchy defined in 'yaml_file' (see CpswBackend).
         """
 
         # Define the number of inputs and output
         self.num_inputs = 32
         self.num_outputs = 8
 
-        print(f"Connecting to FPGA (IP={ip_addr})...             ", end="")
+        if backend is None:
+            from RtmTester.CpswBackend import CpswBackend
+
+            backend = CpswBackend(
+                yaml_file=yaml_file,
+                ip_addr=ip_addr,
+                root_name=root_name,
+                yaml_cache=yaml_cache,
+                paths=self.register_paths.values())
+
+        self.backend = backend
 
-        # Crate the CPSW root
-        self.root = Path.loadYamlFile(
-            yaml_file,
-            rootName=root_name,
-            yamlFixup=self.FixupRoot(ip_addr=ip_addr))
+        # Create interfaces to the firmware version registers
+        self.fw_githash = backend.createScalValRO(
+            self.register_paths["fw_githash"])
+        self.fw_buildstamp = backend.createScalValRO(
+            self.register_paths["fw_buildstamp"])
+        self.fw_fpgaversion = backend.createScalValRO(
+            self.register_paths["fw_fpgaversion"])
+        self.fw_uptime = backend.createScalValRO(
+            self.register_paths["fw_uptime"])
 
         # Create interfaces to the timing related registers
-        self.timing_clksel = ScalVal.create(
-            self.root.findByName(
-                "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/ClkSel"))
-        self.timing_rxlinkup = ScalVal_RO.create(
-            self.root.findByName(
-                "mmio/AmcCarrierCore/AmcCarrierTiming/TimingFrameRx/RxLinkUp"))
-        self.timing_outputconfig = ScalVal.create(
-            self.root.findByName(
-                "mmio/AmcCarrierCore/AxiSy56040/OutputConfig[1]"))
+        self.timing_clksel = backend.createScalVal(
+            self.register_paths["timing_clksel"])
+        self.timing_rxlinkup = backend.createScalValRO(
+            self.register_paths["timing_rxlinkup"])
+        self.timing_outputconfig = backend.createScalVal(
+            self.register_paths["timing_outputconfig"])
+
+        # Create interfaces to the timing link counters
+        self.timing_sofcount = backend.createScalValRO(
+            self.register_paths["timing_sofcount"])
+        self.timing_eofcount = backend.createScalValRO(
+            self.register_paths["timing_eofcount"])
+        self.timing_crcerrcount = backend.createScalValRO(
+            self.register_paths["timing_crcerrcount"])
+        self.timing_rxdecerrcount = backend.createScalValRO(
+            self.register_paths["timing_rxdecerrcount"])
+        self.timing_rxdsperrcount = backend.createScalValRO(
+            self.register_paths["timing_rxdsperrcount"])
+        self.timing_rxclkcount = backend.createScalValRO(
+            self.register_paths["timing_rxclkcount"])
+        self.timing_clearrxcounters = backend.createCommand(
+            self.register_paths["timing_clearrxcounters"])
 
         # Create interfaces to the RTM I/O related registers
-        self.rtm_output = ScalVal.create(
-            self.root.findByName(
-                "mmio/AppTop/AppCore/MpsLinkNodeCore/MpsDigitalMessage/"
-                "OutputBits"))
-        self.rtm_output_rbv = ScalVal_RO.create(
-            self.root.findByName(
-                "mmio/AppTop/AppCore/RtmMpsLinkNode/RtmDout"))
-        self.rtm_inputs = ScalVal_RO.create(
-            self.root.findByName(
-                "mmio/AppTop/AppCore/RtmMpsLinkNode/RtmDin"))
-
-        print_ok("Done!")
+        self.rtm_output = backend.createScalVal(
+            self.register_paths["rtm_output"])
+        self.rtm_output_rbv = backend.createScalValRO(
+            self.register_paths["rtm_output_rbv"])
+        self.rtm_inputs = backend.createScalValRO(
+            self.register_paths["rtm_inputs"])
+
+        # Create interfaces to the MPS digital message registers
+        self.mps_force_en = backend.createScalVal(
+            self.register_paths["mps_force_en"])
+        self.mps_force_bits = backend.createScalVal(
+            self.register_paths["mps_force_bits"])
+        self.mps_input_bits = backend.createScalValRO(
+            self.register_paths["mps_input_bits"])
+        self.mps_digital_bytes = backend.createScalValRO(
+            self.register_paths["mps_digital_bytes"])
+        self.mps_l1_polarity = backend.createScalValRO(
+            self.register_paths["mps_l1_polarity"])
+        self.mps_l2_polarity = backend.createScalValRO(
+            self.register_paths["mps_l2_polarity"])
+
+    def getFirmwareVersion(self):
+        """
+        Read the version of the firmware loaded in the FPGA, and return it
+        in a dictionary: the githash (40 hex digits), the build stamp
+        string, the FPGA firmware version number, and the number of seconds
+        since the last FPGA reset.
+        """
+
+        # The githash bytes are stored least significant first
+        githash = ''.join(
+            f"{b:02x}" for b in reversed(list(self.fw_githash.getVal())))
+
+        # The build stamp is read as a string when the register has the
+        # ASCII encoding, and as a list of characters otherwise
+        build_stamp = self.fw_buildstamp.getVal()
+        if not isinstance(build_stamp, str):
+            build_stamp = bytes(build_stamp).decode(errors="replace")
+
+        return {
+            "githash": githash,
+            "build_stamp": build_stamp.rstrip("\0").strip(),
+            "fpga_version": int(self.fw_fpgaversion.getVal()),
+            "uptime": int(self.fw_uptime.getVal()),
+        }
+
+    def checkFirmwareVersion(self, mcs_file):
+        """
+        Compare the firmware loaded in the FPGA with an MCS file, by their
+        short githash (from the MCS file name). Return True if they match,
+        and the firmware version (see getFirmwareVersion()).
+        """
+
+        version = self.getFirmwareVersion()
+
+        return version["githash"][:7] == get_mcs_githash(mcs_file), version
 
     def setTimingLcls1mode(self):
         """
@@ -78,6 +218,29 @@ class Rtm():
 
         return bool(self.timing_rxlinkup.getVal())
 
+    def clearTimingCounters(self):
+        """
+        Clear the timing link counters.
+        """
+
+        self.timing_clearrxcounters.execute()
+
+    def getTimingCounters(self):
+        """
+        Read all the timing link counters, back to back, and return them in
+        a dictionary, by register name. The counters are 32-bit wide, and
+        wrap around.
+        """
+
+        return {
+            "sofCount": self.timing_sofcount.getVal(),
+            "eofCount": self.timing_eofcount.getVal(),
+            "CrcErrCount": self.timing_crcerrcount.getVal(),
+            "RxDecErrCount": self.timing_rxdecerrcount.getVal(),
+            "RxDspErrCount": self.timing_rxdsperrcount.getVal(),
+            "RxClkCount": self.timing_rxclkcount.getVal(),
+        }
+
     def setRtmOutputChannel(self, channel, value=True):
         """
         Set an RTM output channel
@@ -123,6 +286,47 @@ class Rtm():
             raise RuntimeError("Outs were not set correctly. "
                                f"Set = {value}, read-back = {readback}")
 
+    def setRtmOutputSequence(self, words, check=True):
+        """
+        Set all the RTM outputs to each word of a sequence, in order, and
+        return the read-back values as an array.
+
+        The whole sequence is validated before touching the hardware, and
+        the read-back values are verified at the end in a single
+        comparison. If 'check' is False, mismatches do not raise an
+        exception, and are left to the caller to process.
+        """
+
+        words = numpy.asarray(words).ravel()
+
+        # Check if all the words are in range
+        if ((words < 0) | (words >= 2**self.num_outputs)).any():
+            raise RuntimeError("Invalid output word values in sequence")
+
+        words = words.astype(numpy.uint32)
+        readback = numpy.empty(len(words), dtype=numpy.uint32)
+
+        # CPSW does not group accesses to a scalar register, so each word
+        # still needs its own write and read transactions. Keep the loop
+        # body down to the two CPSW calls.
+        set_val = self.rtm_output.setVal
+        get_val = self.rtm_output_rbv.getVal
+        for i, w in enumerate(words.tolist()):
+            set_val(w)
+            readback[i] = get_val()
+
+        # Check if the read back values match with what we wrote
+        if check:
+            errors = numpy.flatnonzero(readback != words)
+            if errors.size:
+                i = errors[0]
+                raise RuntimeError(
+                    f"Outs were not set correctly in {errors.size} of "
+                    f"{len(words)} words. First error at index {i}: "
+                    f"Set = {words[i]}, read-back = {readback[i]}")
+
+        return readback
+
     def getRtmInputChannel(self, channel):
         """
         Get an RTM intput channel
@@ -154,34 +358,93 @@ class Rtm():
 
         return val
 
+    def getMpsInputWord(self):
+        """
+        Get the input bits of the MPS digital message (the debounced RTM
+        inputs).
+        """
+
+        return self.mps_input_bits.getVal()
+
+    def getMpsDigitalBytes(self):
+        """
+        Get the number of digital bytes in the MPS message.
+        """
+
+        return self.mps_digital_bytes.getVal()
+
+    def getMpsPolarity(self):
+        """
+        Get the polarity of the input bits of the MPS digital message in the
+        active timing mode, as a word: the input bits are the RTM inputs
+        inverted where the polarity bits are set.
+        """
+
+        if self.timing_clksel.getVal():
+            bits = self.mps_l2_polarity.getVal()
+        else:
+            bits = self.mps_l1_polarity.getVal()
+
+        return sum(int(b) << i for i, b in enumerate(bits))
+
+    def getMpsForce(self):
+        """
+        Return if the MPS message digital bits are forced, and the forced
+        bits.
+        """
+
+        return bool(self.mps_force_en.getVal()), self.mps_force_bits.getVal()
+
+    def setMpsForce(self, enable, bits=None):
+        """
+        Enable or disable forcing the MPS message digital bits, setting the
+        forced bits first, if given.
+        """
+
+        if bits is not None:
+            self.mps_force_bits.setVal(bits)
+
+        self.mps_force_en.setVal(int(enable))
+
+    def getRtmInputSamples(self, n):
+        """
+        Read the RTM input word 'n' times, as fast as possible, and return
+        the samples as an array.
+        """
+
+        get_val = self.rtm_inputs.getVal
+        samples = numpy.fromiter(
+            (get_val() for _ in range(n)), dtype=numpy.int64, count=n)
+
+        # Verify that the read words are in range
+        if ((samples < 0) | (samples >= 2**self.num_inputs)).any():
+            raise RuntimeError("ERROR: Read input samples are out of range")
+
+        return samples.astype(numpy.uint32)
+
     def getRtmInputListBits(self):
         """
         Get all the RTM input as a list of bits.
         """
 
-        # Read the input word
-        w = self.getRtmInputWord()
-
-        # Convert the word to a list of bits
-        return [int(b) for b in bin(w)[2:].zfill(32)[::-1]]
+        # Read the input word, and convert it to a list of bits
+        return Bits.word_bits(self.getRtmInputWord(), self.num_inputs)
 
-    class FixupRoot(YamlFixup):
+    def getRtmInputChanges(self, previous):
         """
-        YamlFixup class, use to override the IP address defined in YAML.
+        Read the RTM input word, and return it together with the mask of
+        the channels which changed from the 'previous' word.
         """
 
-        def __init__(self, ip_addr):
-            """
-            Initialize object.
-            """
+        w = self.getRtmInputWord()
 
-            YamlFixup.__init__(self)
-            self.ip_addr = ip_addr
+        return w, Bits.changed(previous, w)
 
-        def __call__(self, root, top):
-            """
-            Look for the 'ipAddr' node and override it.
-            """
+    def getRtmInputSampleBits(self, n):
+        """
+        Read the RTM input word 'n' times, as fast as possible, and return
+        the samples as an array of bits, one row per sample and one column
+        per channel.
+        """
 
-            ip_addr_node = self.findByName(root, "ipAddr")
-            ip_addr_node.set(self.ip_addr)
+        return Bits.unpack(self.getRtmInputSamples(n), self.num_inputs)
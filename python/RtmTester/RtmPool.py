@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+import collections
+import contextlib
+import threading
+import time
+
+from RtmTester.Rtm import Rtm
+
+
+class RtmPool():
+    """
+    Pool of Rtm objects, keyed by their FPGA IP address (and the rest of
+    their CPSW connection arguments), so repeated test jobs on the same
+    FPGA reuse its loaded CPSW root and register handles, instead of
+    loading the YAML hierarchy again.
+
+    Each Rtm object is used by one job at a time: a job on an FPGA in use
+    waits for it to be released. At most 'max_size' objects are kept. When
+    the pool is full, the least recently used idle object is dropped to
+    make room (or the job waits for one to be released, if all are in
+    use), and the objects idle for more than 'idle_timeout' seconds are
+    dropped on each access, or by sweep().
+    """
+
+    def __init__(self, max_size=8, idle_timeout=600.0, factory=Rtm):
+        """
+        Initialize the object. The Rtm objects are created by calling
+        'factory' with the connection arguments.
+        """
+
+        if max_size < 1:
+            raise RuntimeError(f"Invalid pool size {max_size}")
+
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.factory = factory
+
+        # Entries, least recently used first
+        self.entries = collections.OrderedDict()
+        self.cond = threading.Condition()
+
+        # Number of accesses reusing a pooled object, and creating a new one
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """
+        Return the number of objects in the pool.
+        """
+
+        with self.cond:
+            return len(self.entries)
+
+    @contextlib.contextmanager
+    def acquire(self, **kwargs):
+        """
+        Context manager returning the Rtm object created with the
+        connection arguments 'kwargs' (see Rtm), taken from the pool or
+        created if needed. If an exception is raised while it is used, the
+        object is dropped, as its connection may be broken.
+        """
+
+        key = tuple(sorted(kwargs.items()))
+        entry = self._get(key, kwargs)
+
+        try:
+            yield entry.rtm
+        except BaseException:
+            self._release(key, entry, discard=True)
+            raise
+
+        self._release(key, entry)
+
+    def sweep(self):
+        """
+        Drop the objects idle for more than 'idle_timeout' seconds.
+        """
+
+        with self.cond:
+            self._sweep()
+
+    def clear(self):
+        """
+        Drop all the idle objects.
+        """
+
+        with self.cond:
+            for key in [k for k, e in self.entries.items() if not e.busy]:
+                del self.entries[key]
+
+    def _get(self, key, kwargs):
+        """
+        Take the entry of a key, waiting for it to be released if it is in
+        use, or create it.
+        """
+
+        with self.cond:
+            while True:
+                self._sweep()
+
+                entry = self.entries.get(key)
+                if entry is not None:
+                    if not entry.busy:
+                        entry.busy = True
+                        self.entries.move_to_end(key)
+                        self.hits += 1
+                        return entry
+                elif len(self.entries) < self.max_size or self._evict():
+                    # The entry is reserved while the object is created
+                    # outside the lock, as it takes time
+                    entry = self.Entry()
+                    self.entries[key] = entry
+                    self.misses += 1
+                    break
+
+                self.cond.wait()
+
+        try:
+            entry.rtm = self.factory(**kwargs)
+        except BaseException:
+            with self.cond:
+                del self.entries[key]
+                self.cond.notify_all()
+            raise
+
+        return entry
+
+    def _release(self, key, entry, discard=False):
+        """
+        Release an entry, dropping it from the pool if 'discard'.
+        """
+
+        with self.cond:
+            entry.busy = False
+            entry.last_used = time.monotonic()
+            if discard and self.entries.get(key) is entry:
+                del self.entries[key]
+            self.cond.notify_all()
+
+    def _evict(self):
+        """
+        Drop the least recently used idle entry. Return False if all the
+        entries are in use.
+        """
+
+        for key, entry in self.entries.items():
+            if not entry.busy:
+                del self.entries[key]
+                return True
+
+        return False
+
+    def _sweep(self):
+        """
+        Drop the entries idle for more than 'idle_timeout' seconds.
+        """
+
+        limit = time.monotonic() - self.idle_timeout
+        for key in [k for k, e in self.entries.items()
+                    if not e.busy and e.last_used < limit]:
+            del self.entries[key]
+
+    class Entry():
+        """
+        A pooled Rtm object.
+        """
+
+        def __init__(self):
+            """
+            Initialize the object. The entry is created in use.
+            """
+
+            self.rtm = None
+            self.busy = True
+            self.last_used = time.monotonic()
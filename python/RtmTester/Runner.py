@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import json
+import os
+import shlex
+import subprocess
+import tempfile
+import threading
+import time
+
+from RtmTester.Agent import AgentClient
+from RtmTester.Crate import ShelfManager, check_node_connection
+from RtmTester.FirmwareCheck import FirmwareChecker
+from RtmTester.Helpers import print_ok, print_failed
+
+
+# TOP directory, replacing the slac.stanford.edu soft link by slac
+# which is not always present in the linuxRT CPUs
+top_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__)))).replace("slac.stanford.edu", "slac")
+
+# Firmware file location
+fw_top_dir = os.path.join(top_dir, "firmware", "ATCA")
+
+# YAML Top file
+yaml_top = os.path.join(fw_top_dir, "AmcCarrierMpsAnalogLinkNode_project.yaml",
+                        "000TopLevel.yaml")
+
+# Remote CPU user name
+cpu_user_name = "laci"
+
+# CPSW env script
+cpsw_env_script = \
+    "/afs/slac/g/lcls/package/cpsw/framework/R4.4.2/env.slac.sh"
+
+
+def ssh_command(cpu_name, *options, control_dir=None):
+    """
+    Return the ssh command line to the CPU node, with the extra ssh
+    'options'. If 'control_dir' is given, the shared connection in that
+    directory is used.
+    """
+
+    cmd = ["ssh", "-o", "BatchMode=yes"]
+    if control_dir is not None:
+        cmd += ["-o", f"ControlPath={control_dir}/%r@%h:%p"]
+
+    return cmd + list(options) + [f"{cpu_user_name}@{cpu_name}"]
+
+
+def remote_command(cpu_name, command, control_dir=None):
+    """
+    Return the ssh command line to execute a command in the CPU node, in
+    the CPSW environment.
+    """
+
+    remote = f"export PYTHONPATH={top_dir}/python/:${{PYTHONPATH}} && " \
+             f". {cpsw_env_script} > /dev/null && " \
+             f"{command}"
+
+    return ssh_command(cpu_name, control_dir=control_dir) + \
+        [f"/bin/sh -ic {shlex.quote(remote)}"]
+
+
+def read_fw_versions(remote, fpga_ips):
+    """
+    Read the version of the firmware loaded in a list of FPGAs directly,
+    via CPSW, running read-fw-version.py in the CPU node. 'remote' is a
+    function returning the command line to execute a command in the CPU
+    node (see remote_command()). Return a dictionary with the firmware
+    version of each FPGA (see Rtm.getFirmwareVersion()), or None if it can
+    not be reached.
+    """
+
+    versions = {fpga_ip: None for fpga_ip in fpga_ips}
+    if not fpga_ips:
+        return versions
+
+    r = subprocess.run(
+        remote(f"python3 {top_dir}/scripts/read-fw-version.py "
+               f"--yaml {yaml_top} " +
+               " ".join(shlex.quote(ip) for ip in fpga_ips)),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        stdin=subprocess.DEVNULL,
+        universal_newlines=True)
+
+    # Anything else than the JSON lines of the FPGA versions (for example,
+    # the messages of the remote shell) is ignored
+    for line in r.stdout.splitlines():
+        try:
+            v = json.loads(line)
+        except ValueError:
+            continue
+
+        if isinstance(v, dict) and v.get("ip") in versions and \
+                "githash" in v:
+            versions[v["ip"]] = v
+
+    return versions
+
+
+class Target():
+    """
+    An RTM board to test: the crate shelf manager, the slot number, and the
+    tester device connected to it.
+    """
+
+    def __init__(self, shelfmanager, slot, tester_ip="10.0.1.100",
+                 tester_port=5000, rtm_serial=None):
+        """
+        Initialize the object.
+        """
+
+        if not 2 <= slot <= 7:
+            raise RuntimeError(
+                f"Invalid slot number {slot}! Must be a number between 2 "
+                "and 7.")
+
+        self.shelfmanager = shelfmanager
+        self.slot = slot
+        self.tester_ip = tester_ip
+        self.tester_port = tester_port
+        self.rtm_serial = rtm_serial
+
+        # Test result, updated by the Runner
+        self.status = "NOT RUN"
+        self.fpga_ip = None
+        self.crate_id = None
+        self.fw_githash = None
+        self.start = None
+        self.duration = None
+        self.log_file = None
+        self.error = None
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Create a target from a string with the format
+        'shelfmanager:slot[:tester_ip[:tester_port]][/rtm_serial]'.
+        """
+
+        spec, _, rtm_serial = spec.partition('/')
+        f = spec.split(':')
+        if not 2 <= len(f) <= 4:
+            raise RuntimeError(f"Invalid target '{spec}'")
+
+        try:
+            kwargs = {"shelfmanager": f[0], "slot": int(f[1])}
+            if len(f) > 2:
+                kwargs["tester_ip"] = f[2]
+            if len(f) > 3:
+                kwargs["tester_port"] = int(f[3])
+            if rtm_serial:
+                kwargs["rtm_serial"] = rtm_serial
+        except ValueError:
+            raise RuntimeError(f"Invalid target '{spec}'")
+
+        return cls(**kwargs)
+
+    @property
+    def name(self):
+        """
+        Target name, used in reports and log file names.
+        """
+
+        return f"{self.shelfmanager}-slot{self.slot}"
+
+
+class Runner():
+    """
+    Test several RTM boards in parallel, in one or more crates connected to
+    the same CPU node.
+
+    First, the crate information of all the targets is read via IPMI (or
+    from the cache, see FirmwareChecker), and their FPGA firmware version
+    directly from the FPGAs, via CPSW, or via IPMI for those which can not
+    be reached. Then, the FPGAs with a different firmware are all loaded in
+    parallel, and finally the test application runs in the CPU node for
+    each target. Up to 'jobs' targets are processed at the same time. All
+    the remote test sessions share a single ssh connection to the CPU node,
+    and the same CPSW environment setup.
+
+    With 'agent', a single test agent (see RtmTester.Agent) is started in
+    the CPU node, and all the targets are tested by it, instead of starting
+    a new test application for each one.
+    """
+
+    def __init__(self, cpu_name, targets, jobs=6, report_dir=None,
+                 check_fw=True, test_args=(), results_db=None,
+                 refresh_cache=False, agent=False):
+        """
+        Initialize the object.
+        """
+
+        self.cpu_name = cpu_name
+        self.targets = targets
+        self.jobs = jobs
+        self.check_fw = check_fw
+        self.test_args = list(test_args)
+
+        # Result database in the CPU node, shared by all the targets
+        self.results_db = results_db
+
+        if report_dir is None:
+            report_dir = time.strftime("rtm-test-%Y%m%d-%H%M%S")
+        self.report_dir = report_dir
+
+        # Crate information and firmware version, cached between runs.
+        # With 'refresh_cache', they are read again via IPMI.
+        self.checker = FirmwareChecker(
+            cpu_name, fw_top_dir, jobs=jobs,
+            fw_reader=lambda ips: read_fw_versions(self._remote_command, ips))
+        self.refresh_cache = refresh_cache
+
+        # ssh connection sharing
+        self.control_dir = None
+
+        # Test agent running in the CPU node, if used
+        self.agent = agent
+        self.agent_process = None
+        self.agent_client = None
+        self.agent_log = None
+
+        # Print lock, so progress messages from workers are not interleaved
+        self.print_lock = threading.Lock()
+
+    def run(self):
+        """
+        Test all the targets, and print and write the combined report.
+        Return True if all the targets passed.
+        """
+
+        self._check_targets()
+
+        os.makedirs(self.report_dir, exist_ok=True)
+
+        # Verify that CPU and shelf managers are reachable
+        shelfmanagers = sorted(set(t.shelfmanager for t in self.targets))
+        for node in [self.cpu_name] + shelfmanagers:
+            print(f"Checking connection with {node}...         ", end="")
+            if not check_node_connection(node):
+                print_failed("Not reachable!")
+                print("")
+                return False
+            print_ok("Connection OK!")
+
+        # Look for the MCS file once, for all the targets
+        if self.check_fw:
+            self.mcs_file, self.mcs_githash = self.checker.getMcsFile()
+            print(f"MCS file: {os.path.basename(self.mcs_file)}, "
+                  f"githash: '{self.mcs_githash}'")
+
+        start = time.monotonic()
+        self._open_ssh_master()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.jobs) as executor:
+                list(executor.map(self._prepare_target, self.targets))
+
+            # Read the firmware version of all the FPGAs, and load the
+            # firmware in all the FPGAs needing it at the same time
+            if self.check_fw:
+                self._read_fw_githashes()
+                self._program_targets()
+
+            if self.agent:
+                self._start_agent()
+            try:
+                with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.jobs) as executor:
+                    list(executor.map(
+                        self._run_target,
+                        [t for t in self.targets if t.status == "NOT RUN"]))
+            finally:
+                if self.agent:
+                    self._stop_agent()
+        finally:
+            self._close_ssh_master()
+        elapsed = time.monotonic() - start
+
+        self._report(elapsed)
+
+        return all(t.status == "PASSED" for t in self.targets)
+
+    def _check_targets(self):
+        """
+        Check that no two targets are the same board, or share the same
+        tester device (the targets without a tester device address all use
+        the default one): as they are tested at the same time, they would
+        drive each other's inputs. Raise RuntimeError if they do.
+        """
+
+        boards = {}
+        testers = {}
+
+        for t in self.targets:
+            board = (t.shelfmanager, t.slot)
+            if board in boards:
+                raise RuntimeError(
+                    f"Target {t.name} is given more than once")
+            boards[board] = t
+
+            tester = (t.tester_ip, t.tester_port)
+            if tester in testers:
+                raise RuntimeError(
+                    f"Targets {testers[tester].name} and {t.name} use the "
+                    f"same tester device ({t.tester_ip}:{t.tester_port})")
+            testers[tester] = t
+
+    def _prepare_target(self, target):
+        """
+        Read the crate information of a target. Runs in a worker thread.
+        """
+
+        target.log_file = os.path.join(self.report_dir, f"{target.name}.log")
+        target.start = time.monotonic()
+
+        try:
+            target.crate_id = self.checker.getCrateId(
+                target.shelfmanager, target.slot, refresh=self.refresh_cache)
+            target.fpga_ip = ShelfManager.getFpgaIp(
+                target.crate_id, target.slot)
+
+            with open(target.log_file, "w") as log:
+                log.write(f"Crate ID: {target.crate_id}, "
+                          f"FPGA IP: {target.fpga_ip}\n")
+
+        except (RuntimeError, OSError) as e:
+            self._finish_target(target, "ERROR", str(e))
+
+    def _read_fw_githashes(self):
+        """
+        Read the firmware version of all the targets: directly from all the
+        FPGAs at once, via CPSW, and then via IPMI, in parallel, for the
+        FPGAs which can not be reached.
+        """
+
+        targets = [t for t in self.targets if t.status == "NOT RUN"]
+
+        githashes = self.checker.readGitHashesFW(
+            [(t.shelfmanager, t.slot, t.fpga_ip) for t in targets],
+            refresh=self.refresh_cache)
+
+        def read(target):
+            try:
+                target.fw_githash = githashes.get(
+                    (target.shelfmanager, target.slot))
+                if target.fw_githash is None:
+                    target.fw_githash = self.checker.getGitHashFW(
+                        target.shelfmanager, target.slot,
+                        refresh=self.refresh_cache)
+
+                with open(target.log_file, "a") as log:
+                    log.write(f"Firmware githash: '{target.fw_githash}', "
+                              f"MCS file githash: '{self.mcs_githash}'\n")
+
+            except (RuntimeError, OSError) as e:
+                self._finish_target(target, "ERROR", str(e))
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.jobs) as executor:
+            list(executor.map(read, targets))
+
+    def _program_targets(self):
+        """
+        Load the MCS file in the FPGAs of the targets with a different
+        firmware, in parallel.
+        """
+
+        targets = [t for t in self.targets if t.status == "NOT RUN" and
+                   t.fw_githash != self.mcs_githash]
+        if not targets:
+            return
+
+        print(f"Loading the firmware in {len(targets)} FPGA(s)...")
+
+        logs = {(t.shelfmanager, t.slot): open(t.log_file, "a")
+                for t in targets}
+        try:
+            results = self.checker.program(
+                list(logs), self.mcs_file, self.mcs_githash, logs=logs)
+        finally:
+            for log in logs.values():
+                log.close()
+
+        for t in targets:
+            if results[(t.shelfmanager, t.slot)]:
+                t.fw_githash = self.mcs_githash
+            else:
+                self._finish_target(
+                    t, "ERROR", "Failed to load the FPGA image")
+
+    def _run_target(self, target):
+        """
+        Test a target. Runs in a worker thread.
+        """
+
+        try:
+            with open(target.log_file, "a") as log:
+                if self.agent_client is not None:
+                    r = self.agent_client.run(self._test_args(target), log)
+                else:
+                    r = self._execute_remote(self._test_command(target), log)
+
+            status = "PASSED" if r == 0 else "FAILED"
+            error = None
+
+        except (RuntimeError, OSError) as e:
+            status = "ERROR"
+            error = str(e)
+
+        self._finish_target(target, status, error)
+
+    def _finish_target(self, target, status, error=None):
+        """
+        Set the final status of a target, and print it.
+        """
+
+        target.status = status
+        target.error = error
+        target.duration = time.monotonic() - target.start
+
+        with self.print_lock:
+            print(f"{target.name}: ", end="")
+            if target.status == "PASSED":
+                print_ok(target.status, end="")
+            else:
+                print_failed(target.status, end="")
+            print(f" ({target.duration:.1f} s)")
+
+    def _test_command(self, target):
+        """
+        Return the command to run the test application in the CPU node.
+        """
+
+        return f"python3 {top_dir}/scripts/test-rtm.py " + \
+            " ".join(shlex.quote(a) for a in self._test_args(target))
+
+    def _test_args(self, target):
+        """
+        Return the test application arguments of a target.
+        """
+
+        args = ["--yaml", yaml_top,
+                "--ip-addr", target.fpga_ip,
+                "--tester-ip", target.tester_ip,
+                "--tester-port", str(target.tester_port)]
+
+        if self.results_db:
+            args += ["--results-db", self.results_db,
+                     "--crate-id", target.crate_id,
+                     "--slot", str(target.slot)]
+            if target.fw_githash:
+                args += ["--fw-githash", target.fw_githash]
+            if target.rtm_serial:
+                args += ["--rtm-serial", target.rtm_serial]
+
+        args += self.test_args
+
+        return args
+
+    def _ssh(self, *options):
+        """
+        Return the ssh command line, using the shared connection.
+        """
+
+        return ssh_command(
+            self.cpu_name, *options, control_dir=self.control_dir)
+
+    def _open_ssh_master(self):
+        """
+        Open the ssh connection to the CPU node, shared by all the remote
+        test sessions.
+        """
+
+        self.control_dir = tempfile.mkdtemp(prefix="rtm-test-ssh-")
+        r = subprocess.run(self._ssh("-M", "-N", "-f"))
+
+        if r.returncode != 0:
+            os.rmdir(self.control_dir)
+            raise RuntimeError(f"Can not connect to {self.cpu_name}")
+
+    def _close_ssh_master(self):
+        """
+        Close the shared ssh connection.
+        """
+
+        subprocess.run(self._ssh("-O", "exit"),
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        os.rmdir(self.control_dir)
+
+    def _remote_command(self, command):
+        """
+        Return the ssh command line to execute a command in the CPU node, in
+        the CPSW environment.
+        """
+
+        return remote_command(
+            self.cpu_name, command, control_dir=self.control_dir)
+
+    def _execute_remote(self, command, log):
+        """
+        Execute a command in the CPU node, in the CPSW environment, writing
+        its output to the log file. Return the command exit code.
+        """
+
+        log.flush()
+        r = subprocess.run(self._remote_command(command),
+                           stdout=log, stderr=subprocess.STDOUT,
+                           stdin=subprocess.DEVNULL)
+
+        return r.returncode
+
+    def _start_agent(self):
+        """
+        Start the test agent in the CPU node. Its messages are written to
+        'agent.log' in the report directory.
+        """
+
+        self.agent_log = open(os.path.join(self.report_dir, "agent.log"), "w")
+        self.agent_process = subprocess.Popen(
+            self._remote_command(
+                f"python3 {top_dir}/scripts/rtm-agent.py --stdin"),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=self.agent_log)
+        self.agent_client = AgentClient(
+            self.agent_process.stdout, self.agent_process.stdin)
+
+    def _stop_agent(self):
+        """
+        Stop the test agent, once its jobs have finished.
+        """
+
+        self.agent_client.close()
+        try:
+            self.agent_process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.agent_process.kill()
+            self.agent_process.wait()
+        self.agent_log.close()
+
+        self.agent_client = None
+        self.agent_process = None
+
+    def _report(self, elapsed):
+        """
+        Print the combined report, and write it to the report directory.
+        """
+
+        print("")
+        print("*************************")
+        print("***   Test results:   ***")
+        print("*************************")
+        print("")
+        print("-" * 64)
+        print(f"{'Target':25} | {'FPGA IP':15} | Result | Time (s)")
+        print("-" * 64)
+        for t in self.targets:
+            print(f"{t.name:25} | {t.fpga_ip or '':15} | ", end="")
+            if t.status == "PASSED":
+                print_ok(f"{t.status:6}", end="")
+            else:
+                print_failed(f"{t.status:6}", end="")
+            print(f" | {t.duration or 0:8.1f}")
+        print("-" * 64)
+        print(f"Total duration: {elapsed:.1f} s")
+        print("")
+
+        for t in self.targets:
+            if t.error:
+                print(f"{t.name}: {t.error}")
+
+        print(f"Logs written to {self.report_dir}")
+        print("")
+
+        report = {
+            "cpu": self.cpu_name,
+            "duration": elapsed,
+            "targets": [{
+                "shelfmanager": t.shelfmanager,
+                "slot": t.slot,
+                "crate_id": t.crate_id,
+                "fw_githash": t.fw_githash,
+                "rtm_serial": t.rtm_serial,
+                "fpga_ip": t.fpga_ip,
+                "tester_ip": t.tester_ip,
+                "status": t.status,
+                "duration": t.duration,
+                "error": t.error,
+                "log_file": t.log_file} for t in self.targets]}
+
+        with open(os.path.join(self.report_dir, "report.json"), "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from RtmTester.IOTester import default_patterns
+from RtmTester.Orchestrator import Orchestrator, Stage
+from RtmTester.Rtm import Rtm
+from RtmTester.TesterDevice import seq_min_period
+from RtmTester.TimingTester import TimingTester
+
+
+def add_rtm_arguments(parser):
+    """
+    Add the arguments used by create_rtm() to 'parser': the FPGA and tester
+    device addresses, and the simulation options.
+    """
+
+    parser.add_argument(
+        '--yaml',
+        type=str,
+        dest='yaml_file',
+        help='Path to the top level YAML file (000TopLevel.yaml)')
+
+    parser.add_argument(
+        '--ip-addr',
+        type=str,
+        dest='ip_addr',
+        help='FPGA IP Address')
+
+    parser.add_argument(
+        '--root-name',
+        type=str,
+        default='NetIODev',
+        dest='root_name',
+        help='RTM CPSW root device name (default = "NetIODev")')
+
+    parser.add_argument(
+        '--no-yaml-cache',
+        action='store_false',
+        dest='yaml_cache',
+        help='Load the full YAML hierarchy, instead of the cached copy '
+             'containing only the registers used by the tester')
+
+    parser.add_argument(
+        '--tester-ip',
+        type=str,
+        default='10.0.1.100',
+        dest='tester_ip',
+        help='Tester device IP address (default = "10.0.1.100")')
+
+    parser.add_argument(
+        '--tester-port',
+        type=int,
+        default=5000,
+        dest='tester_port',
+        help='Tester device port number (default = 5000)')
+
+    parser.add_argument(
+        '--simulate',
+        action='store_true',
+        help='Run against a simulated RTM and a local tester device '
+             'stand-in, instead of the hardware')
+
+    parser.add_argument(
+        '--sim-register-latency',
+        type=float,
+        default=0.0,
+        dest='sim_register_latency',
+        help='Simulated RTM register access latency, in seconds '
+             '(default = 0.0)')
+
+    parser.add_argument(
+        '--sim-command-latency',
+        type=float,
+        default=0.0,
+        dest='sim_command_latency',
+        help='Simulated tester device command latency, in seconds '
+             '(default = 0.0)')
+
+    parser.add_argument(
+        '--sim-lock-time',
+        type=float,
+        default=0.05,
+        dest='sim_lock_time',
+        help='Simulated timing link lock time, in seconds (default = 0.05)')
+
+    parser.add_argument(
+        '--sim-timing-error-rate',
+        type=float,
+        default=0.0,
+        dest='sim_timing_error_rate',
+        help='Simulated timing link CRC, decode and disparity error rates, '
+             'in errors per second (default = 0.0)')
+
+
+def check_rtm_args(parser, args):
+    """
+    Check the arguments added by add_rtm_arguments().
+    """
+
+    # The FPGA is only needed when not simulating
+    if not args.simulate:
+        if args.yaml_file is None:
+            parser.error('the following argument is required: --yaml')
+        if args.ip_addr is None:
+            parser.error('the following argument is required: --ip-addr')
+
+
+def get_parser():
+    """
+    Return the parser of the test application arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog='test-rtm.py',
+        description='LCLS2 MPS RTM Test Application')
+
+    add_rtm_arguments(parser)
+
+    parser.add_argument(
+        '--manual',
+        action='store_true',
+        help='Use I/O manual test procedure (i.e. without the tester device)')
+
+    parser.add_argument(
+        '--sample-rate',
+        type=float,
+        default=1000.0,
+        dest='sample_rate',
+        help='Input sampling rate of the manual test procedure, in samples '
+             'per second (default = 1000.0)')
+
+    parser.add_argument(
+        '--patterns',
+        type=lambda s: s.split(','),
+        default=default_patterns,
+        help='Comma separated list of I/O test patterns (default = '
+             f'"{",".join(default_patterns)}")')
+
+    parser.add_argument(
+        '--iterations',
+        type=int,
+        default=1,
+        help='Number of times the I/O test patterns are repeated (default = 1)')
+
+    parser.add_argument(
+        '--random-vectors',
+        type=int,
+        default=1024,
+        dest='random_vectors',
+        help='Number of vectors of the "random" pattern, per iteration '
+             '(default = 1024)')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=1,
+        help='Seed of the "random" pattern LFSR (default = 1)')
+
+    parser.add_argument(
+        '--capture-window',
+        type=float,
+        dest='capture_window',
+        help='Sample the RTM inputs continuously for this many seconds '
+             'after each vector, and report the settling time, bounces and '
+             'glitches of each input channel')
+
+    parser.add_argument(
+        '--latency-repeats',
+        type=int,
+        default=0,
+        dest='latency_repeats',
+        help='Measure the propagation latency of each I/O channel this many '
+             'times (default = 0, not measured)')
+
+    parser.add_argument(
+        '--latency-timeout',
+        type=float,
+        default=0.1,
+        dest='latency_timeout',
+        help='Maximum time to wait for each channel to change, when '
+             'measuring the propagation latency, in seconds (default = 0.1)')
+
+    parser.add_argument(
+        '--mps-window',
+        type=float,
+        dest='mps_window',
+        help='Check the MPS digital message input bits against the RTM '
+             'inputs after each input vector, waiting up to this many '
+             'seconds for them to match (the debounce time)')
+
+    parser.add_argument(
+        '--sequencer-period',
+        type=float,
+        dest='sequencer_period',
+        help='Play the input vectors with the tester device sequencer, one '
+             'every this many seconds, instead of sending them one by one. '
+             'It must be more than 4 times the round trip of the sequencer '
+             'run command (printed by the test), and fit the RTM register '
+             'accesses of each step (at least 0.0002). Not used with '
+             '--capture-window or --mps-window')
+
+    parser.add_argument(
+        '--timing-timeout',
+        type=float,
+        default=5.0,
+        dest='timing_timeout',
+        help='Maximum time to wait for the timing link to lock, in seconds '
+             '(default = 5.0)')
+
+    parser.add_argument(
+        '--timing-poll-interval',
+        type=float,
+        default=0.01,
+        dest='timing_poll_interval',
+        help='Timing link status polling interval, in seconds '
+             '(default = 0.01)')
+
+    parser.add_argument(
+        '--timing-stable-samples',
+        type=int,
+        default=20,
+        dest='timing_stable_samples',
+        help='Number of consecutive polls the timing link must be up to be '
+             'considered locked (default = 20)')
+
+    parser.add_argument(
+        '--timing-settle-time',
+        type=float,
+        default=0.1,
+        dest='timing_settle_time',
+        help='After a timing mode change, maximum time to wait for the link '
+             'of the previous mode to go down before polling for the new '
+             'one, in seconds (default = 0.1)')
+
+    parser.add_argument(
+        '--timing-quality-window',
+        type=float,
+        dest='timing_quality_window',
+        help='After the timing link locks, measure its quality (frame rate, '
+             'error rates and recovered clock frequency) for this many '
+             'seconds, in each timing mode')
+
+    parser.add_argument(
+        '--timing-quality-samples',
+        type=int,
+        default=10,
+        dest='timing_quality_samples',
+        help='Number of times the timing link counters are sampled during '
+             'the timing quality window (default = 10)')
+
+    parser.add_argument(
+        '--timing-quality-tolerance',
+        type=float,
+        default=0.02,
+        dest='timing_quality_tolerance',
+        help='Maximum relative deviation of the timing frame rate and clock '
+             'frequency from their nominal values (default = 0.02)')
+
+    parser.add_argument(
+        '--timing-max-error-rate',
+        type=float,
+        default=0.0,
+        dest='timing_max_error_rate',
+        help='Maximum number of timing link CRC, decode and disparity '
+             'errors per second (default = 0.0)')
+
+    parser.add_argument(
+        '--results-db',
+        type=str,
+        dest='results_db',
+        help='Record the results in this SQLite database file (see '
+             'rtm-results.py)')
+
+    parser.add_argument(
+        '--crate-id',
+        type=str,
+        dest='crate_id',
+        help='Crate ID, recorded with the results')
+
+    parser.add_argument(
+        '--slot',
+        type=int,
+        help='Crate slot number, recorded with the results')
+
+    parser.add_argument(
+        '--fw-githash',
+        type=str,
+        dest='fw_githash',
+        help='FPGA firmware githash, recorded with the results')
+
+    parser.add_argument(
+        '--rtm-serial',
+        type=str,
+        dest='rtm_serial',
+        help='RTM board serial number, recorded with the results')
+
+    parser.add_argument(
+        '--instrument',
+        action='store_true',
+        help='Count and time every register access, tester device command '
+             'and test stage, and print the timing breakdown')
+
+    parser.add_argument(
+        '--instrument-output',
+        type=str,
+        dest='instrument_output',
+        help='Write the timing breakdown to this JSON file (implies '
+             '--instrument)')
+
+    parser.add_argument(
+        '--profile-dir',
+        type=str,
+        dest='profile_dir',
+        help='Run each test stage under cProfile, and write its statistics '
+             'to this directory (implies --instrument)')
+
+    return parser
+
+
+def parse_args(argv=None):
+    """
+    Parse and return the test application arguments, from 'argv' or from
+    the command line.
+    """
+
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    check_rtm_args(parser, args)
+
+    if args.sequencer_period is not None and \
+            args.sequencer_period < seq_min_period:
+        parser.error(f'--sequencer-period must be at least '
+                     f'{seq_min_period} s (the tester device minimum)')
+
+    return args
+
+
+def create_rtm(args):
+    """
+    Create the Rtm object for the test application arguments.
+
+    When simulating, a simulated tester device is started too, and
+    'args.tester_ip' and 'args.tester_port' are set to its address. Return
+    the Rtm object, and the simulated tester device (None when not
+    simulating), which must be stopped after the tests.
+    """
+
+    if args.simulate:
+        # Simulated RTM and tester device, sharing the same bench model
+        from RtmTester.Simulator import SimulatedBench, \
+            SimulatedRtmBackend, SimulatedTesterDevice
+
+        bench = SimulatedBench(link_lock_time=args.sim_lock_time)
+        bench.timing_error_rate = args.sim_timing_error_rate
+
+        tester_device = SimulatedTesterDevice(
+            bench=bench,
+            latency=args.sim_command_latency)
+        tester_device.start()
+        args.tester_ip, args.tester_port = tester_device.address
+
+        rtm = Rtm(
+            backend=SimulatedRtmBackend(
+                bench=bench,
+                latency=args.sim_register_latency))
+
+        return rtm, tester_device
+
+    # Crate CPSW rtm
+    rtm = Rtm(
+        yaml_file=args.yaml_file,
+        ip_addr=args.ip_addr,
+        root_name=args.root_name,
+        yaml_cache=args.yaml_cache)
+
+    return rtm, None
+
+
+def run_session(args, rtm):
+    """
+    Run the tests selected by the test application arguments on an RTM.
+    Return True if all the tests passed.
+    """
+
+    # Result recorder
+    result_run = None
+    if args.results_db:
+        from RtmTester.Results import ResultStore
+
+        # Without '--fw-githash', the firmware githash is read from the FPGA
+        fw_githash = args.fw_githash
+        if fw_githash is None:
+            fw_githash = rtm.getFirmwareVersion()["githash"][:7]
+
+        result_store = ResultStore(args.results_db)
+        result_run = result_store.start_run(
+            crate_id=args.crate_id,
+            slot=args.slot,
+            fw_githash=fw_githash,
+            rtm_serial=args.rtm_serial,
+            config=vars(args))
+
+    # Whatever happens from here on, the run is finished, its database
+    # closed and the drivers restored. A run stopped by an exception is
+    # recorded as an error.
+    instrumentation = None
+    status = "ERROR"
+    try:
+        # Timing instrumentation
+        if args.instrument or args.instrument_output or args.profile_dir:
+            from RtmTester.Instrumentation import Instrumentation
+
+            instrumentation = Instrumentation(profile_dir=args.profile_dir)
+            instrumentation.attach_rtm(rtm)
+
+        print("Starting tests...")
+        print("")
+
+        # The timing and automatic I/O tests use independent registers, so they
+        # run concurrently, each one holding the lock of the registers it uses.
+        # Stages sharing a resource, or declaring a dependency, run in order.
+        timing_tester = TimingTester(
+            rtm=rtm,
+            timeout=args.timing_timeout,
+            poll_interval=args.timing_poll_interval,
+            stable_samples=args.timing_stable_samples,
+            settle_time=args.timing_settle_time,
+            quality_window=args.timing_quality_window,
+            quality_samples=args.timing_quality_samples,
+            quality_tolerance=args.timing_quality_tolerance,
+            max_error_rate=args.timing_max_error_rate)
+        stages = [
+            Stage(
+                name="Timing",
+                run=timing_tester.run_tests,
+                resources=["timing"])]
+
+        if not args.manual:
+            # Automatic testing
+            from RtmTester.IOTester import AutomaticIOTester as IOTester
+
+            def run_io_tests():
+                io_tester = IOTester(
+                    rtm=rtm,
+                    ip_addr=args.tester_ip,
+                    port_number=args.tester_port,
+                    patterns=args.patterns,
+                    iterations=args.iterations,
+                    random_vectors=args.random_vectors,
+                    seed=args.seed,
+                    ping=not args.simulate,
+                    capture_window=args.capture_window,
+                    latency_repeats=args.latency_repeats,
+                    latency_timeout=args.latency_timeout,
+                    mps_window=args.mps_window,
+                    sequencer_period=args.sequencer_period,
+                    result_run=result_run)
+                if instrumentation is not None:
+                    instrumentation.attach_tester(io_tester.tester_device)
+                return io_tester.run_tests()
+
+            # The MPS message check depends on the timing mode (through the
+            # message polarity), which the timing tests switch
+            io_resources = ["rtm_io", "tester_device"]
+            if args.mps_window is not None:
+                io_resources.append("timing")
+
+            stages.append(
+                Stage(
+                    name="I/O",
+                    run=run_io_tests,
+                    resources=io_resources))
+
+        passed = Orchestrator(stages, instrumentation=instrumentation).run()
+
+        if args.manual:
+            # Manual testing needs the terminal, so it runs on its own after
+            # the other stages
+            from RtmTester.IOTester import ManualIOTester as IOTester
+
+            io_tester = IOTester(rtm=rtm, sample_rate=args.sample_rate)
+            passed &= io_tester.run_tests()
+
+        if instrumentation is not None:
+            instrumentation.detach()
+            instrumentation.print_report()
+            if args.instrument_output:
+                instrumentation.write_report(args.instrument_output)
+                print(f"Timing breakdown written to {args.instrument_output}")
+
+        if result_run is not None:
+            for mode, t in timing_tester.lock_time.items():
+                result_run.add_measurement(
+                    f"timing_lock_time_{mode.lower()}", t)
+            for mode, quality in timing_tester.quality.items():
+                for name, value in (quality or {}).items():
+                    result_run.add_measurement(
+                        f"timing_{name}_{mode.lower()}", value)
+
+        status = "PASSED" if passed else "FAILED"
+    finally:
+        if instrumentation is not None:
+            instrumentation.detach()
+        if result_run is not None:
+            result_run.finish(status)
+            result_store.close()
+
+    return passed
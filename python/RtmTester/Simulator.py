@@ -0,0 +1,850 @@
+#!/usr/bin/env python3
+
+import random
+import socketserver
+import struct
+import threading
+import time
+
+from RtmTester import TesterDevice
+from RtmTester.TimingTester import rx_clk_count_div, timing_modes
+
+
+class SignalFaults():
+    """
+    Faults injected on a group of signals, going from a driver to a
+    receiver.
+    """
+
+    def __init__(self, width, seed=0):
+        """
+        Initialize the object, without faults.
+        """
+
+        self.width = width
+        self.mask = (1 << width) - 1
+
+        # Channels always read low, or high
+        self.stuck_low = 0
+        self.stuck_high = 0
+
+        # Pairs of shorted channels. Both channels read high if any of them
+        # is driven high.
+        self.shorts = []
+
+        # Probability of each channel reading the wrong value, on each read
+        self.flip_probability = 0.0
+
+        # Bounce time of each channel, by channel number. A channel reads
+        # random values for that many seconds after it changes.
+        self.bounce = {}
+
+        # Propagation delay of each channel, by channel number. A channel
+        # reads its previous value for that many seconds after it changes.
+        self.delay = {}
+
+        # Time each channel was last changed by the driver, and its value
+        # before that change
+        self.change_times = [0.0] * width
+        self.driven = 0
+        self.previous = 0
+
+        self.random = random.Random(seed)
+
+    def drive(self, word):
+        """
+        Record the time of the channel changes, when the driver sets 'word'.
+        """
+
+        diff = (word ^ self.driven) & self.mask
+        if diff:
+            self.previous = (self.previous & ~diff) | (self.driven & diff)
+            t = time.monotonic()
+            for i in range(self.width):
+                if (diff >> i) & 1:
+                    self.change_times[i] = t
+        self.driven = word
+
+    def apply(self, word):
+        """
+        Return the word seen by the receiver, when the driver sets 'word'.
+        """
+
+        if self.delay:
+            t = time.monotonic()
+            for i, d in self.delay.items():
+                if t - self.change_times[i] < d:
+                    word = (word & ~(1 << i)) | (self.previous & (1 << i))
+
+        for a, b in self.shorts:
+            if (word >> a) & 1 or (word >> b) & 1:
+                word |= (1 << a) | (1 << b)
+
+        word = (word | self.stuck_high) & ~self.stuck_low
+
+        if self.flip_probability:
+            for i in range(self.width):
+                if self.random.random() < self.flip_probability:
+                    word ^= 1 << i
+
+        if self.bounce:
+            t = time.monotonic()
+            for i, d in self.bounce.items():
+                if t - self.change_times[i] < d and self.random.random() < 0.5:
+                    word ^= 1 << i
+
+        return word & self.mask
+
+
+class SimulatedBench():
+    """
+    Model of an RTM board connected to the tester device.
+
+    The tester device outputs drive the RTM inputs, and the RTM outputs
+    drive the tester device inputs. Faults can be injected in both paths,
+    through the 'input_faults' and 'output_faults' attributes, and in the
+    path from the RTM inputs to the MPS message input bits, through the
+    'mps_faults' attribute (its delays model the debounce time).
+
+    The timing link goes up 'link_lock_time' seconds after the timing mode
+    is changed. If 'link_lock_time' is None, the link never goes up. The
+    link status keeps its value from before the mode change for
+    'link_status_delay' seconds (0 by default). While the link is up, the
+    timing link counters count frames and recovered clock cycles at the
+    nominal rates of the timing mode, and CRC, decode and disparity errors
+    at 'timing_error_rate' errors per second each.
+    """
+
+    def __init__(self, num_inputs=32, num_outputs=8, link_lock_time=0.05,
+                 seed=0):
+        """
+        Initialize the object.
+        """
+
+        self.lock = threading.Lock()
+
+        # Signal levels set by the drivers
+        self.tester_outputs = 0
+        self.rtm_outputs = 0
+
+        # Faults on the RTM inputs and outputs paths
+        self.input_faults = SignalFaults(num_inputs, seed=seed)
+        self.output_faults = SignalFaults(num_outputs, seed=seed + 1)
+        self.mps_faults = SignalFaults(num_inputs, seed=seed + 2)
+
+        # Sequence played on the tester device outputs (see playSequence())
+        self.sequence = None
+
+        # Number of digital bytes in the MPS message, and polarity of its
+        # input bits in each timing mode
+        self.mps_digital_bytes = (num_inputs + 7) // 8
+        self.mps_polarity = {mode: 0 for mode in timing_modes}
+
+        # Timing link model
+        self.link_lock_time = link_lock_time
+        self.timing_mode_time = time.monotonic()
+        self.timing_mode = "LCLS1"
+        self.timing_error_rate = 0.0
+        self.link_status_delay = 0.0
+        self.previous_link_up = False
+        self.counters_clear_time = self.timing_mode_time
+
+        # Firmware version information
+        self.fw_githash = "0" * 40
+        self.fw_build_stamp = "RtmTester: simulated"
+        self.fw_version = 0
+        self.boot_time = time.monotonic()
+
+    def setTesterOutputs(self, value):
+        """
+        Set the tester device outputs.
+        """
+
+        with self.lock:
+            self._advanceSequence()
+            self._driveTesterOutputs(value)
+
+    def _driveTesterOutputs(self, value):
+        """
+        Set the tester device outputs, with the lock held.
+        """
+
+        self.input_faults.drive(value)
+        self.mps_faults.drive(value)
+        self.tester_outputs = value
+
+    def playSequence(self, table, period, sample_lead, capture, start):
+        """
+        Play a sequence on the tester device outputs, as the tester device
+        sequencer does: the words of 'table' are set one every 'period'
+        seconds, from the time 'start', and the tester device inputs are
+        recorded in 'capture' 'sample_lead' seconds before the end of each
+        step.
+
+        The steps are applied when the signals are next accessed, as they
+        would have been at their time, so the playback does not depend on
+        the scheduling of the simulator threads.
+        """
+
+        with self.lock:
+            self._advanceSequence()
+            self.sequence = (table, period, sample_lead, capture, start, [0])
+
+    def waitSequence(self):
+        """
+        Wait for the sequence being played, if any, to finish.
+        """
+
+        with self.lock:
+            if self.sequence is None:
+                return
+            table, period, _, _, start, _ = self.sequence
+
+        delay = start + len(table) * period - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        with self.lock:
+            self._advanceSequence()
+
+    def _advanceSequence(self):
+        """
+        Apply the steps of the sequence being played which are due, with
+        the lock held.
+        """
+
+        if self.sequence is None:
+            return
+
+        t = time.monotonic()
+
+        table, period, sample_lead, capture, start, state = self.sequence
+        while state[0] < 2 * len(table):
+            i, sample = divmod(state[0], 2)
+            if sample:
+                if t < start + (i + 1) * period - sample_lead:
+                    return
+                capture[i] = self.output_faults.apply(self.rtm_outputs)
+            else:
+                if t < start + i * period:
+                    return
+                self._driveTesterOutputs(table[i])
+            state[0] += 1
+
+        self.sequence = None
+
+    def getRtmInputs(self):
+        """
+        Return the RTM inputs, as seen by the FPGA.
+        """
+
+        with self.lock:
+            self._advanceSequence()
+            return self.input_faults.apply(self.tester_outputs)
+
+    def getMpsInputs(self):
+        """
+        Return the input bits of the MPS message.
+        """
+
+        with self.lock:
+            self._advanceSequence()
+            mask = (1 << (8 * self.mps_digital_bytes)) - 1
+            return (self.mps_faults.apply(
+                self.input_faults.apply(self.tester_outputs)) ^
+                self.mps_polarity[self.timing_mode]) & mask
+
+    def setRtmOutputs(self, value):
+        """
+        Set the RTM outputs.
+        """
+
+        with self.lock:
+            self._advanceSequence()
+            self.output_faults.drive(value)
+            self.rtm_outputs = value
+
+    def getRtmOutputs(self):
+        """
+        Return the RTM outputs, as set by the FPGA.
+        """
+
+        with self.lock:
+            return self.rtm_outputs
+
+    def getTesterInputs(self):
+        """
+        Return the tester device inputs.
+        """
+
+        with self.lock:
+            self._advanceSequence()
+            return self.output_faults.apply(self.rtm_outputs)
+
+    def setTimingMode(self, mode=None):
+        """
+        Restart the timing link lock, after a timing mode change, and set
+        the timing mode ("LCLS1" or "LCLS2"), if given.
+        """
+
+        with self.lock:
+            self.previous_link_up = self._linkUp()
+            self.timing_mode_time = time.monotonic()
+            if mode is not None:
+                self.timing_mode = mode
+
+    def clearTimingCounters(self):
+        """
+        Clear the timing link counters.
+        """
+
+        with self.lock:
+            self.counters_clear_time = time.monotonic()
+
+    def getTimingCounter(self, name):
+        """
+        Return the value of a timing link counter, by register name.
+        """
+
+        with self.lock:
+            if self.link_lock_time is None:
+                return 0
+
+            # Time the link has been up since the counters were cleared
+            t = time.monotonic() - max(
+                self.timing_mode_time + self.link_lock_time,
+                self.counters_clear_time)
+            t = max(t, 0.0)
+
+            nominal = timing_modes[self.timing_mode]
+            if name in ["sofCount", "eofCount"]:
+                v = nominal["frame_rate"] * t
+            elif name == "RxClkCount":
+                v = nominal["clock"] / rx_clk_count_div * t
+            else:
+                v = self.timing_error_rate * t
+
+            return int(v) % 2**32
+
+    def isTimingLinkUp(self):
+        """
+        Return True if the timing link is up.
+        """
+
+        with self.lock:
+            return self._linkUp()
+
+    def _linkUp(self):
+        """
+        Return True if the timing link is up. The lock must be held.
+        """
+
+        t = time.monotonic() - self.timing_mode_time
+
+        if t < self.link_status_delay:
+            return self.previous_link_up
+
+        if self.link_lock_time is None:
+            return False
+
+        return t >= self.link_lock_time
+
+
+class SimulatedRegister():
+    """
+    Simulated register, with the getVal/setVal interface of the CPSW
+    ScalVal and ScalVal_RO objects.
+    """
+
+    def __init__(self, path, get_val, set_val=None, latency=0.0):
+        """
+        Initialize the object.
+        """
+
+        self.path = path
+        self._get_val = get_val
+        self._set_val = set_val
+        self.latency = latency
+
+    def getVal(self):
+        """
+        Read the register.
+        """
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        return self._get_val()
+
+    def setVal(self, value):
+        """
+        Write the register.
+        """
+
+        if self._set_val is None:
+            raise RuntimeError(f"Register {self.path} is read-only")
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        self._set_val(value)
+
+
+class SimulatedCommand():
+    """
+    Simulated command, with the execute interface of the CPSW Command
+    objects.
+    """
+
+    def __init__(self, path, execute, latency=0.0):
+        """
+        Initialize the object.
+        """
+
+        self.path = path
+        self._execute = execute
+        self.latency = latency
+
+    def execute(self):
+        """
+        Run the command.
+        """
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        self._execute()
+
+
+class SimulatedRtmBackend():
+    """
+    Register access backend for the Rtm class, using an in-memory register
+    model of the FPGA, connected to a SimulatedBench.
+
+    Each register access takes 'latency' seconds. Registers not modeled
+    by the bench are plain memory.
+    """
+
+    def __init__(self, bench, latency=0.0):
+        """
+        Initialize the object.
+        """
+
+        self.bench = bench
+        self.latency = latency
+
+        # Plain memory registers, by path
+        self.memory = {}
+
+        # Registers modeled by the bench, by name: (read, write)
+        self.models = {
+            "RtmDin":       (bench.getRtmInputs, None),
+            "RtmDout":      (bench.getRtmOutputs, None),
+            "OutputBits":   (bench.getRtmOutputs, bench.setRtmOutputs),
+            "RxLinkUp":     (lambda: int(bench.isTimingLinkUp()), None),
+            "RegInputBits": (bench.getMpsInputs, None),
+            "DigitalBytes": (lambda: bench.mps_digital_bytes, None),
+        }
+
+        # Firmware version registers
+        self.models["GitHash"] = (
+            lambda: list(reversed(bytes.fromhex(bench.fw_githash))), None)
+        self.models["BuildStamp"] = (lambda: bench.fw_build_stamp, None)
+        self.models["FpgaVersion"] = (lambda: bench.fw_version, None)
+        self.models["UpTimeCnt"] = (
+            lambda: int(time.monotonic() - bench.boot_time), None)
+
+        # Timing link counters
+        for name in ["sofCount", "eofCount", "CrcErrCount", "RxDecErrCount",
+                     "RxDspErrCount", "RxClkCount"]:
+            self.models[name] = (
+                lambda name=name: bench.getTimingCounter(name), None)
+
+        # Commands modeled by the bench, by name
+        self.commands = {
+            "ClearRxCounters": bench.clearTimingCounters,
+        }
+
+        # MPS message polarity registers, as arrays of bits
+        for name, mode in [("L1Polarity", "LCLS1"), ("L2Polarity", "LCLS2")]:
+            self.models[name] = self._polarityRegister(mode)
+
+        # Timing mode registers restart the timing link lock when written
+        for name in ["ClkSel", "OutputConfig"]:
+            self.models[name] = self._timingModeRegister(name)
+
+    def _timingModeRegister(self, name):
+        """
+        Return the read and write functions of a timing mode register.
+        """
+
+        self.memory[name] = 0
+
+        def set_val(value):
+            self.memory[name] = value
+            if name == "ClkSel":
+                self.bench.setTimingMode(mode="LCLS2" if value else "LCLS1")
+            else:
+                self.bench.setTimingMode()
+
+        return (lambda: self.memory[name], set_val)
+
+    def _polarityRegister(self, mode):
+        """
+        Return the read and write functions of the MPS message polarity
+        register of a timing mode.
+        """
+
+        def get_val():
+            return [(self.bench.mps_polarity[mode] >> i) & 1
+                    for i in range(64)]
+
+        def set_val(value):
+            self.bench.mps_polarity[mode] = sum(
+                int(b) << i for i, b in enumerate(value))
+
+        return get_val, set_val
+
+    def _create(self, path, read_only):
+        """
+        Create a register interface.
+        """
+
+        # Remove the array index from the register name
+        name = path.split("/")[-1].split("[")[0]
+
+        if name in self.models:
+            get_val, set_val = self.models[name]
+        else:
+            self.memory.setdefault(path, 0)
+            get_val = lambda: self.memory[path]  # noqa: E731
+
+            def set_val(value):
+                self.memory[path] = value
+
+        return SimulatedRegister(
+            path=path,
+            get_val=get_val,
+            set_val=None if read_only else set_val,
+            latency=self.latency)
+
+    def createScalVal(self, path):
+        """
+        Create an interface to a read-write register.
+        """
+
+        return self._create(path, read_only=False)
+
+    def createScalValRO(self, path):
+        """
+        Create an interface to a read-only register.
+        """
+
+        return self._create(path, read_only=True)
+
+    def createCommand(self, path):
+        """
+        Create an interface to a command. Commands not modeled by the bench
+        do nothing.
+        """
+
+        name = path.split("/")[-1]
+
+        return SimulatedCommand(
+            path=path,
+            execute=self.commands.get(name, lambda: None),
+            latency=self.latency)
+
+
+class SimulatedTesterDevice(socketserver.ThreadingTCPServer):
+    """
+    Local TCP server speaking the RtmTester.ino protocol, connected to a
+    SimulatedBench.
+
+    Each command takes 'latency' seconds to process, and fails (with a
+    '1' response code) with probability 'error_probability'. With 'binary'
+    set to False, it behaves as the firmware without the binary protocol
+    (and without the sequencer and the update time measurement).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    # Same limits and information as the firmware
+    max_cmd_size = 20
+    binary_version = 2
+    info = "RTM Tester (simulated)\n" \
+           "FW Version        : v1.5.0\n" \
+           "Number of inputs  : 8\n" \
+           "Number of outputs : 32\n"
+    sequencer_capacity = 512
+    sequencer_min_period = TesterDevice.seq_min_period
+    sequencer_sample_lead = 50e-6
+
+    # Time the sequencer takes to write the outputs, and to read the inputs,
+    # on each step, in seconds. The playback overruns its steps if they do
+    # not fit in the period.
+    sequencer_step_time = 0.0
+
+    # Output write and input read times reported by the 'u' command, in
+    # nanoseconds
+    output_write_time = 1000
+    input_read_time = 400
+
+    def __init__(self, bench, host="127.0.0.1", port=0, latency=0.0,
+                 error_probability=0.0, seed=0, binary=True):
+        """
+        Initialize the object. Use port 0 to get any free port.
+        """
+
+        self.bench = bench
+        self.binary = binary
+        self.latency = latency
+        self.error_probability = error_probability
+        self.random = random.Random(seed)
+        self.thread = None
+
+        # Sequencer table, inputs recorded at each step, and playback
+        # started by the last run frame (number of steps, period and start
+        # time)
+        self.seq_table = [0] * self.sequencer_capacity
+        self.seq_capture = bytearray(self.sequencer_capacity)
+        self.seq_pending = None
+        self.seq_overrun = False
+
+        super().__init__((host, port), self.Handler)
+
+    @property
+    def address(self):
+        """
+        Return the IP address and port number the server is listening on.
+        """
+
+        return self.server_address[0], self.server_address[1]
+
+    def start(self):
+        """
+        Start serving, in a background thread.
+        """
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop serving.
+        """
+
+        self.shutdown()
+        self.server_close()
+
+    def process(self, line):
+        """
+        Process a command line (without its terminator), and return the
+        response (with its terminator).
+        """
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if len(line) + 1 > self.max_cmd_size or not line:
+            return b"1@"
+
+        if self.error_probability and \
+                self.random.random() < self.error_probability:
+            return b"1@"
+
+        cmd, arg = line[:1], line[1:]
+
+        if cmd == b"i" and not arg:
+            return b"0" + self.info.encode() + b"@"
+
+        if cmd == b"?" and not arg:
+            return b"0%d@" % self.bench.getTesterInputs()
+
+        if cmd == b"=" and arg.isdigit():
+            self.bench.setTesterOutputs(int(arg) & 0xFFFFFFFF)
+            return b"0@"
+
+        if cmd == b"b" and not arg and self.binary:
+            return b"0%d@" % self.binary_version
+
+        if cmd == b"s" and not arg and self.binary:
+            return b"0%d@" % self.sequencer_capacity
+
+        if cmd == b"u" and not arg and self.binary:
+            return b"0%d,%d@" % (self.output_write_time, self.input_read_time)
+
+        return b"1@"
+
+    def process_frame(self, frame):
+        """
+        Process a binary protocol frame, and return the response.
+        """
+
+        received = time.monotonic()
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        op = frame[0]
+        failed = bytes((1, 0))
+        if op == TesterDevice.op_seq_fetch:
+            count = TesterDevice.seq_fetch_frame.unpack(frame)[2]
+            failed += bytes(count)
+        elif op in (TesterDevice.op_write_timed, TesterDevice.op_read_timed):
+            failed += bytes(TesterDevice.timed_response.size - len(failed))
+
+        if self.error_probability and \
+                self.random.random() < self.error_probability:
+            return failed
+
+        if op == TesterDevice.op_seq_load:
+            _, offset, count = TesterDevice.seq_load_header.unpack_from(frame)
+            if offset + count > self.sequencer_capacity:
+                return failed
+            self.seq_table[offset:offset + count] = struct.unpack_from(
+                f'<{count}I', frame, TesterDevice.seq_load_header.size)
+            return bytes((0, 0))
+
+        if op == TesterDevice.op_seq_run:
+            _, count, period_us = TesterDevice.seq_run_frame.unpack(frame)
+            period = period_us * 1e-6
+            if count > self.sequencer_capacity or \
+                    period_us < round(self.sequencer_min_period * 1e6):
+                return failed
+            # The playback starts before the response is sent, so that it
+            # starts within the round trip of the run frame
+            self.seq_pending = (count, period, time.monotonic())
+            self.seq_overrun = self.sequencer_step_time > \
+                period - self.sequencer_sample_lead
+            return bytes((0, 0))
+
+        if op == TesterDevice.op_seq_fetch:
+            _, offset, count = TesterDevice.seq_fetch_frame.unpack(frame)
+            if offset + count > self.sequencer_capacity:
+                return failed
+            status = TesterDevice.seq_status_overrun if self.seq_overrun \
+                else 0
+            return bytes((status, 0)) + \
+                self.seq_capture[offset:offset + count]
+
+        if op == TesterDevice.op_write_timed:
+            self.bench.setTesterOutputs(
+                TesterDevice.binary_frame.unpack(frame)[1])
+            return self._timed_response(0, received, time.monotonic())
+
+        if op == TesterDevice.op_read_timed:
+            action = time.monotonic()
+            return self._timed_response(
+                self.bench.getTesterInputs(), received, action)
+
+        if op in (TesterDevice.op_write, TesterDevice.op_write_read):
+            self.bench.setTesterOutputs(
+                TesterDevice.binary_frame.unpack(frame)[1])
+
+        if op in (TesterDevice.op_read, TesterDevice.op_write_read):
+            return bytes((0, self.bench.getTesterInputs()))
+
+        return bytes((0, 0))
+
+    @staticmethod
+    def _timed_response(inputs, received, action):
+        """
+        Return the response of a timed frame received at time 'received',
+        whose outputs were written, or inputs read, at time 'action' (as
+        returned by time.monotonic()).
+        """
+
+        def elapsed(t):
+            return min(round((t - received) * 1e6), 0xFFFF)
+
+        return TesterDevice.timed_response.pack(
+            0, inputs, elapsed(action), elapsed(time.monotonic()))
+
+    @staticmethod
+    def frame_size(op):
+        """
+        Return the size of a binary protocol frame, from its first byte.
+        """
+
+        if op in (TesterDevice.op_write, TesterDevice.op_write_read,
+                  TesterDevice.op_write_timed):
+            return TesterDevice.binary_frame.size
+
+        if op == TesterDevice.op_seq_load:
+            return TesterDevice.seq_load_header.size
+
+        if op == TesterDevice.op_seq_run:
+            return TesterDevice.seq_run_frame.size
+
+        if op == TesterDevice.op_seq_fetch:
+            return TesterDevice.seq_fetch_frame.size
+
+        return 1
+
+    @staticmethod
+    def frame_data_size(header):
+        """
+        Return the number of bytes following the header of a binary protocol
+        frame (the vectors of the sequencer load frames).
+        """
+
+        if header[0] == TesterDevice.op_seq_load:
+            return 4 * TesterDevice.seq_load_header.unpack(header)[2]
+
+        return 0
+
+    def play(self):
+        """
+        Play the sequence started by the last run frame, if any, on the
+        bench, and wait for it to finish, as commands are not processed
+        meanwhile.
+        """
+
+        if self.seq_pending is None:
+            return
+
+        count, period, start = self.seq_pending
+        self.seq_pending = None
+
+        self.bench.playSequence(
+            table=self.seq_table[:count],
+            period=period,
+            sample_lead=self.sequencer_sample_lead,
+            capture=self.seq_capture,
+            start=start)
+
+        self.bench.waitSequence()
+
+    class Handler(socketserver.StreamRequestHandler):
+        """
+        Connection handler: process each command line, in order. The
+        sequencer playback runs in the handler, after the response of the
+        run frame, so the next commands wait for it to finish.
+        """
+
+        # The W5500 Ethernet controller of the tester device does not delay
+        # small segments
+        disable_nagle_algorithm = True
+
+        def handle(self):
+            """
+            Process the commands received on the connection.
+            """
+
+            while True:
+                c = self.rfile.read(1)
+                if not c:
+                    return
+
+                if self.server.binary and c[0] & 0x80:
+                    frame = c + self.rfile.read(
+                        self.server.frame_size(c[0]) - 1)
+                    frame += self.rfile.read(
+                        self.server.frame_data_size(frame))
+                    self.wfile.write(self.server.process_frame(frame))
+                    self.server.play()
+                else:
+                    line = c + self.rfile.readline()
+                    self.wfile.write(self.server.process(line.rstrip(b"\n")))
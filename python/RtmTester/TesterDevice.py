@@ -1,12 +1,59 @@
 #!/usr/bin/env python
 
+import collections
 import os
 import subprocess
 import socket
+import struct
+import time
 
 from RtmTester.Helpers import print_ok, print_failed
 
 
+# Compact binary protocol (see RtmTester.ino). Its frames start with a byte
+# with the most significant bit set, so they can not be confused with the
+# text commands. The write frames carry the output word as a 32-bit little
+# endian integer, and all the responses start with two bytes: a status code
+# (0 on success) and the input byte (0 for the write frames).
+binary_version = 1
+op_write = 0x81
+op_read = 0x82
+op_write_read = 0x83
+binary_frame = struct.Struct('<BI')
+binary_response_size = 2
+
+# Sequencer frames (see RtmTester.ino). The load frame header (offset and
+# number of vectors) is followed by the vectors, as 32-bit little endian
+# integers. The run frame carries the number of steps and the step period
+# in microseconds. The fetch frame carries the offset and number of steps,
+# and its response is followed by the input byte recorded at each step. Its
+# status code is 'seq_status_overrun' if the last playback overran any of its
+# steps (the capture is still sent).
+op_seq_load = 0x84
+op_seq_run = 0x85
+op_seq_fetch = 0x86
+seq_load_header = struct.Struct('<BHH')
+seq_run_frame = struct.Struct('<BHI')
+seq_fetch_frame = struct.Struct('<BHH')
+seq_status_overrun = 2
+
+# Minimum step period of the sequencer, in seconds
+seq_min_period = 200e-6
+
+# Maximum number of vectors sent in each sequencer load frame
+seq_load_chunk = 64
+
+# Timed frames (see RtmTester.ino), since version 2 of the binary protocol.
+# They write the outputs or read the inputs, like the write and read frames,
+# and their response is followed by the time at which the tester device did
+# it, and the time at which it sent the response, in microseconds since it
+# received the frame.
+timed_version = 2
+op_write_timed = 0x87
+op_read_timed = 0x88
+timed_response = struct.Struct('<BBHH')
+
+
 class TesterDevice:
     """
     Class to communicate with the target tester device.
@@ -14,9 +61,20 @@ class TesterDevice:
     get the device information.
     """
 
-    def __init__(self, ip_addr, port_number):
+    def __init__(self, ip_addr, port_number, pipeline_depth=8, timeout=2.0,
+                 ping=True, binary=True):
         """
         Initialize object.
+
+        Up to 'pipeline_depth' commands can be in flight at the same time,
+        and each command fails if its response does not arrive within
+        'timeout' seconds. Set 'ping' to False to skip the ping check (for
+        example, when using a local tester device stand-in).
+
+        If 'binary' is True, the compact binary protocol is used for the
+        input and output commands when the tester device supports it,
+        falling back to the text protocol otherwise. The sequencer (see
+        loadSequence()) is only available with the binary protocol.
         """
 
         # Check if the IP address is valid
@@ -44,60 +102,280 @@ class TesterDevice:
             exit(1)
 
         # Check if the tester device is online
-        print("Trying to ping the tester device...               ", end="")
-        try:
-            dev_null = open(os.devnull, 'w')
-            subprocess.check_call(["ping", "-c2", ip_addr],
-                                  stdout=dev_null,
-                                  stderr=dev_null)
-            print_ok("Device is online!")
-        except subprocess.CalledProcessError:
-            print_failed("ERROR: Device is off-line!")
-            print("")
-            print("Aborting rest of the test.")
-            exit(1)
+        if ping:
+            print("Trying to ping the tester device...               ", end="")
+            try:
+                dev_null = open(os.devnull, 'w')
+                subprocess.check_call(["ping", "-c2", ip_addr],
+                                      stdout=dev_null,
+                                      stderr=dev_null)
+                print_ok("Device is online!")
+            except subprocess.CalledProcessError:
+                print_failed("ERROR: Device is off-line!")
+                print("")
+                print("Aborting rest of the test.")
+                exit(1)
 
         # Connect to the tester device
         print("Connecting to tester device...                    ", end="")
-        self.socket = self.SocketHanlder(
+        self.socket = self.SocketHandler(
             ip_addr=ip_addr,
-            port_number=port_number)
+            port_number=port_number,
+            pipeline_depth=pipeline_depth,
+            timeout=timeout)
+
+        # Negotiate the binary protocol. Firmware without it replies to the
+        # 'b' command with an error code.
+        self.binary = False
+        self.timed = False
+        if binary:
+            try:
+                version = int(self.sendCommand('b'))
+                self.binary = version >= binary_version
+                self.timed = version >= timed_version
+            except (RuntimeError, ValueError):
+                pass
+
+        print(f"Using the {'binary' if self.binary else 'text'} protocol")
+
+        # Number of steps of the sequencer (0 if it is not supported).
+        # Firmware without it replies to the 's' command with an error code.
+        self.sequencer_capacity = 0
+        if self.binary:
+            try:
+                self.sequencer_capacity = int(self.sendCommand('s'))
+            except (RuntimeError, ValueError):
+                pass
 
-    def sendCommand(self, command):
+    def sendCommand(self, command, timeout=None):
         """
         Generic method used to send a command and process the response.
         """
 
-        # Add terminator
-        command += '\n'
-
         # Send command and read response
-        r = self.socket.send(command)
+        r = self.socket.send(command, timeout=timeout)
+
+        return self._checkResponse(r)
+
+    def sendCommands(self, commands, timeout=None):
+        """
+        Send a list of commands, keeping several of them in flight, and
+        return the list of responses in the same order.
+        """
+
+        # Send commands and read responses
+        rs = self.socket.send_many(commands, timeout=timeout)
+
+        return [self._checkResponse(r) for r in rs]
+
+    def sendFrame(self, op, val=0, timeout=None):
+        """
+        Send a binary protocol frame, and return the input byte of its
+        response.
+        """
+
+        if op == op_read:
+            frame = bytes((op,))
+        else:
+            frame = binary_frame.pack(op, val)
+
+        return self.sendBinary(frame, timeout=timeout)[1]
+
+    def sendBinary(self, frame, size=binary_response_size, timeout=None,
+                   accept=(0,)):
+        """
+        Send a binary protocol frame, and return its response, of 'size'
+        bytes. Its status code must be one of 'accept'.
+        """
+
+        # Send frame and read response
+        r = self.socket.send(frame, timeout=timeout, size=size)
 
         # Check if command was execute successfully. Raise an exception if not.
-        if not r.startswith('0'):
+        if r[0] not in accept:
+            raise RuntimeError("Error on command execution")
+
+        return r
+
+    def sendBinaryMany(self, frames, size=binary_response_size,
+                       timeout=None, accept=(0,)):
+        """
+        Send a list of binary protocol frames, keeping several of them in
+        flight, and return the list of their responses, of 'size' bytes
+        each. Their status codes must be one of 'accept'.
+        """
+
+        cmds = [self.socket.submit(f, timeout=timeout, size=size)
+                for f in frames]
+        rs = [self.socket.receive(cmd) for cmd in cmds]
+
+        # Check if all the commands were executed successfully. Raise an
+        # exception if not.
+        if any(r[0] not in accept for r in rs):
+            raise RuntimeError("Error on command execution")
+
+        return rs
+
+    def _checkResponse(self, r):
+        """
+        Check the response code, and return the response message without it.
+        """
+
+        # Check if command was execute successfully. Raise an exception if not.
+        if not r.startswith(b'0'):
             raise RuntimeError("Error on command execution")
 
         # return the response message without the error code.
-        return r[1:]
+        return r[1:].decode()
 
     def writeOutputs(self, val):
         """
         Command to write the outputs.
         """
 
-        self.sendCommand('=' + str(val))
+        if self.binary:
+            self.sendFrame(op_write, val)
+        else:
+            self.sendCommand('=' + str(val))
 
     def readInputs(self):
         """
         Command to read the inputs.
         """
 
+        if self.binary:
+            return self.sendFrame(op_read)
+
         try:
             return int(self.sendCommand('?'))
         except ValueError:
             raise RuntimeError("Not-numeric value received")
 
+    def writeOutputsReadInputs(self, val):
+        """
+        Write the outputs, and then read the inputs, in a single round trip.
+        Return the inputs.
+        """
+
+        if self.binary:
+            return self.sendFrame(op_write_read, val)
+
+        # With the text protocol, both commands are sent back to back
+        _, r = self.sendCommands(['=' + str(val), '?'])
+        try:
+            return int(r)
+        except ValueError:
+            raise RuntimeError("Not-numeric value received")
+
+    def writeOutputsTimed(self, val):
+        """
+        Write the outputs, and return the time (as returned by
+        time.monotonic()) at which the tester device wrote them.
+
+        With the timed frames, the time is placed from the round trip of the
+        frame, minus the time the tester device held it, split evenly
+        between both directions: its error is the asymmetry of the network
+        delays, well below the round trip time. Otherwise, the middle of the
+        round trip of the command is returned, and its error can reach half
+        the round trip time.
+        """
+
+        if self.timed:
+            return self._sendTimed(binary_frame.pack(op_write_timed, val))[1]
+
+        start = time.monotonic()
+        self.writeOutputs(val)
+
+        return (start + time.monotonic()) / 2
+
+    def readInputsTimed(self):
+        """
+        Read the inputs. Return them, and the time (as returned by
+        time.monotonic()) at which the tester device read them, placed as
+        in writeOutputsTimed().
+        """
+
+        if self.timed:
+            return self._sendTimed(bytes((op_read_timed,)))
+
+        start = time.monotonic()
+        r = self.readInputs()
+
+        return r, (start + time.monotonic()) / 2
+
+    def _sendTimed(self, frame):
+        """
+        Send a timed frame. Return the input byte of its response, and the
+        time at which the tester device wrote its outputs or read its
+        inputs.
+        """
+
+        start = time.monotonic()
+        r = self.sendBinary(frame, size=timed_response.size)
+        end = time.monotonic()
+
+        _, inputs, action, response = timed_response.unpack(r)
+        network = max(0.0, end - start - response * 1e-6)
+
+        return inputs, start + network / 2 + action * 1e-6
+
+    def loadSequence(self, words, offset=0):
+        """
+        Load a list of output words in the sequencer table, starting at
+        step 'offset'. The words are sent in several frames, all in flight
+        at the same time.
+        """
+
+        if offset + len(words) > self.sequencer_capacity:
+            raise RuntimeError(
+                f"The sequence does not fit in the sequencer table "
+                f"({self.sequencer_capacity} steps)")
+
+        frames = []
+        for i in range(0, len(words), seq_load_chunk):
+            chunk = words[i:i + seq_load_chunk]
+            frames.append(
+                seq_load_header.pack(op_seq_load, offset + i, len(chunk)) +
+                struct.pack(f'<{len(chunk)}I', *chunk))
+
+        self.sendBinaryMany(frames)
+
+    def runSequence(self, count, period):
+        """
+        Start playing the first 'count' steps of the sequencer table, one
+        every 'period' seconds: the tester device writes the outputs at the
+        start of each step, and records its inputs at the end of it. Return
+        the time interval (as returned by time.monotonic()) in which the
+        playback started.
+
+        The tester device does not process other commands until the
+        playback finishes. With 'count' 0, nothing is played, so the round
+        trip of the run command can be checked on its own.
+        """
+
+        start = time.monotonic()
+        self.sendBinary(
+            seq_run_frame.pack(op_seq_run, count, round(period * 1e6)))
+
+        return start, time.monotonic()
+
+    def fetchCapture(self, count, offset=0, timeout=None):
+        """
+        Return the inputs recorded by the sequencer on 'count' steps,
+        starting at step 'offset', as bytes, and whether the playback
+        overran any of its steps (then the inputs were not recorded at the
+        right time). It waits for the playback to finish, so 'timeout' must
+        cover the rest of the playback.
+        """
+
+        r = self.sendBinary(
+            seq_fetch_frame.pack(op_seq_fetch, offset, count),
+            size=binary_response_size + count,
+            timeout=timeout,
+            accept=(0, seq_status_overrun))
+
+        return r[binary_response_size:], r[0] == seq_status_overrun
+
     def readInfo(self):
         """
         Command to get the device information.
@@ -105,64 +383,217 @@ class TesterDevice:
 
         return self.sendCommand('i')
 
-    class SocketHanlder:
+    def readUpdateTime(self):
+        """
+        Command to get the time the tester device takes to write all its
+        outputs, and to read all its inputs, as measured by the firmware, in
+        seconds. The output write time bounds the skew between the output
+        channels. Return None if the firmware does not support it (it
+        replies with an error code).
+        """
+
+        try:
+            r = self.sendCommand('u')
+        except RuntimeError:
+            return None
+
+        try:
+            write_time, read_time = (int(v) * 1e-9 for v in r.split(','))
+        except ValueError:
+            raise RuntimeError("Not-numeric value received")
+
+        return write_time, read_time
+
+    class SocketHandler:
         """
         Inner class to handler the TCP socket.
-        It provides a method to send a message and read back the response.
+
+        Commands are framed as bytes terminated by a newline, and responses as
+        bytes terminated by the 'terminator' character. Binary frames are
+        sent as they are, and their responses have a fixed size. Up to
+        'pipeline_depth' commands can be in flight at the same time;
+        responses are matched to their commands in the order they were
+        sent. Each command has its own timeout.
         """
 
-        def __init__(self, ip_addr, port_number, terminator='@'):
+        def __init__(self, ip_addr, port_number, terminator=b'@',
+                     pipeline_depth=8, timeout=2.0):
             """
             Initialize the object.
             """
 
+            if pipeline_depth < 1:
+                raise RuntimeError(
+                    f"Invalid pipeline depth {pipeline_depth}")
+
             self.ip_addr = ip_addr
             self.port_number = port_number
             self.terminator = terminator
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.pipeline_depth = pipeline_depth
+            self.timeout = timeout
+
+            # Received bytes not yet consumed by a response
+            self.rx_buffer = bytearray()
+
+            # Commands sent, waiting for their responses, oldest first
+            self.pending = collections.deque()
+
+            self.socket = None
+            self._connect()
+
+            print(f"Connected to {ip_addr}.{port_number}")
+
+        def _connect(self):
+            """
+            Open the TCP connection to the target.
+            """
 
             try:
-                self.socket.connect((ip_addr, port_number))
+                self.socket = socket.create_connection(
+                    (self.ip_addr, self.port_number), timeout=self.timeout)
             except socket.error as e:
                 print(f"ERROR: Can not connect to target: {e}")
                 raise
 
-            print(f"Connected to {ip_addr}.{port_number}")
+            # Commands are small, don't let Nagle's algorithm hold them
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def _reset(self):
+            """
+            Drop the connection and all the commands in flight, and reconnect.
+            After a timeout the stream can not be trusted anymore, as a late
+            response would be matched to the wrong command.
+            """
+
+            self.socket.close()
+            self.rx_buffer.clear()
+            self.pending.clear()
+            self._connect()
+
+        def submit(self, msg, timeout=None, size=None):
+            """
+            Send a message without waiting for its response. Return the
+            pending command object, to be passed to 'receive()'.
+
+            If 'size' is given, the message is a binary frame, and its
+            response has that many bytes.
+            """
+
+            if timeout is None:
+                timeout = self.timeout
+
+            # Wait for the oldest command if the pipeline is full
+            while len(self.pending) >= self.pipeline_depth:
+                self._read_response()
 
-        def send(self, msg):
+            if isinstance(msg, str):
+                msg = msg.encode()
+
+            # Add terminator
+            if size is None:
+                msg += b'\n'
+
+            cmd = self.PendingCommand(
+                deadline=time.monotonic() + timeout, size=size)
+
+            try:
+                self.socket.sendall(msg)
+            except socket.error as e:
+                self._reset()
+                raise RuntimeError(f"Socket connection broken: {e}")
+
+            self.pending.append(cmd)
+
+            return cmd
+
+        def receive(self, cmd):
+            """
+            Wait for the response of a command returned by 'submit()'.
+            """
+
+            while cmd.response is None:
+                if not self.pending:
+                    raise RuntimeError("Command is not in flight")
+
+                self._read_response()
+
+            return cmd.response
+
+        def send(self, msg, timeout=None, size=None):
             """
             Send message and read response.
             """
 
-            send_size = len(msg)
-            total_sent = 0
+            return self.receive(self.submit(msg, timeout=timeout, size=size))
 
-            # Send command
-            while total_sent < send_size:
-                sent = self.socket.send(msg)
+        def send_many(self, msgs, timeout=None):
+            """
+            Send a list of messages, keeping up to 'pipeline_depth' of them
+            in flight, and return the list of responses.
+            """
 
-                # Check if connection is broken
-                if sent == 0:
-                    raise RuntimeError("Socket connection broken")
+            cmds = [self.submit(msg, timeout=timeout) for msg in msgs]
 
-                # Keep sending until all message is sent
-                total_sent = total_sent + sent
+            return [self.receive(cmd) for cmd in cmds]
+
+        def _read_response(self):
+            """
+            Read the response of the oldest command in flight.
+            """
+
+            cmd = self.pending[0]
 
-            # Read response
-            response = ""
             while True:
-                r = self.socket.recv(1024)
+                # Look for a complete response in the buffered bytes: a
+                # fixed number of bytes for binary frames, or up to the
+                # terminator (which is removed from the response)
+                if cmd.size is not None:
+                    i = cmd.size if len(self.rx_buffer) >= cmd.size else -1
+                    skip = 0
+                else:
+                    i = self.rx_buffer.find(self.terminator)
+                    skip = len(self.terminator)
+                if i >= 0:
+                    cmd.response = bytes(self.rx_buffer[:i])
+                    del self.rx_buffer[:i + skip]
+                    self.pending.popleft()
+                    return
+
+                remaining = cmd.deadline - time.monotonic()
+                if remaining <= 0:
+                    self._reset()
+                    raise RuntimeError("Timeout waiting for response")
+
+                try:
+                    self.socket.settimeout(remaining)
+                    r = self.socket.recv(4096)
+                except socket.timeout:
+                    self._reset()
+                    raise RuntimeError("Timeout waiting for response")
+                except socket.error as e:
+                    self._reset()
+                    raise RuntimeError(f"Socket connection broken: {e}")
 
                 # Check if connection is broken
                 if r == b'':
+                    self._reset()
                     raise RuntimeError("Socket connection broken")
 
-                response += r
+                self.rx_buffer += r
+
+        class PendingCommand:
+            """
+            A command sent to the target, waiting for its response.
+            """
+
+            __slots__ = ('deadline', 'size', 'response')
 
-                # Keep reading until terminator is found
-                if r.endswith(self.terminator):
-                    # Remove terminator from response
-                    response = response[:-1]
-                    break
+            def __init__(self, deadline, size=None):
+                """
+                Initialize the object. 'size' is the size of the response of
+                a binary frame.
+                """
 
-            return response
+                self.deadline = deadline
+                self.size = size
+                self.response = None
@@ -2,24 +2,83 @@
 
 import time
 
-from RtmTester.Helpers import print_ok, print_failed
+from RtmTester.Helpers import print_ok, print_failed, poll_until
+
+
+# Nominal frame rate, in Hz, and recovered clock frequency, in Hz, of each
+# timing mode
+timing_modes = {
+    "LCLS1": {"frame_rate": 360.0, "clock": 119e6},
+    "LCLS2": {"frame_rate": 1300e6 / 1400, "clock": 1300e6 / 7},
+}
+
+# The RxClkCount counter counts the recovered clock cycles divided by 16
+rx_clk_count_div = 16
+
+# Counters wrap around at 32 bits
+counter_mod = 2**32
 
 
 class TimingTester():
     """
     Test the RTM Timing inputs.
     """
-    def __init__(self, rtm):
+    def __init__(self, rtm, timeout=5.0, poll_interval=0.01,
+                 stable_samples=20, settle_time=0.1, quality_window=None,
+                 quality_samples=10, quality_tolerance=0.02,
+                 max_error_rate=0.0):
         """
         Initialize the object.
+
+        After setting each timing mode, the link status is polled every
+        'poll_interval' seconds. The link status can still be the one of
+        the previous mode for a while, so the polls only count once the
+        link has been seen down, or after 'settle_time' seconds. The link
+        is then considered locked once it is seen up on 'stable_samples'
+        consecutive polls, and the test fails if that does not happen
+        within 'timeout' seconds of the mode change.
+
+        If 'quality_window' is given, the link quality is then measured
+        during that many seconds, sampling the timing link counters
+        'quality_samples' times (see _check_quality()). The test fails if
+        the link goes down, if the frame rate or the recovered clock
+        frequency are off by more than 'quality_tolerance' (relative to
+        their nominal values), or if there are more than 'max_error_rate'
+        CRC, decode and disparity errors per second.
         """
         self.rtm = rtm
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.stable_samples = stable_samples
+        self.settle_time = settle_time
+        self.quality_window = quality_window
+        self.quality_samples = quality_samples
+        self.quality_tolerance = quality_tolerance
+        self.max_error_rate = max_error_rate
+
+        if quality_window is not None:
+            if quality_window <= 0:
+                raise RuntimeError(
+                    f"Invalid timing quality window {quality_window}")
+            if quality_samples < 1:
+                raise RuntimeError(
+                    f"Invalid number of timing quality samples "
+                    f"{quality_samples}")
+
+        # Measured time to lock of each mode, in seconds (None if the link
+        # did not lock)
+        self.lock_time = {}
+
+        # Measured link quality of each mode (see _check_quality())
+        self.quality = {}
 
     def run_tests(self):
         """
-        Run the tests.
+        Run the tests. Return True if the link came up in both modes.
         """
 
+        passed = True
+
         print("########################################")
         print("###    Start of Timing Tests         ###")
         print("########################################")
@@ -27,23 +86,184 @@ class TimingTester():
 
         print("Testing LCLS1 mode timing...  ", end="")
         self.rtm.setTimingLcls1mode()
-        time.sleep(2)
-        if self.rtm.checkTimingLink():
-            print_ok("PASS")
-        else:
-            print_failed("FAILED")
+        passed &= self._check_mode("LCLS1")
 
         # Set LCLS2 mode timing, and check if the link is up
         print("Testing LCLS2 mode timing...  ", end="")
         self.rtm.setTimingLcls2mode()
-        time.sleep(2)
-        if self.rtm.checkTimingLink():
-            print_ok("PASS")
-        else:
-            print_failed("FAILED")
+        passed &= self._check_mode("LCLS2")
 
         print("")
         print("########################################")
         print("###    End of Timing Tests           ###")
         print("########################################")
         print("")
+
+        return passed
+
+    def _check_mode(self, mode):
+        """
+        Check the timing link, after setting a timing mode: wait for it to
+        lock, and then measure its quality, if enabled. Return True if the
+        checks passed.
+        """
+
+        if not self._check_lock(mode):
+            return False
+
+        if self.quality_window is None:
+            return True
+
+        print(f"Measuring {mode} mode link quality...  ", end="")
+        return self._check_quality(mode)
+
+    def _check_lock(self, mode):
+        """
+        Wait for the timing link to lock, after setting a timing mode, and
+        print and record the time it took. Return True if it locked.
+        """
+
+        start = time.monotonic()
+
+        # Wait for the link of the previous mode to go down, so that it is
+        # not taken for the new one
+        poll_until(
+            condition=lambda: not self.rtm.checkTimingLink(),
+            timeout=self.settle_time,
+            poll_interval=self.poll_interval)
+
+        elapsed = time.monotonic() - start
+        t = poll_until(
+            condition=self.rtm.checkTimingLink,
+            timeout=max(self.timeout - elapsed, 0.0),
+            poll_interval=self.poll_interval,
+            stable_samples=self.stable_samples)
+
+        if t is not None:
+            t += elapsed
+
+        self.lock_time[mode] = t
+
+        if t is None:
+            print_failed("FAILED")
+            print(f"  Link not locked after {self.timeout} s")
+            return False
+
+        print_ok("PASS")
+        print(f"  Time to lock: {t:.3f} s")
+        return True
+
+    def _check_quality(self, mode):
+        """
+        Measure the timing link quality: clear the link counters, and
+        sample them, together with the link status, evenly over the quality
+        window. From the counter increments, compute the frame rate, the
+        error rates and the recovered clock frequency, and print and record
+        them. Return True if they are within limits.
+
+        The measurement stops early, with the counts measured so far, as
+        soon as the link goes down or the errors exceed the limit for the
+        whole window.
+        """
+
+        nominal = timing_modes[mode]
+        max_errors = self.max_error_rate * self.quality_window
+        interval = self.quality_window / self.quality_samples
+
+        self.rtm.clearTimingCounters()
+
+        # Each sample is timestamped in the middle of its register reads
+        samples = []
+        link_down = False
+        errors = 0
+        start = time.monotonic()
+        for i in range(self.quality_samples + 1):
+            delay = start + i * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            t = time.monotonic()
+            counters = self.rtm.getTimingCounters()
+            link_down = not self.rtm.checkTimingLink()
+            samples.append(((t + time.monotonic()) / 2, counters))
+
+            if i:
+                delta = self._deltas(samples[0][1], counters)
+                errors = delta["CrcErrCount"] + delta["RxDecErrCount"] + \
+                    delta["RxDspErrCount"]
+            if link_down or errors > max_errors:
+                break
+
+        if len(samples) < 2:
+            print_failed("FAILED")
+            print("  Link went down at the start of the measurement")
+            self.quality[mode] = None
+            return False
+
+        elapsed = samples[-1][0] - samples[0][0]
+        delta = self._deltas(samples[0][1], samples[-1][1])
+        frames = delta["sofCount"]
+
+        quality = {
+            "window": elapsed,
+            "frame_rate": frames / elapsed,
+            "clock_frequency":
+                delta["RxClkCount"] * rx_clk_count_div / elapsed,
+            "crc_errors": delta["CrcErrCount"],
+            "decode_errors": delta["RxDecErrCount"],
+            "disparity_errors": delta["RxDspErrCount"],
+            "incomplete_frames": abs(frames - delta["eofCount"]),
+            "error_rate": errors / elapsed,
+            "frame_error_rate": errors / frames if frames else None,
+        }
+        self.quality[mode] = quality
+
+        # Check the results
+        failures = []
+        if link_down:
+            failures.append("Link went down during the measurement")
+        for key, name, ref in [
+                ("frame_rate", "Frame rate", nominal["frame_rate"]),
+                ("clock_frequency", "Clock frequency", nominal["clock"])]:
+            if abs(quality[key] - ref) > self.quality_tolerance * ref:
+                failures.append(f"{name} off by more than "
+                                f"{self.quality_tolerance * 100:.1f} %")
+        # The end of frame counter is read a bit after the start of frame
+        # counter, so at high frame rates they differ by a few frames
+        if quality["incomplete_frames"] > 1 + self.quality_tolerance * frames:
+            failures.append("Start and end of frame counts do not match")
+        if errors > max_errors:
+            failures.append(f"Error rate above {self.max_error_rate} /s")
+
+        if failures:
+            print_failed("FAILED")
+            for f in failures:
+                print(f"  {f}")
+        else:
+            print_ok("PASS")
+
+        print(f"  Measurement window:    {elapsed:.3f} s")
+        print(f"  Frame rate:            {quality['frame_rate']:.1f} Hz "
+              f"(nominal {nominal['frame_rate']:.1f} Hz)")
+        print(f"  Clock frequency:       "
+              f"{quality['clock_frequency'] / 1e6:.3f} MHz "
+              f"(nominal {nominal['clock'] / 1e6:.3f} MHz)")
+        print(f"  CRC errors:            {quality['crc_errors']}")
+        print(f"  Decode errors:         {quality['decode_errors']}")
+        print(f"  Disparity errors:      {quality['disparity_errors']}")
+        print(f"  Error rate:            {quality['error_rate']:.3g} /s", end="")
+        if quality["frame_error_rate"] is not None:
+            print(f", {quality['frame_error_rate']:.3g} per frame")
+        else:
+            print("")
+
+        return not failures
+
+    @staticmethod
+    def _deltas(first, last):
+        """
+        Return the increments of the timing link counters between two
+        samples, taking the counters wrap around into account.
+        """
+
+        return {k: (last[k] - first[k]) % counter_mod for k in first}
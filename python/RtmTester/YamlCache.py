@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+import glob
+import hashlib
+import os
+import re
+import tempfile
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+# Version of the pruned file format. Change it to invalidate all the cached
+# files when the way they are generated changes.
+cache_format_version = 1
+
+# Default cache directory
+default_cache_dir = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "RtmTester")
+
+_map_tag = "tag:yaml.org,2002:map"
+_merge_tag = "tag:yaml.org,2002:merge"
+
+
+def get_pruned_yaml(yaml_file, root_name, paths, cache_dir=None):
+    """
+    Return the path to a YAML file containing only the root device and the
+    nodes in 'paths' (relative to the root device) from the CPSW hierarchy
+    defined in 'yaml_file'.
+
+    The pruned file is self-contained (no includes, anchors or merge keys),
+    and it is cached in 'cache_dir', keyed by a hash of the content of all
+    the YAML files in the directory of 'yaml_file', and of the list of
+    paths. So, any change in the firmware YAML files, or in the paths
+    used, generates a new file.
+    """
+
+    if yaml is None:
+        raise RuntimeError("PyYAML is not available")
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir
+
+    key = _hash(yaml_file, root_name, paths)
+    prefix = f"{root_name}-"
+    pruned_file = os.path.join(cache_dir, f"{prefix}{key}.yaml")
+
+    if os.path.isfile(pruned_file):
+        return pruned_file
+
+    try:
+        text = _prune(yaml_file, root_name, paths)
+    except yaml.YAMLError as e:
+        raise RuntimeError(f"Can not parse the YAML files: {e}")
+
+    # Write the file atomically, so a concurrent run never sees it partially
+    # written
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_file, pruned_file)
+
+    # Remove files generated from older versions of the YAML files
+    for f in glob.glob(os.path.join(cache_dir, f"{prefix}*.yaml")):
+        if f != pruned_file:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+    return pruned_file
+
+
+def _hash(yaml_file, root_name, paths):
+    """
+    Return the cache key: a hash of the content of all the YAML files in
+    the YAML directory, the root name and the paths.
+    """
+
+    h = hashlib.sha256()
+    h.update(f"{cache_format_version}\n{root_name}\n".encode())
+    for p in sorted(paths):
+        h.update(f"{p}\n".encode())
+
+    h.update(os.path.basename(yaml_file).encode())
+    yaml_dir = os.path.dirname(os.path.abspath(yaml_file))
+    for f in sorted(glob.glob(os.path.join(yaml_dir, "*.yaml"))):
+        h.update(os.path.basename(f).encode() + b"\0")
+        with open(f, "rb") as fh:
+            h.update(fh.read())
+        h.update(b"\0")
+
+    return h.hexdigest()[:16]
+
+
+def _preprocess(yaml_file, once=None):
+    """
+    Return the content of a YAML file, with its '#include' directives
+    expanded, honoring the '#once' directives, as the CPSW YAML
+    preprocessor does.
+    """
+
+    if once is None:
+        once = set()
+
+    yaml_dir = os.path.dirname(os.path.abspath(yaml_file))
+    lines = []
+
+    with open(yaml_file) as f:
+        for line in f:
+            m = re.match(r"#once\s+(\S+)", line)
+            if m:
+                if m.group(1) in once:
+                    return ""
+                once.add(m.group(1))
+                continue
+
+            m = re.match(r"#include\s+(\S+)", line)
+            if m:
+                lines.append(_preprocess(
+                    os.path.join(yaml_dir, m.group(1)), once))
+                continue
+
+            lines.append(line)
+
+    return "".join(lines) + "\n"
+
+
+if yaml is not None:
+    class _Loader(yaml.SafeLoader):
+        """
+        YAML loader allowing anchors to be redefined, as yaml-cpp (used by
+        CPSW) does. An alias refers to the latest definition of its anchor.
+        """
+
+        def compose_node(self, parent, index):
+            """
+            Forget the previous definition of an anchor being redefined.
+            """
+
+            event = self.peek_event()
+            if not isinstance(event, yaml.AliasEvent) and \
+                    event.anchor is not None:
+                self.anchors.pop(event.anchor, None)
+
+            return super().compose_node(parent, index)
+
+
+def _resolve(node):
+    """
+    Return a copy of a YAML node with all the merge keys resolved. As in
+    CPSW, the merge is recursive: when both the merged and the local values
+    of a key are maps, they are merged too.
+    """
+
+    if isinstance(node, yaml.ScalarNode):
+        return yaml.ScalarNode(node.tag, node.value, style=node.style)
+
+    if isinstance(node, yaml.SequenceNode):
+        return yaml.SequenceNode(node.tag, [_resolve(n) for n in node.value],
+                                 flow_style=node.flow_style)
+
+    merged = {}
+    local = {}
+    for k, v in node.value:
+        if k.tag == _merge_tag:
+            bases = v.value if isinstance(v, yaml.SequenceNode) else [v]
+            for b in bases:
+                merged = _merge(merged, _to_dict(_resolve(b)))
+        else:
+            local[k.value] = _resolve(v)
+
+    return _to_node(_merge(merged, local))
+
+
+def _to_dict(node):
+    """
+    Convert a resolved map node into a dictionary of nodes.
+    """
+
+    return {k.value: v for k, v in node.value}
+
+
+def _to_node(d):
+    """
+    Convert a dictionary of nodes into a map node.
+    """
+
+    return yaml.MappingNode(
+        _map_tag,
+        [(yaml.ScalarNode("tag:yaml.org,2002:str", k), v)
+         for k, v in d.items()])
+
+
+def _merge(base, override):
+    """
+    Merge two dictionaries of nodes, recursively merging the map values.
+    """
+
+    r = dict(base)
+    for k, v in override.items():
+        if k in r and isinstance(r[k], yaml.MappingNode) and \
+                isinstance(v, yaml.MappingNode):
+            r[k] = _to_node(_merge(_to_dict(r[k]), _to_dict(v)))
+        else:
+            r[k] = v
+
+    return r
+
+
+def _keep(node, paths):
+    """
+    Return a copy of a device node keeping only the children in 'paths',
+    given as lists of names.
+    """
+
+    d = _to_dict(node)
+
+    if "children" not in d:
+        return node
+
+    children = _to_dict(d["children"])
+
+    # Group the paths by their first element
+    wanted = {}
+    for p in paths:
+        wanted.setdefault(p[0], []).append(p[1:])
+
+    # Sequence commands refer to other children by name, so keep them too
+    for name in list(wanted):
+        child = children.get(name)
+        if child is None:
+            continue
+        seq = _to_dict(child).get("sequence")
+        if seq is None:
+            continue
+        for entry in seq.value:
+            e = _to_dict(entry).get("entry")
+            if e is not None and e.value in children:
+                wanted.setdefault(e.value, []).append([])
+
+    kept = {}
+    for name, rest in wanted.items():
+        if name not in children:
+            raise RuntimeError(f"Node '{name}' not found")
+
+        # Keep the whole node if it is the end of any path
+        if any(not r for r in rest):
+            kept[name] = children[name]
+        else:
+            kept[name] = _keep(children[name], rest)
+
+    d["children"] = _to_node(kept)
+
+    return _to_node(d)
+
+
+def _prune(yaml_file, root_name, paths):
+    """
+    Return the text of the pruned YAML hierarchy.
+    """
+
+    top = _resolve(yaml.compose(_preprocess(yaml_file), Loader=_Loader))
+
+    root = _to_dict(top).get(root_name)
+    if root is None:
+        raise RuntimeError(f"Root device '{root_name}' not found")
+
+    # Split the paths, removing array indexes, as all the elements of an
+    # array are defined by the same node
+    split_paths = [[re.sub(r"\[.*\]$", "", e) for e in p.split("/")]
+                   for p in paths]
+
+    pruned = _to_node({root_name: _keep(root, split_paths)})
+
+    return "#schemaversion 3.0.0\n" + \
+        f"# Generated from {os.path.basename(yaml_file)}. Do not edit.\n" + \
+        yaml.serialize(pruned)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from RtmTester.Benchmark import Benchmark
+from RtmTester.IOTester import AutomaticIOTester
+from RtmTester.Session import add_rtm_arguments, check_rtm_args, create_rtm
+
+
+def get_args():
+    """
+    Parse and return the inputs arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='LCLS2 MPS RTM Tester Benchmark')
+
+    add_rtm_arguments(parser)
+
+    parser.add_argument(
+        '--samples',
+        type=int,
+        default=1000,
+        help='Number of times each command type is timed (default = 1000)')
+
+    parser.add_argument(
+        '--vectors',
+        type=int,
+        default=4096,
+        help='Number of vectors used to measure the throughput in each '
+             'direction (default = 4096)')
+
+    parser.add_argument(
+        '--board-runs',
+        type=int,
+        default=3,
+        dest='board_runs',
+        help='Number of full board test runs (default = 3)')
+
+    parser.add_argument(
+        '--output',
+        type=str,
+        help='Write the results to this JSON file')
+
+    args = parser.parse_args()
+    check_rtm_args(parser, args)
+
+    return args
+
+
+if __name__ == '__main__':
+    # Get input arguments
+    args = get_args()
+
+    # Create the RTM (and the tester device, when simulating)
+    rtm, tester_device = create_rtm(args)
+
+    io_tester = AutomaticIOTester(
+        rtm=rtm,
+        ip_addr=args.tester_ip,
+        port_number=args.tester_port,
+        ping=not args.simulate)
+
+    print("Starting benchmark...")
+
+    benchmark = Benchmark(
+        io_tester=io_tester,
+        samples=args.samples,
+        vectors=args.vectors,
+        board_runs=args.board_runs,
+        backend="simulated" if args.simulate else "hardware")
+    benchmark.run()
+    benchmark.print_results()
+
+    if args.output:
+        benchmark.write_results(args.output)
+        print(f"Results written to {args.output}")
+
+    if tester_device is not None:
+        tester_device.stop()
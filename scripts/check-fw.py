@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+from RtmTester.Crate import ShelfManager
+from RtmTester.FirmwareCheck import FirmwareChecker
+from RtmTester.Helpers import print_ok, print_failed
+from RtmTester.Runner import fw_top_dir, read_fw_versions, remote_command
+
+
+def slot(spec):
+    """
+    Parse a 'shelfmanager:slot' argument.
+    """
+    try:
+        shelfmanager, n = spec.split(':')
+        n = int(n)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid slot '{spec}'")
+
+    if not 2 <= n <= 7:
+        raise argparse.ArgumentTypeError(
+            f"Invalid slot number {n}! Must be a number between 2 and 7.")
+
+    return shelfmanager, n
+
+
+def get_args():
+    """
+    Parse and return the inputs arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Check that the FPGA firmware matches the MCS file, and '
+                    'load it if not')
+
+    parser.add_argument(
+        'slots',
+        type=slot,
+        nargs='+',
+        metavar='shelfmanager:slot',
+        help='ATCA shelfmanager node name or IP address, and crate slot '
+             'number (2 to 7)')
+
+    parser.add_argument(
+        '--cpu',
+        type=str,
+        required=True,
+        dest='cpu_name',
+        help='CPU node name, connected to the ATCA crates')
+
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=6,
+        help='Maximum number of FPGAs loaded at the same time (default = 6)')
+
+    parser.add_argument(
+        '--refresh-cache',
+        action='store_true',
+        dest='refresh_cache',
+        help='Read the firmware versions again, instead of using the '
+             'cached values')
+
+    parser.add_argument(
+        '--ipmi-only',
+        action='store_true',
+        dest='ipmi_only',
+        help='Read the firmware versions via IPMI only, instead of reading '
+             'them directly from the FPGAs, via CPSW, in the CPU node')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # Get input arguments
+    args = get_args()
+
+    # The firmware versions are read directly from the FPGAs, via CPSW in
+    # the CPU node, and via IPMI only for the FPGAs which can not be reached
+    fw_reader = None
+    if not args.ipmi_only:
+        fw_reader = lambda ips: read_fw_versions(  # noqa: E731
+            lambda c: remote_command(args.cpu_name, c), ips)
+
+    checker = FirmwareChecker(
+        args.cpu_name, fw_top_dir, jobs=args.jobs, fw_reader=fw_reader)
+
+    try:
+        print("Looking for mcs file...                           ", end="")
+        mcs_file, mcs_githash = checker.getMcsFile()
+        print_ok(f"Mcs file found: {os.path.basename(mcs_file)}, "
+                 f"githash: '{mcs_githash}'")
+
+        githashes = {}
+        if fw_reader is not None:
+            slots = []
+            for shelfmanager, n in args.slots:
+                crate_id = checker.getCrateId(
+                    shelfmanager, n, refresh=args.refresh_cache)
+                slots.append(
+                    (shelfmanager, n, ShelfManager.getFpgaIp(crate_id, n)))
+
+            githashes = checker.readGitHashesFW(
+                slots, refresh=args.refresh_cache)
+
+        mismatched = []
+        for shelfmanager, n in args.slots:
+            print(f"Reading FW Git Hash of {shelfmanager}:{n}...", end="")
+            fw_githash = githashes.get((shelfmanager, n))
+            if fw_githash is None:
+                fw_githash = checker.getGitHashFW(
+                    shelfmanager, n, refresh=args.refresh_cache)
+            print_ok(f" Firmware githash: '{fw_githash}'. ", end="")
+
+            if fw_githash == mcs_githash:
+                print_ok("They match!.")
+            else:
+                print_failed("They don't match.")
+                mismatched.append((shelfmanager, n))
+
+    except RuntimeError as e:
+        print_failed(f"ERROR: {e}")
+        sys.exit(1)
+
+    if mismatched:
+        print(f"Loading image in {len(mismatched)} FPGA(s)...")
+        results = checker.program(
+            mismatched, mcs_file, mcs_githash,
+            logs={s: sys.stdout for s in mismatched})
+
+        for (shelfmanager, n), ok in results.items():
+            print(f"{shelfmanager}:{n}: ", end="")
+            if ok:
+                print_ok("Image loaded.")
+            else:
+                print_failed("Failed to load the image!")
+
+        if not all(results.values()):
+            sys.exit(1)
+
+    sys.exit(0)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import argparse
+import concurrent.futures
+import json
+import sys
+
+from RtmTester.Rtm import Rtm
+
+
+def get_args():
+    """
+    Parse and return the inputs arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='Read the version of the firmware loaded in FPGAs '
+                    'directly, via CPSW, and print it as one JSON line per '
+                    'FPGA. It runs in the CPU node.')
+
+    parser.add_argument(
+        'fpga_ips',
+        type=str,
+        nargs='+',
+        metavar='fpga_ip',
+        help='FPGA IP address')
+
+    parser.add_argument(
+        '--yaml',
+        type=str,
+        required=True,
+        dest='yaml_file',
+        help='Path to the top level YAML file (000TopLevel.yaml)')
+
+    parser.add_argument(
+        '--root-name',
+        type=str,
+        default='NetIODev',
+        dest='root_name',
+        help='RTM CPSW root device name (default = "NetIODev")')
+
+    parser.add_argument(
+        '--mcs-file',
+        type=str,
+        dest='mcs_file',
+        help='Compare the firmware with this MCS file, and exit with 1 if '
+             'any FPGA does not match, or can not be reached')
+
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=6,
+        help='Maximum number of FPGAs read at the same time (default = 6)')
+
+    return parser.parse_args()
+
+
+def read_version(args, fpga_ip):
+    """
+    Read the firmware version of an FPGA. Return a dictionary with the
+    FPGA IP address and its firmware version, or the error message if it
+    can not be reached.
+    """
+
+    try:
+        rtm = Rtm(
+            yaml_file=args.yaml_file,
+            ip_addr=fpga_ip,
+            root_name=args.root_name)
+
+        if args.mcs_file:
+            match, version = rtm.checkFirmwareVersion(args.mcs_file)
+            version["match"] = match
+        else:
+            version = rtm.getFirmwareVersion()
+
+    except Exception as e:
+        # Any CPSW error means that the FPGA can not be reached
+        return {"ip": fpga_ip, "error": str(e)}
+
+    return {"ip": fpga_ip, **version}
+
+
+if __name__ == '__main__':
+    # Get input arguments
+    args = get_args()
+
+    # The JSON lines are the only output. The progress messages go to the
+    # standard error.
+    output = sys.stdout
+    sys.stdout = sys.stderr
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=args.jobs) as executor:
+        results = list(executor.map(
+            lambda ip: read_version(args, ip), args.fpga_ips))
+
+    for r in results:
+        output.write(json.dumps(r) + "\n")
+
+    if args.mcs_file and not all(r.get("match") for r in results):
+        sys.exit(1)
+
+    sys.exit(0)
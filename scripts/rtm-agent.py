@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import argparse
+import signal
+import sys
+
+from RtmTester.Agent import AgentClient, RtmAgent
+
+
+def get_args():
+    """
+    Parse and return the inputs arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='LCLS2 MPS RTM Test Agent. It runs in the CPU node, '
+                    'keeping the FPGA connections open, and runs test jobs '
+                    'with the same arguments as test-rtm.py')
+
+    mode = parser.add_mutually_exclusive_group(required=True)
+
+    mode.add_argument(
+        '--socket',
+        type=str,
+        help='Accept jobs on this local socket')
+
+    mode.add_argument(
+        '--stdin',
+        action='store_true',
+        help='Accept jobs on the standard input, and reply on the standard '
+             'output')
+
+    mode.add_argument(
+        '--submit',
+        type=str,
+        metavar='SOCKET',
+        help='Run a job in the agent listening on this local socket, with '
+             'the test-rtm.py arguments following "--", and exit with its '
+             'exit code')
+
+    parser.add_argument(
+        '--pool-size',
+        type=int,
+        default=8,
+        dest='pool_size',
+        help='Maximum number of FPGA connections kept open (default = 8)')
+
+    parser.add_argument(
+        '--idle-timeout',
+        type=float,
+        default=600.0,
+        dest='idle_timeout',
+        help='Close the FPGA connections not used for this many seconds '
+             '(default = 600.0)')
+
+    argv = sys.argv[1:]
+    test_args = []
+    if '--' in argv:
+        i = argv.index('--')
+        argv, test_args = argv[:i], argv[i + 1:]
+
+    args = parser.parse_args(argv)
+    args.test_args = test_args
+
+    return args
+
+
+if __name__ == '__main__':
+    # Get input arguments
+    args = get_args()
+
+    if args.submit:
+        try:
+            client = AgentClient.connect(args.submit)
+        except OSError as e:
+            print(f"ERROR: Can not connect to the agent: {e}")
+            sys.exit(1)
+
+        try:
+            code = client.run(args.test_args, sys.stdout)
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            code = 1
+        client.close()
+
+        sys.exit(code)
+
+    # In stdin mode, the standard output carries the replies, so the agent
+    # messages go to the standard error
+    replies = sys.stdout.buffer
+    agent = RtmAgent(
+        log=sys.stderr if args.stdin else sys.stdout,
+        pool_size=args.pool_size,
+        idle_timeout=args.idle_timeout)
+    agent.preload()
+    agent.install()
+
+    # Exit cleanly (removing the socket file) when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if args.stdin:
+        agent.serve_stream(sys.stdin.buffer, replies)
+    else:
+        try:
+            agent.serve_socket(args.socket)
+        except RuntimeError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            pass
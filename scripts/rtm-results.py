@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import time
+
+from RtmTester.Results import ResultStore
+
+
+def get_args():
+    """
+    Parse and return the inputs arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='LCLS2 MPS RTM Test Results Query')
+
+    parser.add_argument(
+        'results_db',
+        type=str,
+        help='SQLite database file written by test-rtm.py --results-db')
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    history = subparsers.add_parser(
+        'history',
+        help='Show the test runs of a board')
+    history.add_argument(
+        '--rtm-serial',
+        type=str,
+        dest='rtm_serial',
+        help='RTM board serial number')
+    history.add_argument(
+        '--crate-id',
+        type=str,
+        dest='crate_id',
+        help='Crate ID')
+    history.add_argument(
+        '--slot',
+        type=int,
+        help='Crate slot number')
+    history.add_argument(
+        '--limit',
+        type=int,
+        default=20,
+        help='Maximum number of runs shown (default = 20)')
+
+    failure_rate = subparsers.add_parser(
+        'failure-rate',
+        help='Show the failure rate of each channel')
+    failure_rate.add_argument(
+        '--direction',
+        choices=['input', 'output'],
+        default='input',
+        help='Channel direction (default = "input")')
+    failure_rate.add_argument(
+        '--channel',
+        type=int,
+        help='Show only this channel')
+    failure_rate.add_argument(
+        '--days',
+        type=float,
+        help='Count only the runs of the last DAYS days')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    # Get input arguments
+    args = get_args()
+
+    store = ResultStore(args.results_db)
+
+    if args.command == 'history':
+        runs = store.board_history(
+            rtm_serial=args.rtm_serial,
+            crate_id=args.crate_id,
+            slot=args.slot,
+            limit=args.limit)
+
+        print("-" * 79)
+        print(f"{'Run':6} | {'Start time':19} | {'Crate':5} | {'Slot':4} | "
+              f"{'FW':8} | {'Serial':12} | Status")
+        print("-" * 79)
+        for r in runs:
+            start = time.strftime("%Y-%m-%d %H:%M:%S",
+                                  time.localtime(r['start_time']))
+            print(f"{r['id']:6} | {start:19} | {r['crate_id'] or '':5} | "
+                  f"{r['slot'] or '':4} | {r['fw_githash'] or '':8} | "
+                  f"{r['rtm_serial'] or '':12} | {r['status']}")
+        print("-" * 79)
+
+    else:
+        since = None
+        if args.days is not None:
+            since = time.time() - args.days * 86400
+
+        rows = store.channel_failure_rate(
+            direction=args.direction,
+            channel=args.channel,
+            since=since)
+
+        print("-" * 40)
+        print("Channel | Runs     | Failed   | Rate")
+        print("-" * 40)
+        for r in rows:
+            print(f"   {r['channel']:02}   | {r['runs']:8} | "
+                  f"{r['failed']:8} | {r['rate'] * 100:6.2f}%")
+        print("-" * 40)
+
+    store.close()
+    sys.exit(0)
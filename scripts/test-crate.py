@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+
+from RtmTester.Runner import Runner, Target
+
+
+def target(spec):
+    """
+    Parse a target argument.
+    """
+    try:
+        return Target.parse(spec)
+    except RuntimeError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def get_args():
+    """
+    Parse and return the inputs arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description='LCLS2 MPS RTM Parallel Test Application',
+        epilog='Arguments after "--" are passed to the test application '
+               '(test-rtm.py) of each target.')
+
+    parser.add_argument(
+        'targets',
+        type=target,
+        nargs='+',
+        metavar='shelfmanager:slot[:tester_ip[:tester_port]][/rtm_serial]',
+        help='RTM boards to test: ATCA shelfmanager node name or IP address, '
+             'crate slot number (2 to 7), and optionally the tester device '
+             'IP address and port number, and the RTM serial number')
+
+    parser.add_argument(
+        '--cpu',
+        type=str,
+        required=True,
+        dest='cpu_name',
+        help='CPU node name, connected to the ATCA crates')
+
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=6,
+        help='Maximum number of targets tested at the same time '
+             '(default = 6)')
+
+    parser.add_argument(
+        '--report-dir',
+        type=str,
+        default=None,
+        dest='report_dir',
+        help='Directory where the logs and report are written (default = '
+             '"rtm-test-<date>-<time>")')
+
+    parser.add_argument(
+        '--no-check-fw',
+        action='store_false',
+        dest='check_fw',
+        help='Disable FPGA version checking')
+
+    parser.add_argument(
+        '--refresh-cache',
+        action='store_true',
+        dest='refresh_cache',
+        help='Read the crate IDs and firmware versions via IPMI, instead of '
+             'using the cached values')
+
+    parser.add_argument(
+        '--results-db',
+        type=str,
+        dest='results_db',
+        help='Record the results of all the targets in this SQLite database '
+             'file, in the CPU node')
+
+    parser.add_argument(
+        '--agent',
+        action='store_true',
+        help='Test all the targets with a single test agent in the CPU node '
+             '(see rtm-agent.py), instead of starting the test application '
+             'for each one')
+
+    argv = sys.argv[1:]
+    test_args = []
+    if '--' in argv:
+        i = argv.index('--')
+        argv, test_args = argv[:i], argv[i + 1:]
+
+    args = parser.parse_args(argv)
+    args.test_args = test_args
+
+    return args
+
+
+if __name__ == '__main__':
+    # Get input arguments
+    args = get_args()
+
+    runner = Runner(
+        cpu_name=args.cpu_name,
+        targets=args.targets,
+        jobs=args.jobs,
+        report_dir=args.report_dir,
+        check_fw=args.check_fw,
+        test_args=args.test_args,
+        results_db=args.results_db,
+        refresh_cache=args.refresh_cache,
+        agent=args.agent)
+
+    try:
+        passed = runner.run()
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        passed = False
+
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,7 @@
+#!/usr/bin/env bash
+
+# TOP directory
+top_dir=$(dirname -- "$(readlink -f $0)")
+
+# Test several RTM boards in parallel. See 'test-crate.sh --help'.
+PYTHONPATH=${top_dir}/python/:${PYTHONPATH} python3 ${top_dir}/scripts/test-crate.py "$@"